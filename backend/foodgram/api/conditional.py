@@ -0,0 +1,81 @@
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+
+from recipes.models import CatalogVersion, Recipe
+from recipes.user_state import get_user_state
+
+
+def get_catalog_versions(request):
+    """Версии справочников, из кэша один раз на весь HTTP-запрос."""
+    if not hasattr(request, '_catalog_versions'):
+        request._catalog_versions = CatalogVersion.objects.get_cached()
+    return request._catalog_versions
+
+
+def catalog_condition(name):
+    """Условный GET для справочника по его счётчику версий."""
+
+    def etag(request, *args, **kwargs):
+        version = get_catalog_versions(request).get(name)
+        if version is None:
+            return None
+        return f'W/"{name}-{version.version}"'
+
+    def last_modified(request, *args, **kwargs):
+        version = get_catalog_versions(request).get(name)
+        return version.updated_at if version else None
+
+    return method_decorator(condition(etag_func=etag,
+                                      last_modified_func=last_modified))
+
+
+def get_recipe_state(request, pk):
+    if not hasattr(request, '_recipe_state'):
+        state = Recipe.objects.filter(pk=pk).values_list(
+            'updated_at', 'author__updated_at', 'author').first()
+        if state is not None and request.user.is_authenticated:
+            updated_at, author_updated_at, author = state
+            user_state = get_user_state(request)
+            state = (updated_at, author_updated_at,
+                     int(pk) in user_state.favorites,
+                     int(pk) in user_state.cart,
+                     author in user_state.following)
+        elif state is not None:
+            state = state[:2]
+        request._recipe_state = state
+    return request._recipe_state
+
+
+def recipe_etag(request, pk=None, *args, **kwargs):
+    state = get_recipe_state(request, pk)
+    if state is None:
+        return None
+    versions = get_catalog_versions(request)
+    catalogs = '-'.join(
+        str(versions[name].version) if name in versions else '0'
+        for name in (CatalogVersion.TAGS, CatalogVersion.INGREDIENTS)
+    )
+    updated_at, author_updated_at, *flags = state
+    user_part = ''
+    if request.user.is_authenticated:
+        user_part = '-{}-{}'.format(
+            request.user.pk, ''.join(str(int(flag)) for flag in flags))
+    return (f'W/"recipe-{pk}-{updated_at.timestamp()}-'
+            f'{author_updated_at.timestamp()}-{catalogs}{user_part}"')
+
+
+def recipe_last_modified(request, pk=None, *args, **kwargs):
+    if request.user.is_authenticated:
+        return None
+    state = get_recipe_state(request, pk)
+    if state is None:
+        return None
+    dates = list(state[:2]) + [
+        version.updated_at
+        for version in get_catalog_versions(request).values()
+    ]
+    return max(dates)
+
+
+recipe_condition = method_decorator(condition(
+    etag_func=recipe_etag, last_modified_func=recipe_last_modified))
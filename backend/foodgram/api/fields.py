@@ -0,0 +1,79 @@
+import base64
+import binascii
+import warnings
+from io import BytesIO
+
+from django.conf import settings
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image, UnidentifiedImageError
+
+from recipes.images import IMAGE_FORMATS, get_variant_url
+
+
+class ThumbnailImageField(Base64ImageField):
+    """Принимает изображение в base64, отдаёт ссылку на его уменьшенную копию.
+
+    Размер задаётся аргументом variant, представление может заменить его
+    через ключ image_variant в контексте сериализатора. Копии строятся
+    при обработке изображения, поле только читает Recipe.image_variants.
+    """
+
+    def __init__(self, *args, variant, **kwargs):
+        self.variant = variant
+        super().__init__(*args, **kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        variant = self.context.get('image_variant', self.variant)
+        url = get_variant_url(value, variant)
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+
+class DeferredImageField(ThumbnailImageField):
+    """Принимает изображение в base64 без полной обработки Pillow.
+
+    Проверяются только кодировка, размер, заголовок файла и число пикселей
+    против Image.MAX_IMAGE_PIXELS. Возвращаются
+    сырые байты: декодирование и запись выполняет обработчик очереди
+    изображений.
+    """
+    default_error_messages = {
+        'invalid_image': 'Загрузите корректное изображение.',
+        'max_size': 'Размер изображения не должен превышать {max_size} байт.',
+        'max_pixels': ('Изображение не должно быть больше '
+                       '{max_pixels} пикселей.'),
+    }
+
+    def to_internal_value(self, data):
+        if data in self.EMPTY_VALUES:
+            return None
+        if not isinstance(data, str):
+            self.fail('invalid_image')
+        if ';base64,' in data:
+            data = data.split(';base64,', 1)[1]
+        try:
+            decoded = base64.b64decode(data)
+        except (binascii.Error, ValueError):
+            self.fail('invalid_image')
+        max_size = settings.RECIPE_IMAGE_MAX_SIZE
+        if len(decoded) > max_size:
+            self.fail('max_size', max_size=max_size)
+        if self.get_image_format(decoded) not in IMAGE_FORMATS:
+            self.fail('invalid_image')
+        return decoded
+
+    def get_image_format(self, decoded):
+        try:
+            with warnings.catch_warnings():
+                # Pillow только предупреждает, пока пикселей меньше
+                # двойного MAX_IMAGE_PIXELS, обработчику очереди это поздно.
+                warnings.simplefilter('error', Image.DecompressionBombWarning)
+                return Image.open(BytesIO(decoded)).format
+        except (Image.DecompressionBombError, Image.DecompressionBombWarning):
+            self.fail('max_pixels', max_pixels=Image.MAX_IMAGE_PIXELS)
+        except (UnidentifiedImageError, OSError):
+            self.fail('invalid_image')
@@ -0,0 +1,223 @@
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.test.utils import (CaptureQueriesContext, override_settings,
+                               setup_test_environment,
+                               teardown_test_environment)
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, Tag
+from recipes.synthetic import SyntheticDataset
+from users.models import User
+
+LOCAL_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark',
+    }
+}
+
+
+def get_routes(user):
+    """Маршруты api/urls.py с параметрами из сгенерированных данных."""
+    recipe = Recipe.objects.order_by('-favorites_count', 'pk').first()
+    author = User.objects.order_by('-followers_count', 'pk').first()
+    tags = list(Tag.objects.order_by('pk').values_list('slug', flat=True))
+    ingredient = Ingredient.objects.order_by('pk').first()
+    pantry = ','.join(str(pk) for pk in recipe.ingredient_list.values_list(
+        'ingredient', flat=True)[:3])
+    word = recipe.name.split()[0].lower()
+    recipes = '/api/recipes/?limit=6'
+    return (
+        ('recipe-list', recipes, True),
+        ('recipe-list-anonymous', recipes, False),
+        ('recipe-list-tags', f'{recipes}&tags={tags[0]}&tags={tags[1]}', True),
+        ('recipe-list-author', f'{recipes}&author={author.pk}', True),
+        ('recipe-list-favorited', f'{recipes}&is_favorited=1', True),
+        ('recipe-list-in-cart', f'{recipes}&is_in_shopping_cart=1', True),
+        ('recipe-list-search', f'{recipes}&search={word}', True),
+        ('recipe-list-popular', f'{recipes}&ordering=popular', True),
+        ('recipe-list-cursor', f'{recipes}&cursor=', True),
+        ('recipe-detail', f'/api/recipes/{recipe.pk}/', True),
+        ('recipe-detail-anonymous', f'/api/recipes/{recipe.pk}/', False),
+        ('recipe-feed', '/api/recipes/feed/?limit=6', True),
+        ('recipe-similar', f'/api/recipes/{recipe.pk}/similar/?limit=6',
+         True),
+        ('recipe-pantry', f'/api/recipes/pantry/?ingredients={pantry}', True),
+        ('subscriptions', '/api/users/subscriptions/?limit=6&recipes_limit=3',
+         True),
+        ('shopping-list-txt',
+         '/api/recipes/download_shopping_cart/?format=txt', True),
+        ('shopping-list-csv',
+         '/api/recipes/download_shopping_cart/?format=csv', True),
+        ('shopping-list-pdf',
+         '/api/recipes/download_shopping_cart/?format=pdf', True),
+        ('ingredient-search',
+         f'/api/ingredients/?name={ingredient.name[:3]}', True),
+        ('tags', '/api/tags/', True),
+        ('users', '/api/users/?limit=6', True),
+        ('user-me', '/api/users/me/', True),
+    )
+
+
+def request(client, path):
+    response = client.get(path)
+    if response.streaming:
+        size = sum(len(chunk) for chunk in response.streaming_content)
+    else:
+        size = len(response.content)
+    return response, size
+
+
+def measure(client, path, repeat):
+    """Задержка, число запросов к БД и пик выделенной памяти для маршрута.
+
+    Первый запрос прогревает кэши и измеряется отдельно. Память считается
+    в отдельном проходе, чтобы tracemalloc не искажал задержку. Журнал
+    запросов очищается сигналом request_started, поэтому он очищается
+    перед каждым замером, а число запросов считывается сразу после него.
+    """
+    reset_queries()
+    start = time.perf_counter()
+    with CaptureQueriesContext(connection) as first:
+        response, size = request(client, path)
+    first_ms = (time.perf_counter() - start) * 1000
+    first_queries = len(first)
+    timings = []
+    for _ in range(repeat):
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            request(client, path)
+            timings.append((time.perf_counter() - start) * 1000)
+    query_count = len(queries)
+    tracemalloc.start()
+    request(client, path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    timings.sort()
+    return {
+        'status': response.status_code,
+        'bytes': size,
+        'first_ms': round(first_ms, 3),
+        'first_queries': first_queries,
+        'median_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(
+            timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+        'queries': query_count,
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+def compare(results, baseline, tolerance):
+    problems = []
+    for name, old in baseline['routes'].items():
+        new = results['routes'].get(name)
+        if new is None:
+            continue
+        if new['queries'] > old['queries']:
+            problems.append(
+                f'{name}: запросов {old["queries"]} -> {new["queries"]}')
+        if new['median_ms'] > old['median_ms'] * (1 + tolerance):
+            problems.append(
+                f'{name}: медиана {old["median_ms"]} -> '
+                f'{new["median_ms"]} мс')
+    return problems
+
+
+class Command(BaseCommand):
+    help = ('Заполняет тестовую базу синтетическими данными и измеряет '
+            'задержку, число запросов и память для маршрутов API.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--recipes', type=int, default=2000)
+        parser.add_argument('--follows', type=int, default=10,
+                            help='Подписок на пользователя.')
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='Рецептов в избранном у пользователя.')
+        parser.add_argument('--carts', type=int, default=5,
+                            help='Рецептов в корзине у пользователя.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Сколько раз запросить каждый маршрут.')
+        parser.add_argument('--route', action='append',
+                            help='Измерить только эти маршруты.')
+        parser.add_argument('--output', help='Файл для результатов в JSON.')
+        parser.add_argument('--baseline',
+                            help='JSON прошлого запуска для сравнения.')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2,
+            help='Допустимый рост медианы относительно baseline.')
+        parser.add_argument(
+            '--keepdb', action='store_true',
+            help='Не удалять тестовую базу и не заполнять её повторно.')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat должен быть не меньше 1.')
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False,
+            keepdb=options['keepdb'])
+        try:
+            with override_settings(CACHES=LOCAL_CACHES):
+                results = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as file:
+                problems = compare(results, json.load(file),
+                                   options['tolerance'])
+            if problems:
+                raise CommandError('Регрессии: ' + '; '.join(problems))
+
+    def run(self, options):
+        if not Recipe.objects.exists():
+            start = time.perf_counter()
+            SyntheticDataset(
+                users=options['users'], recipes=options['recipes'],
+                follows=options['follows'], favorites=options['favorites'],
+                carts=options['carts'], seed=options['seed'],
+                log=self.stdout.write
+            ).generate()
+            self.stdout.write(
+                f'Данные созданы за {time.perf_counter() - start:.1f} с')
+        user = User.objects.order_by('pk').first()
+        clients = {False: APIClient(), True: APIClient()}
+        clients[True].force_authenticate(user)
+        results = {
+            'meta': {
+                'vendor': connection.vendor,
+                'django': django.get_version(),
+                'python': platform.python_version(),
+                'repeat': options['repeat'],
+                'seed': options['seed'],
+                'recipes': Recipe.objects.count(),
+                'users': User.objects.count(),
+            },
+            'routes': {},
+        }
+        for name, path, authenticated in get_routes(user):
+            if options['route'] and name not in options['route']:
+                continue
+            result = measure(clients[authenticated], path, options['repeat'])
+            results['routes'][name] = result
+            self.stdout.write(
+                f'{name}: {result["status"]}, '
+                f'медиана {result["median_ms"]} мс, '
+                f'p95 {result["p95_ms"]} мс, '
+                f'запросов {result["queries"]}, '
+                f'память {result["peak_memory_kb"]} КБ')
+        return results
@@ -0,0 +1,29 @@
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from api.response_cache import HITS_KEY, MISSES_KEY, get_stats
+
+
+class Command(BaseCommand):
+    help = 'Показывает попадания и промахи кэша ответов для анонимных.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Обнулить счётчики после вывода.')
+
+    def handle(self, *args, **options):
+        if isinstance(caches['default'], LocMemCache):
+            self.stderr.write(
+                'LocMemCache хранит счётчики в памяти каждого процесса, '
+                'команда не видит счётчики веб-сервера. Настройте общий '
+                'кэш через CACHE_BACKEND.')
+        stats = get_stats()
+        total = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / total if total else 0
+        self.stdout.write(
+            f'Попаданий: {stats["hits"]}, промахов: {stats["misses"]}, '
+            f'доля попаданий: {ratio:.1%}')
+        if options['reset']:
+            cache.delete_many((HITS_KEY, MISSES_KEY))
@@ -0,0 +1,373 @@
+import atexit
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+
+from foodgram.postgresql_pool import get_stats as get_pool_stats
+
+from .response_cache import get_stats
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+METHODS = ('GET', 'HEAD', 'OPTIONS', 'POST', 'PUT', 'PATCH', 'DELETE')
+UNMATCHED = 'unmatched'
+ARCHIVE_NAME = 'archive.json'
+LOCK_NAME = '.lock'
+POOL_GAUGES = (
+    ('size', 'Открытые соединения пула.'),
+    ('idle', 'Свободные соединения пула.'),
+    ('in_use', 'Выданные соединения пула.'),
+    ('max_size', 'Наибольший размер пула.'),
+)
+POOL_COUNTERS = (
+    ('checkouts', 'Выдачи соединений из пула.'),
+    ('opened', 'Новые соединения пула.'),
+    ('expired', 'Соединения, закрытые по сроку жизни.'),
+    ('unhealthy', 'Разорванные соединения и соединения в транзакции.'),
+    ('timeouts', 'Отказы после ожидания свободного соединения.'),
+    ('wait_seconds', 'Время ожидания свободного соединения.'),
+)
+STAGES = (
+    ('db', 'Время SQL-запросов.'),
+    ('serialize', 'Время сериализации без SQL-запросов.'),
+    ('view', 'Время представления: выборка и сериализация.'),
+    ('render', 'Время рендеринга ответа.'),
+)
+
+current_timings = ContextVar('current_timings', default=None)
+
+
+class RequestTimings:
+    """Число и время SQL-запросов, представление и рендеринг одного запроса.
+
+    Время представления считается от вызова view до возврата ответа,
+    то есть включает его SQL-запросы и сериализацию, но не рендеринг.
+    Сериализация учитывается отдельно функцией serialize без запросов,
+    которые она выполнила.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.duration = None
+        self.queries = 0
+        self.db = 0.0
+        self.serialize = 0.0
+        self.view = 0.0
+        self.render = 0.0
+        self.view_start = None
+        self.render_start = None
+
+    def execute(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - start
+            self.queries += 1
+
+    def start_view(self):
+        self.view_start = time.perf_counter()
+
+    def finish_view(self):
+        if self.view_start is not None:
+            self.view = time.perf_counter() - self.view_start
+            self.view_start = None
+
+    def start_render(self):
+        self.render_start = time.perf_counter()
+
+    def finish_render(self, response):
+        self.render += time.perf_counter() - self.render_start
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.start
+
+    def get_header(self):
+        return ', '.join((
+            f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries"',
+            f'serialize;dur={self.serialize * 1000:.1f}',
+            f'view;dur={self.view * 1000:.1f}',
+            f'render;dur={self.render * 1000:.1f}',
+            f'total;dur={self.duration * 1000:.1f}',
+        ))
+
+    def capture_queries(self):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self.execute))
+        return stack
+
+
+def serialize(serializer):
+    """serializer.data со временем в стадии serialize текущего запроса."""
+    timings = current_timings.get()
+    if timings is None:
+        return serializer.data
+    start, db = time.perf_counter(), timings.db
+    try:
+        return serializer.data
+    finally:
+        timings.serialize += (
+            time.perf_counter() - start - (timings.db - db))
+
+
+class MetricsStore:
+    """Гистограммы задержек по маршрутам.
+
+    Каждый процесс копит значения в памяти и раз в METRICS_FLUSH_INTERVAL
+    секунд записывает снимок в собственный файл в METRICS_DIR. Эндпоинт
+    метрик суммирует файлы всех процессов, поэтому видит все воркеры
+    gunicorn без общего кэша. Снимки завершившихся процессов при чтении
+    переносятся в общий архив и удаляются: счётчики не уменьшаются,
+    а число файлов не растёт с каждым перезапуском воркеров.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = None
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.path = Path(settings.METRICS_DIR) / (
+            f'{self.pid}-{uuid.uuid4().hex}.json')
+        self.routes = {}
+        self.flushed = time.monotonic()
+
+    def observe(self, route, method, timings):
+        buckets = settings.METRICS_BUCKETS
+        with self.lock:
+            if self.pid != os.getpid():
+                self.reset()
+            key = f'{route} {method}'
+            stats = self.routes.get(key)
+            if stats is None:
+                stats = self.routes[key] = {
+                    'count': 0, 'sum': 0.0, 'queries': 0,
+                    'buckets': [0] * (len(buckets) + 1),
+                    **{stage: 0.0 for stage, _ in STAGES},
+                }
+            stats['count'] += 1
+            stats['sum'] += timings.duration
+            stats['queries'] += timings.queries
+            for stage, _ in STAGES:
+                stats[stage] += getattr(timings, stage)
+            index = next((
+                index for index, bound in enumerate(buckets)
+                if timings.duration <= bound
+            ), len(buckets))
+            stats['buckets'][index] += 1
+            due = (time.monotonic() - self.flushed
+                   >= settings.METRICS_FLUSH_INTERVAL)
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            if self.pid != os.getpid() or not self.routes:
+                return
+            self.flushed = time.monotonic()
+            snapshot = json.dumps(
+                {'routes': self.routes, 'pools': get_pool_stats()})
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp = self.path.with_suffix('.tmp')
+        temp.write_text(snapshot)
+        os.replace(temp, self.path)
+
+    def collect(self):
+        """Сумма снимков всех процессов: маршруты и пулы соединений."""
+        self.flush()
+        directory = Path(settings.METRICS_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        routes = {}
+        pools = {}
+        # Под блокировкой снимок не может уйти в архив между чтением
+        # архива и чтением самого снимка.
+        with open(directory / LOCK_NAME, 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            archive_snapshots(directory)
+            for path in directory.glob('*.json'):
+                snapshot = read_snapshot(path)
+                if snapshot is None:
+                    continue
+                add_routes(routes, snapshot.get('routes', {}))
+                add_pools(pools, snapshot.get('pools', {}),
+                          path.name != ARCHIVE_NAME)
+        return routes, pools
+
+
+def read_snapshot(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def get_pid(path):
+    try:
+        return int(path.name.split('-', 1)[0])
+    except ValueError:
+        return None
+
+
+def archive_snapshots(directory):
+    """Переносит снимки завершившихся процессов в архив и удаляет их.
+
+    Размеры пулов в архив не попадают. Вызывается под блокировкой
+    каталога, иначе два процесса могли бы учесть один снимок дважды.
+    """
+    archive_path = directory / ARCHIVE_NAME
+    archive = read_snapshot(archive_path) or {}
+    routes = archive.setdefault('routes', {})
+    pools = archive.setdefault('pools', {})
+    archived = []
+    for path in directory.glob('*.json'):
+        pid = get_pid(path)
+        if pid is None or is_alive(pid):
+            continue
+        snapshot = read_snapshot(path)
+        if snapshot is not None:
+            add_routes(routes, snapshot.get('routes', {}))
+            add_pools(pools, snapshot.get('pools', {}), False)
+        archived.append(path)
+    if not archived:
+        return
+    temp = archive_path.with_suffix('.tmp')
+    temp.write_text(json.dumps(archive))
+    os.replace(temp, archive_path)
+    for path in archived:
+        path.unlink(missing_ok=True)
+
+
+def add_routes(routes, snapshot):
+    for key, stats in snapshot.items():
+        total = routes.get(key)
+        if total is None:
+            routes[key] = stats
+            continue
+        for name, value in stats.items():
+            if name == 'buckets':
+                total[name] = [a + b for a, b in zip(total[name], value)]
+            else:
+                total[name] = total.get(name, 0) + value
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+def add_pools(pools, snapshot, alive):
+    """Счётчики пулов суммируются всегда, размеры только живых процессов."""
+    gauges = {name for name, _ in POOL_GAUGES}
+    for alias, stats in snapshot.items():
+        total = pools.setdefault(alias, {})
+        for name, value in stats.items():
+            if alive or name not in gauges:
+                total[name] = total.get(name, 0) + value
+
+
+metrics_store = MetricsStore()
+atexit.register(metrics_store.flush)
+
+
+def format_labels(key, **extra):
+    route, method = key.rsplit(' ', 1)
+    labels = {'route': route, 'method': method, **extra}
+    return '{' + ','.join(
+        f'{name}="{value}"' for name, value in labels.items()) + '}'
+
+
+def render_metrics():
+    """Метрики в текстовом формате Prometheus."""
+    routes, pools = metrics_store.collect()
+    routes = sorted(routes.items())
+    pools = sorted(pools.items())
+    name = 'foodgram_request_duration_seconds'
+    lines = [
+        f'# HELP {name} Время обработки запроса.',
+        f'# TYPE {name} histogram',
+    ]
+    bounds = [str(bound) for bound in settings.METRICS_BUCKETS] + ['+Inf']
+    for key, stats in routes:
+        cumulative = 0
+        for bound, count in zip(bounds, stats['buckets']):
+            cumulative += count
+            lines.append(
+                f'{name}_bucket{format_labels(key, le=bound)} {cumulative}')
+        lines.append(f'{name}_sum{format_labels(key)} {stats["sum"]}')
+        lines.append(f'{name}_count{format_labels(key)} {stats["count"]}')
+    name = 'foodgram_request_db_queries_total'
+    lines += [f'# HELP {name} Число SQL-запросов.',
+              f'# TYPE {name} counter']
+    lines += [f'{name}{format_labels(key)} {stats["queries"]}'
+              for key, stats in routes]
+    for stage, description in STAGES:
+        name = f'foodgram_request_{stage}_seconds_total'
+        lines += [f'# HELP {name} {description}',
+                  f'# TYPE {name} counter']
+        lines += [f'{name}{format_labels(key)} {stats.get(stage, 0)}'
+                  for key, stats in routes]
+    for kind, stages in (('gauge', POOL_GAUGES), ('counter', POOL_COUNTERS)):
+        for stat, description in stages:
+            name = f'foodgram_db_pool_{stat}'
+            if kind == 'counter':
+                name += '_total'
+            lines += [f'# HELP {name} {description}',
+                      f'# TYPE {name} {kind}']
+            lines += [f'{name}{{alias="{alias}"}} {stats.get(stat, 0)}'
+                      for alias, stats in pools]
+    for result, value in get_stats().items():
+        name = f'foodgram_recipe_response_cache_{result}_total'
+        lines += [f'# TYPE {name} counter', f'{name} {value}']
+    return '\n'.join(lines) + '\n'
+
+
+class ServerTimingMiddleware:
+    """Заголовок Server-Timing и метрики по маршрутам для каждого запроса."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        try:
+            with timings.capture_queries():
+                response = self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        timings.finish_view()
+        timings.finish()
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = timings.get_header()
+        match = request.resolver_match
+        route = match.url_name if match and match.url_name else UNMATCHED
+        method = request.method if request.method in METHODS else 'OTHER'
+        metrics_store.observe(route, method, timings)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = current_timings.get()
+        if timings is not None:
+            timings.start_view()
+
+    def process_template_response(self, request, response):
+        timings = current_timings.get()
+        if timings is not None:
+            timings.finish_view()
+            timings.start_render()
+            response.add_post_render_callback(timings.finish_render)
+        return response
@@ -1,5 +1,96 @@
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class CustomPagination(PageNumberPagination):
     page_size_query_param = "limit"
+
+
+class RecipePagination(CustomPagination):
+    """Постраничная выдача рецептов с курсорным режимом по запросу.
+
+    Без параметра cursor работает как обычная выдача page/limit.
+    С параметром cursor (пустым для первой страницы) выборка идёт по ключу
+    (pub_date, id) без COUNT(*) и OFFSET. Если у выборки своя сортировка
+    (поиск, популярность), курсор не применяется.
+    """
+    cursor_query_param = 'cursor'
+    cursor_page_size = 6
+    cursor_ordering = ('-pub_date', '-id')
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = (
+            self.cursor_query_param in request.query_params
+            and not queryset.query.order_by)
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        page_size = self.get_page_size(request) or self.cursor_page_size
+        queryset = queryset.order_by(*self.cursor_ordering)
+        cursor = request.query_params[self.cursor_query_param]
+        if cursor:
+            pub_date, pk = self.decode_cursor(cursor)
+            queryset = queryset.filter(
+                Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, pk__lt=pk))
+        results = list(queryset[:page_size + 1])
+        self.has_next = len(results) > page_size
+        self.page = results[:page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data)
+        ]))
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param,
+            self.encode_cursor(last.pub_date, last.pk))
+
+    def get_previous_link(self):
+        if not self.cursor_mode:
+            return super().get_previous_link()
+        return None
+
+    def encode_cursor(self, pub_date, pk):
+        value = f'{pub_date.isoformat()}|{pk}'.encode()
+        return b64encode(value, altchars=b'-_').decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            value = b64decode(cursor.encode(), altchars=b'-_').decode()
+            pub_date, pk = value.rsplit('|', 1)
+            pub_date = parse_datetime(pub_date)
+            pk = int(pk)
+        except ValueError:
+            pub_date = None
+        if pub_date is None:
+            raise ValidationError(
+                {self.cursor_query_param: self.invalid_cursor_message})
+        return pub_date, pk
+
+
+class PantryPagination(CustomPagination):
+    page_size = 6
+
+
+class FeedPagination(RecipePagination):
+    """Лента подписок всегда отдаётся страницами, в том числе без limit."""
+    page_size = 6
+    max_page_size = 100
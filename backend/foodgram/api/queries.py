@@ -0,0 +1,183 @@
+import logging
+import re
+import sys
+from collections import Counter
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.fields import Field
+
+logger = logging.getLogger(__name__)
+
+IN_LIST = re.compile(r'\(\s*%s(\s*,\s*%s)*\s*\)')
+STRING = re.compile(r"'(?:[^']|'')*'")
+NUMBER = re.compile(r'\b\d+(\.\d+)?\b')
+SPACES = re.compile(r'\s+')
+TRANSACTION_STATEMENTS = ('SAVEPOINT', 'RELEASE', 'ROLLBACK')
+PROJECT_DIR = str(settings.BASE_DIR)
+# Обёртки execute: инспектор и метрики запросов. Запрос вызывают не они.
+WRAPPER_FILES = (__file__, str(Path(__file__).with_name('metrics.py')))
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_budget(count):
+    """Допустимое число SQL-запросов для функции-представления или action.
+
+    Для унаследованных действий вьюсета бюджет задаётся атрибутом класса
+    query_budgets = {'list': 3, ...}.
+    """
+
+    def decorator(view):
+        view.query_budget = count
+        return view
+
+    return decorator
+
+
+def get_budget(view_func, request):
+    budget = getattr(view_func, 'query_budget', None)
+    if budget is not None:
+        return budget
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return None
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    budget = getattr(getattr(cls, action, None), 'query_budget', None)
+    if budget is not None:
+        return budget
+    return getattr(cls, 'query_budgets', {}).get(action)
+
+
+def fingerprint(sql):
+    """SQL без значений: запросы, отличающиеся параметрами, совпадают."""
+    sql = IN_LIST.sub('(...)', sql)
+    sql = STRING.sub('?', sql)
+    sql = NUMBER.sub('?', sql)
+    return SPACES.sub(' ', sql).strip()
+
+
+def is_project_frame(frame):
+    filename = frame.f_code.co_filename
+    return (filename.startswith(PROJECT_DIR)
+            and 'site-packages' not in filename
+            and filename not in WRAPPER_FILES)
+
+
+def get_origin():
+    """Метод сериализатора или поля, вызвавший запрос, или строка кода."""
+    frame = sys._getframe(2)
+    first = None
+    while frame is not None:
+        if is_project_frame(frame):
+            location = '{}:{}'.format(
+                Path(frame.f_code.co_filename).relative_to(PROJECT_DIR),
+                frame.f_lineno)
+            owner = frame.f_locals.get('self')
+            method = getattr(type(owner), frame.f_code.co_name, None)
+            if (isinstance(owner, Field)
+                    and getattr(method, '__code__', None) is frame.f_code):
+                return (f'{type(owner).__name__}.{frame.f_code.co_name} '
+                        f'({location})')
+            if first is None:
+                first = f'{frame.f_code.co_name} ({location})'
+        frame = frame.f_back
+    return first or 'неизвестно'
+
+
+class QueryInspector:
+    """Отпечатки SQL-запросов одного HTTP-запроса и места их вызова.
+
+    Точки сохранения транзакций не считаются: их число зависит от того,
+    выполняется ли запрос внутри транзакции теста.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.counts = Counter()
+        self.origins = {}
+
+    def execute(self, execute, sql, params, many, context):
+        if not sql.lstrip().upper().startswith(TRANSACTION_STATEMENTS):
+            self.total += 1
+            key = fingerprint(sql)
+            self.counts[key] += 1
+            self.origins.setdefault(key, Counter())[get_origin()] += 1
+        return execute(sql, params, many, context)
+
+    def capture(self):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self.execute))
+        return stack
+
+    def get_repeats(self):
+        """Запросы, повторённые не меньше QUERY_REPEAT_THRESHOLD раз."""
+        return [
+            (key, count, self.origins[key].most_common(1)[0][0])
+            for key, count in self.counts.most_common()
+            if count >= settings.QUERY_REPEAT_THRESHOLD
+        ]
+
+
+class QueryInspectorMiddleware:
+    """Ищет N+1 и проверяет бюджеты запросов в DEBUG и в тестах.
+
+    Повторы одного и того же запроса с разными параметрами попадают в лог
+    с указанием метода сериализатора. Превышение бюджета представления
+    в режиме raise (тесты) роняет запрос с QueryBudgetExceeded, в режиме
+    warn только пишется в лог. У потоковых ответов учитываются и запросы,
+    выполненные при отдаче тела, а проверка проходит в конце потока.
+    """
+
+    def __init__(self, get_response):
+        if not settings.QUERY_INSPECTION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        inspector = QueryInspector()
+        with inspector.capture():
+            response = self.get_response(request)
+        if response.streaming:
+            response.streaming_content = self.inspect_stream(
+                request, response.streaming_content, inspector)
+        else:
+            self.check(request, inspector)
+        return response
+
+    def inspect_stream(self, request, content, inspector):
+        content = iter(content)
+        while True:
+            with inspector.capture():
+                chunk = next(content, None)
+            if chunk is None:
+                break
+            yield chunk
+        self.check(request, inspector)
+
+    def check(self, request, inspector):
+        repeats = inspector.get_repeats()
+        for key, count, origin in repeats:
+            logger.warning('%s %s: запрос выполнен %s раз в %s: %s',
+                           request.method, request.path, count, origin, key)
+        budget = getattr(request, '_query_budget', None)
+        if budget is not None and inspector.total > budget:
+            message = (f'{request.method} {request.path}: '
+                       f'{inspector.total} запросов при бюджете {budget}.')
+            if repeats:
+                message += ' Повторы: ' + '; '.join(
+                    f'{count} раз в {origin}'
+                    for _, count, origin in repeats)
+            if settings.QUERY_INSPECTION == 'raise':
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._query_budget = get_budget(view_func, request)
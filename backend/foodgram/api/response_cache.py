@@ -0,0 +1,135 @@
+import hashlib
+import time
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.decorators import method_decorator
+from rest_framework.response import Response
+
+from foodgram.routers import use_primary
+
+GENERATION_KEY = 'recipe_response_generation'
+RESPONSE_KEY = 'recipe_response_{generation}_{digest}'
+LOCK_SUFFIX = '_lock'
+HITS_KEY = 'recipe_response_hits'
+MISSES_KEY = 'recipe_response_misses'
+RESPONSE_TIMEOUT = 5 * 60
+LOCK_TIMEOUT = 10
+LOCK_POLL_INTERVAL = 0.05
+
+
+def incr(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        return cache.incr(key)
+
+
+def seed_generation():
+    """Поколение для пустого кэша: текущее время в наносекундах.
+
+    Ключ поколения может вытеснить раньше ответов. Счёт с единицы снова
+    выдал бы номер, под которым в кэше ещё лежат старые ответы, а время
+    больше любого прежнего номера.
+    """
+    generation = time.time_ns()
+    if not cache.add(GENERATION_KEY, generation, None):
+        generation = cache.get(GENERATION_KEY, generation)
+    return generation
+
+
+def get_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        generation = seed_generation()
+    return generation
+
+
+def increment_generation():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        # Новое начальное значение уже отличается от всех прежних.
+        seed_generation()
+
+
+def bump_generation():
+    """Делает устаревшими все закэшированные ответы после коммита."""
+    transaction.on_commit(increment_generation)
+
+
+def get_stats():
+    stats = cache.get_many((HITS_KEY, MISSES_KEY))
+    return {'hits': stats.get(HITS_KEY, 0),
+            'misses': stats.get(MISSES_KEY, 0)}
+
+
+def get_key(request):
+    """Ключ ответа: хост, путь и отсортированные параметры запроса."""
+    query = urlencode(sorted(
+        (name, value)
+        for name in request.GET
+        for value in request.GET.getlist(name)
+    ))
+    digest = hashlib.md5(
+        f'{request.get_host()}{request.path}?{query}'.encode()).hexdigest()
+    return RESPONSE_KEY.format(generation=get_generation(), digest=digest)
+
+
+def wait_for(key):
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+        if cache.get(key + LOCK_SUFFIX) is None:
+            return None
+    return None
+
+
+def cache_anonymous(view_func):
+    """Кэширует ответы анонимным пользователям на GET-запросы.
+
+    Ключ включает поколение, которое увеличивают сигналы моделей рецептов,
+    поэтому после любого изменения старые ответы перестают читаться.
+    Пустой ключ вычисляет только один запрос, остальные ждут его результат.
+    Ответ для кэша читается из основной базы: с отстающей реплики в новое
+    поколение попали бы старые данные.
+    """
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if request.method != 'GET' or request.user.is_authenticated:
+            return view_func(request, *args, **kwargs)
+        key = get_key(request)
+        cached = cache.get(key)
+        locked = False
+        if cached is None:
+            locked = cache.add(key + LOCK_SUFFIX, 1, LOCK_TIMEOUT)
+            if not locked:
+                cached = wait_for(key)
+        if cached is not None:
+            incr(HITS_KEY)
+            response = Response(cached)
+            response['X-Cache'] = 'HIT'
+            return response
+        incr(MISSES_KEY)
+        try:
+            with use_primary():
+                response = view_func(request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, response.data, RESPONSE_TIMEOUT)
+        finally:
+            if locked:
+                cache.delete(key + LOCK_SUFFIX)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    return wrapper
+
+
+anonymous_cache = method_decorator(cache_anonymous)
@@ -1,17 +1,21 @@
 from django.core.validators import RegexValidator
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from django.db.models import F
-from django.shortcuts import get_object_or_404
 from djoser.serializers import UserCreateSerializer, UserSerializer
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
-from rest_framework.exceptions import ValidationError
-from rest_framework.validators import UniqueTogetherValidator, UniqueValidator
-
-from recipes.models import (FavoritedRecipe, Ingredient, IngredientRecipe,
-                            Recipe, ShoppingCart, Tag)
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.validators import UniqueValidator
+
+from recipes.images import enqueue_image
+from recipes.models import (FavoritedRecipe, FeedEntry, Ingredient,
+                            IngredientRecipe, Recipe, ShoppingCart,
+                            ShoppingListItem, Tag, TaggedRecipe)
+from recipes.pantry import pantry_index
+from recipes.user_state import get_user_state
 from users.models import Follow, User
 
+from .fields import DeferredImageField, ThumbnailImageField
+
 
 class CustomUserSerializer(UserSerializer):
     is_subscribed = serializers.SerializerMethodField()
@@ -22,10 +26,8 @@ class CustomUserSerializer(UserSerializer):
                   'first_name', 'last_name', 'is_subscribed')
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return Follow.objects.filter(user=user, author=obj).exists()
+        state = get_user_state(self.context.get('request'))
+        return obj.pk in state.following
 
 
 class CustomUserCreateSerializer(UserCreateSerializer):
@@ -90,8 +92,9 @@ class IngredientRecipeCreateSerializer(serializers.ModelSerializer):
 class RecipeSerializer(serializers.ModelSerializer):
     author = CustomUserSerializer(read_only=True)
     tags = TagSerializer(many=True)
-    ingredients = serializers.SerializerMethodField()
-    image = Base64ImageField()
+    ingredients = IngredientRecipeSerializer(source='ingredient_list',
+                                             many=True)
+    image = ThumbnailImageField(variant='detail')
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
@@ -99,23 +102,14 @@ class RecipeSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart',
-                  'name', 'image', 'text', 'cooking_time')
-
-    def get_ingredients(self, obj):
-        ingredients = obj.ingredients.values(
-            'id', 'name',
-            'measurement_unit',
-            amount=F('recipe__amount')
-        )
-        return ingredients
+                  'name', 'image', 'image_status', 'text', 'cooking_time')
+        read_only_fields = ('image_status',)
 
     def get_is_favorited(self, obj):
-        user = self.context.get('request').user
-        return user in obj.following_users.all()
+        return obj.pk in get_user_state(self.context.get('request')).favorites
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context.get('request').user
-        return user in obj.shopping_users.all()
+        return obj.pk in get_user_state(self.context.get('request')).cart
 
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
@@ -125,7 +119,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
     )
     ingredients = IngredientRecipeCreateSerializer(many=True)
     author = CustomUserSerializer(read_only=True)
-    image = Base64ImageField()
+    image = DeferredImageField(variant='detail')
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
@@ -133,15 +127,14 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart',
-                  'name', 'image', 'text', 'cooking_time')
+                  'name', 'image', 'image_status', 'text', 'cooking_time')
+        read_only_fields = ('image_status',)
 
     def get_is_favorited(self, obj):
-        user = self.context.get('request').user
-        return user in obj.following_users.all()
+        return obj.pk in get_user_state(self.context.get('request')).favorites
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context.get('request').user
-        return user in obj.shopping_users.all()
+        return obj.pk in get_user_state(self.context.get('request')).cart
 
     def validate_ingredients(self, value):
         ingredients = value
@@ -149,58 +142,131 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             raise ValidationError({
                 'ingredients': 'Добавьте ингредиент!'
             })
-        ingredients_list = []
-        for i in ingredients:
-            ingredient = get_object_or_404(Ingredient, id=i.get('id'))
-            if ingredient in ingredients_list:
-                raise ValidationError({
-                    'ingredients': 'Ингридиенты не могут повторяться!'
-                })
-            if int(i.get('amount')) <= 0:
+        ids = [ingredient.get('id') for ingredient in ingredients]
+        if len(set(ids)) != len(ids):
+            raise ValidationError({
+                'ingredients': 'Ингридиенты не могут повторяться!'
+            })
+        found = Ingredient.objects.in_bulk(ids)
+        if len(found) != len(ids):
+            raise NotFound('Ингредиент не найден.')
+        for ingredient in ingredients:
+            if int(ingredient.get('amount')) <= 0:
                 raise ValidationError({
                     'amount': 'Количество ингредиента должно быть больше 0!'
                 })
-            ingredients_list.append(ingredient)
+            ingredient['ingredient'] = found[ingredient.get('id')]
         return value
 
-    @transaction.atomic
-    def create_ingredients(self, recipe, ingredients):
+    def set_tags(self, recipe, tags):
+        new = {tag.id for tag in tags}
+        old = set(TaggedRecipe.objects.filter(
+            recipe=recipe).values_list('tag', flat=True))
+        if old - new:
+            TaggedRecipe.objects.filter(
+                recipe=recipe, tag__in=old - new).delete()
+        TaggedRecipe.objects.bulk_create(
+            TaggedRecipe(recipe=recipe, tag_id=tag) for tag in new - old)
+        return old != new
+
+    def set_ingredients(self, recipe, ingredients):
+        """Записывает только изменившиеся строки IngredientRecipe.
+
+        Возвращает старые и новые количества ингредиентов рецепта.
+        """
+        rows = {
+            row.ingredient_id: row
+            for row in IngredientRecipe.objects.filter(recipe=recipe)
+        }
+        old_amounts = {
+            ingredient: row.amount for ingredient, row in rows.items()
+        }
+        new_amounts = {
+            ingredient['ingredient'].id: ingredient.get('amount')
+            for ingredient in ingredients
+        }
+        removed = [
+            row.pk for ingredient, row in rows.items()
+            if ingredient not in new_amounts
+        ]
+        if removed:
+            IngredientRecipe.objects.filter(pk__in=removed).delete()
+        changed = []
+        for ingredient, amount in new_amounts.items():
+            row = rows.get(ingredient)
+            if row is not None and row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+        IngredientRecipe.objects.bulk_update(changed, ('amount',))
         IngredientRecipe.objects.bulk_create(
-            IngredientRecipe(
-                recipe=recipe,
-                ingredient=Ingredient.objects.get(id=ingredient.get('id')),
-                amount=ingredient.get('amount')
-            ) for ingredient in ingredients)
+            IngredientRecipe(recipe=recipe, ingredient_id=ingredient,
+                             amount=amount)
+            for ingredient, amount in new_amounts.items()
+            if ingredient not in rows)
+        return old_amounts, new_amounts
 
     @transaction.atomic
     def create(self, validated_data):
         user = self.context.get('request').user
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
+        image = validated_data.pop('image')
         recipe = Recipe.objects.create(author=user,
                                        **validated_data)
-        recipe.tags.set(tags)
-        self.create_ingredients(recipe, ingredients)
+        self.set_tags(recipe, tags)
+        self.set_ingredients(recipe, ingredients)
+        pantry_index.recipe_changed(recipe.pk)
+        enqueue_image(recipe, image)
+        User.objects.filter(pk=user.pk).update(
+            recipes_count=F('recipes_count') + 1)
+        FeedEntry.objects.fan_out(recipe)
         return recipe
 
     @transaction.atomic
     def update(self, instance, validated_data):
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('ingredients')
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
+        image = validated_data.pop('image', None)
         instance = super().update(instance, validated_data)
-        instance.tags.clear()
-        instance.tags.set(tags)
-        instance.ingredients.clear()
-        self.create_ingredients(instance, ingredients)
-        instance.save()
+        stale = False
+        if tags is not None:
+            stale = self.set_tags(instance, tags)
+        if ingredients is not None:
+            old, new = self.set_ingredients(instance, ingredients)
+            ShoppingListItem.objects.change_recipe(instance, old, new)
+            if old.keys() != new.keys():
+                stale = True
+                pantry_index.recipe_changed(instance.pk)
+        if stale:
+            Recipe.objects.filter(pk=instance.pk).update(
+                neighbors_stale=True)
+        if image:
+            enqueue_image(instance, image)
         return instance
 
     def to_representation(self, instance):
-        context = {'request': self.context.get('request')}
+        request = self.context.get('request')
+        context = {'request': request}
+        instance = Recipe.objects.with_related().get(
+            pk=instance.pk)
         return RecipeSerializer(instance, context=context).data
 
 
-class FavoritedRecipeSerializer(serializers.ModelSerializer):
+class UniqueCreateMixin:
+    """Ловит повторную запись по ограничению уникальности в БД."""
+    unique_error_message = 'Такая запись уже существует.'
+
+    def create(self, validated_data):
+        try:
+            with transaction.atomic():
+                return super().create(validated_data)
+        except IntegrityError:
+            raise ValidationError(
+                {'non_field_errors': [self.unique_error_message]})
+
+
+class FavoritedRecipeSerializer(UniqueCreateMixin,
+                                serializers.ModelSerializer):
     user = serializers.SlugRelatedField(
         read_only=True,
         slug_field='username',
@@ -214,13 +280,10 @@ class FavoritedRecipeSerializer(serializers.ModelSerializer):
     class Meta:
         fields = ('id', 'user', 'recipe')
         model = FavoritedRecipe
-        validators = [UniqueTogetherValidator(
-            queryset=FavoritedRecipe.objects.all(),
-            fields=('user', 'recipe')
-        )]
+        validators = []
 
 
-class ShoppingCartSerializer(serializers.ModelSerializer):
+class ShoppingCartSerializer(UniqueCreateMixin, serializers.ModelSerializer):
     user = serializers.SlugRelatedField(
         read_only=True,
         slug_field='username',
@@ -234,50 +297,44 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
     class Meta:
         fields = ('id', 'user', 'recipe')
         model = ShoppingCart
-        validators = [UniqueTogetherValidator(
-            queryset=ShoppingCart.objects.all(),
-            fields=('user', 'recipe')
-        )]
+        validators = []
 
 
 class FollowingRecipeSerializer(serializers.ModelSerializer):
-    image = Base64ImageField(required=False, allow_null=True)
+    image = ThumbnailImageField(variant='preview', required=False,
+                                allow_null=True)
 
     class Meta:
         model = Recipe
         fields = ('id', 'name', 'image', 'cooking_time')
 
 
+class PantryRecipeSerializer(FollowingRecipeSerializer):
+    coverage = serializers.FloatField(read_only=True)
+    missing_ingredients = IngredientSerializer(many=True, read_only=True)
+
+    class Meta(FollowingRecipeSerializer.Meta):
+        fields = FollowingRecipeSerializer.Meta.fields + (
+            'coverage', 'missing_ingredients')
+
+
 class UserFollowingListSerializer(serializers.ModelSerializer):
-    recipes = serializers.SerializerMethodField()
-    is_subscribed = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    """Автор в подписках пользователя.
+
+    Ждёт аннотацию is_subscribed и список preview_recipes, которые
+    заполняет ListFollow; число рецептов берётся из счётчика автора.
+    """
+    recipes = FollowingRecipeSerializer(source='preview_recipes', many=True,
+                                        read_only=True)
+    is_subscribed = serializers.BooleanField(read_only=True)
 
     class Meta:
         model = User
         fields = ('email', 'id', 'username', 'first_name', 'last_name',
                   'is_subscribed', 'recipes', 'recipes_count')
 
-    def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        recipes = obj.recipes.all()
-        if limit:
-            recipes = recipes[:int(limit)]
-        serializer = FollowingRecipeSerializer(recipes,
-                                               many=True,
-                                               read_only=True)
-        return serializer.data
-
-    def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        return Follow.objects.filter(user=user, author=obj).exists()
-
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
 
-class FollowingSerializer(serializers.ModelSerializer):
+class FollowingSerializer(UniqueCreateMixin, serializers.ModelSerializer):
     user = serializers.SlugRelatedField(
         read_only=True,
         slug_field='username',
@@ -291,10 +348,7 @@ class FollowingSerializer(serializers.ModelSerializer):
     class Meta:
         fields = '__all__'
         model = Follow
-        validators = [UniqueTogetherValidator(
-            queryset=Follow.objects.all(),
-            fields=('user', 'author')
-        )]
+        validators = []
 
     def validate(self, data):
         user = self.context['request'].user
@@ -0,0 +1,111 @@
+import csv
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFError, TTFont
+from reportlab.pdfgen import canvas
+
+from recipes.models import ShoppingListItem
+
+CHUNK_SIZE = 2000
+TITLE = 'Список покупок: '
+CSV_HEADER = ('Ингредиент', 'Единица измерения', 'Количество')
+PDF_FONT = 'ShoppingListFont'
+PDF_FONT_SIZE = 12
+PDF_MARGIN = 50
+PDF_LEADING = 18
+
+
+def get_shopping_list(user):
+    """Суммы ингредиентов из корзины, читаются курсором на стороне БД."""
+    return (ShoppingListItem.objects
+            .filter(user=user)
+            .order_by('ingredient__name')
+            .values_list('ingredient__name',
+                         'ingredient__measurement_unit',
+                         'amount')
+            .iterator(chunk_size=CHUNK_SIZE))
+
+
+def stream_txt(rows):
+    yield TITLE + '\n'
+    separator = ''
+    for row in rows:
+        yield separator + '{} {} - {}'.format(*row)
+        separator = '\n'
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def get_pdf_font():
+    """Шрифт с кириллицей из SHOPPING_LIST_PDF_FONT.
+
+    Встроенные шрифты PDF не содержат кириллицы, поэтому без него
+    названия ингредиентов нечитаемы и список не отдаётся совсем.
+    """
+    if PDF_FONT not in pdfmetrics.getRegisteredFontNames():
+        try:
+            pdfmetrics.registerFont(
+                TTFont(PDF_FONT, settings.SHOPPING_LIST_PDF_FONT))
+        except TTFError as error:
+            raise ImproperlyConfigured(
+                f'Не удалось загрузить шрифт SHOPPING_LIST_PDF_FONT: {error}'
+            ) from error
+    return PDF_FONT
+
+
+def stream_pdf(rows):
+    """Отдаёт PDF по частям после сборки во временный файл.
+
+    В отличие от txt и csv, PDF не начинает отдаваться до чтения всех
+    строк: ReportLab пишет страницы, дерево страниц и таблицу ссылок
+    только при сохранении документа. Файл остаётся в памяти до первого
+    мегабайта, дальше пишется на диск. Шрифт загружается до начала
+    ответа, чтобы ошибка не обрывала уже начатую загрузку.
+    """
+    return iter_pdf(rows, get_pdf_font())
+
+
+def iter_pdf(rows, font):
+    buffer = SpooledTemporaryFile(max_size=1024 * 1024)
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    _, height = A4
+    top = height - PDF_MARGIN
+    pdf.setFont(font, PDF_FONT_SIZE + 4)
+    pdf.drawString(PDF_MARGIN, top, TITLE)
+    y = top - PDF_LEADING * 2
+    for row in rows:
+        if y < PDF_MARGIN:
+            pdf.showPage()
+            y = top
+        pdf.setFont(font, PDF_FONT_SIZE)
+        pdf.drawString(PDF_MARGIN, y, '{} {} - {}'.format(*row))
+        y -= PDF_LEADING
+    pdf.save()
+    buffer.seek(0)
+    while True:
+        chunk = buffer.read(64 * 1024)
+        if not chunk:
+            break
+        yield chunk
+    buffer.close()
+
+
+STREAMS = {
+    'txt': stream_txt,
+    'csv': stream_csv,
+    'pdf': stream_pdf,
+}
@@ -0,0 +1,32 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.models import (Ingredient, IngredientRecipe, Recipe, Tag,
+                            TaggedRecipe)
+from users.models import User
+
+from .response_cache import bump_generation
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+@receiver(post_save, sender=TaggedRecipe)
+@receiver(post_delete, sender=TaggedRecipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_recipe_responses(sender, **kwargs):
+    bump_generation()
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_responses(sender, created=False, update_fields=None,
+                                **kwargs):
+    """Сбрасывает ответы при изменении автора, но не его last_login."""
+    if created:
+        return
+    if update_fields is None or User.PUBLIC_FIELDS.intersection(update_fields):
+        bump_generation()
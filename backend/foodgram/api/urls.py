@@ -2,9 +2,9 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from .views import (CreateDeleteFollowViewSet, CustomUserViewSet,
-                    FavoriteRecipeViewSet, IngredientViewSet, ListFollow,
-                    RecipeViewSet, ShoppingCartViewSet, TagViewSet,
-                    download_shopping_cart)
+                    DownloadShoppingCart, FavoriteRecipeViewSet,
+                    IngredientViewSet, ListFollow, RecipeViewSet,
+                    ShoppingCartViewSet, TagViewSet, metrics)
 
 router = DefaultRouter()
 
@@ -28,7 +28,8 @@ urlpatterns = [
     path('users/subscriptions/', ListFollow.as_view(),
          name='subscriptions'),
     path('recipes/download_shopping_cart/',
-         download_shopping_cart, name='download_chopping'),
+         DownloadShoppingCart.as_view(), name='download_chopping'),
+    path('metrics/', metrics, name='metrics'),
     path('', include(router.urls)),
     path('', include('djoser.urls.base')),
     path('auth/', include('djoser.urls.authtoken')),
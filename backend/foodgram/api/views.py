@@ -1,29 +1,67 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import (BooleanField, F, Prefetch, Value,
+                              prefetch_related_objects)
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.decorators import method_decorator
+from django.views.decorators.vary import vary_on_headers
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import generics, mixins, viewsets
-from rest_framework.decorators import api_view
-from rest_framework.permissions import IsAuthenticated
-
-from recipes.models import (FavoritedRecipe, Ingredient, IngredientRecipe,
-                            Recipe, ShoppingCart, Tag)
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from recipes.models import (CatalogVersion, FavoritedRecipe, FeedEntry,
+                            Ingredient, Recipe, ShoppingCart, ShoppingListItem,
+                            Tag)
+from recipes.pantry import pantry_index
+from recipes.search import ingredient_index
 from users.models import Follow, User
 
+from .conditional import (catalog_condition, get_catalog_versions,
+                          recipe_condition)
 from .filters import IngredientFilter, RecipeFilter
-from .pagination import CustomPagination
+from .metrics import CONTENT_TYPE, render_metrics, serialize
+from .pagination import (CustomPagination, FeedPagination, PantryPagination,
+                         RecipePagination)
 from .permissions import OwnerOrReadOnly, ReadOnly
+from .renderers import (CSVRenderer, PDFRenderer, PlainTextRenderer,
+                        ShoppingListNegotiation)
+from .response_cache import anonymous_cache
 from .serializers import (CustomUserCreateSerializer, CustomUserSerializer,
-                          FavoritedRecipeSerializer, FollowingSerializer,
-                          IngredientSerializer, RecipeCreateSerializer,
+                          FavoritedRecipeSerializer, FollowingRecipeSerializer,
+                          FollowingSerializer, IngredientSerializer,
+                          PantryRecipeSerializer, RecipeCreateSerializer,
                           RecipeSerializer, ShoppingCartSerializer,
                           TagSerializer, UserFollowingListSerializer)
+from .shopping_list import STREAMS, get_shopping_list
+
+
+class SerializeTimingMixin:
+    """list и retrieve, время сериализации которых видно в Server-Timing."""
 
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serialize(serializer))
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serialize(serializer))
 
-class CustomUserViewSet(UserViewSet):
+    def retrieve(self, request, *args, **kwargs):
+        serializer = self.get_serializer(self.get_object())
+        return Response(serialize(serializer))
+
+
+class CustomUserViewSet(SerializeTimingMixin, UserViewSet):
     serializer_class = CustomUserSerializer
     pagination_class = CustomPagination
     filter_backends = (DjangoFilterBackend,)
+    query_budgets = {'list': 6, 'retrieve': 5, 'me': 4}
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -38,48 +76,197 @@ class CustomUserViewSet(UserViewSet):
         return super().get_permissions()
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(SerializeTimingMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     serializer_class = RecipeCreateSerializer
-    pagination_class = CustomPagination
+    pagination_class = RecipePagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    read_from_replica = True
+    query_budgets = {'list': 9, 'retrieve': 9, 'feed': 9, 'similar': 2,
+                     'pantry': 5}
     permission_classes = (OwnerOrReadOnly,)
 
+    def get_queryset(self):
+        if self.action in ('list', 'retrieve'):
+            return Recipe.objects.with_related()
+        return super().get_queryset()
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action in ('list', 'feed'):
+            context['image_variant'] = 'card'
+        return context
+
     def get_serializer_class(self):
         if self.action in ('list', 'retrieve'):
             return RecipeSerializer
         return super().get_serializer_class()
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        ShoppingListItem.objects.change_recipe(
+            instance, instance.get_ingredient_amounts(), {})
+        instance.delete()
+        User.objects.filter(pk=instance.author_id).update(
+            recipes_count=F('recipes_count') - 1)
+
+    @action(detail=False, permission_classes=(IsAuthenticated,),
+            pagination_class=FeedPagination)
+    def feed(self, request):
+        page = self.paginate_queryset(
+            FeedEntry.objects.filter(user=request.user))
+        recipe_ids = [entry.recipe_id for entry in page]
+        recipes = Recipe.objects.with_related().in_bulk(recipe_ids)
+        serializer = RecipeSerializer(
+            [recipes[pk] for pk in recipe_ids if pk in recipes],
+            many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serialize(serializer))
+
+    @action(detail=False, pagination_class=PantryPagination)
+    def pantry(self, request):
+        """Рецепты, которые можно приготовить из имеющихся продуктов."""
+        try:
+            ingredients = {
+                int(value)
+                for param in request.query_params.getlist('ingredients')
+                for value in param.split(',') if value
+            }
+        except ValueError:
+            raise ValidationError(
+                {'ingredients': ['Укажите id ингредиентов через запятую.']})
+        page = self.paginate_queryset(pantry_index.match(ingredients))
+        recipes = Recipe.objects.in_bulk([match.recipe for match in page])
+        missing = Ingredient.objects.in_bulk(
+            [pk for match in page for pk in match.missing])
+        results = []
+        for match in page:
+            recipe = recipes.get(match.recipe)
+            if recipe is None:
+                continue
+            recipe.coverage = match.coverage
+            recipe.missing_ingredients = [
+                missing[pk] for pk in match.missing if pk in missing]
+            results.append(recipe)
+        serializer = PantryRecipeSerializer(
+            results, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serialize(serializer))
+
+    @action(detail=True)
+    def similar(self, request, pk=None):
+        """Похожие рецепты из заранее посчитанной таблицы соседей."""
+        recipes = list(Recipe.objects
+                       .filter(neighbor_of__recipe=pk)
+                       .order_by('-neighbor_of__score', '-pk')
+                       [:self.paginator.get_page_size(request)])
+        if not recipes:
+            get_object_or_404(Recipe, pk=pk)
+        serializer = FollowingRecipeSerializer(
+            recipes, many=True, context=self.get_serializer_context())
+        return Response(serialize(serializer))
+
+    @anonymous_cache
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @method_decorator(vary_on_headers('Authorization'))
+    @recipe_condition
+    @anonymous_cache
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     def get_permissions(self):
-        if self.action in ('list', 'retrieve'):
+        if self.action in ('list', 'retrieve', 'pantry', 'similar'):
             return (ReadOnly(),)
         elif self.action == 'create':
             return (IsAuthenticated(),)
         return super().get_permissions()
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(SerializeTimingMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
+    read_from_replica = True
+    query_budgets = {'list': 3, 'retrieve': 3}
+
+    @catalog_condition(CatalogVersion.TAGS)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @catalog_condition(CatalogVersion.TAGS)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(SerializeTimingMixin,
+                        viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
+    read_from_replica = True
+    query_budgets = {'list': 3, 'retrieve': 3}
+
+    @catalog_condition(CatalogVersion.INGREDIENTS)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @catalog_condition(CatalogVersion.INGREDIENTS)
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name is None:
+            return super().list(request, *args, **kwargs)
+        version = get_catalog_versions(request).get(
+            CatalogVersion.INGREDIENTS)
+        serializer = self.get_serializer(
+            ingredient_index.search(name, version), many=True)
+        return Response(serialize(serializer))
 
 
 class ListFollow(generics.ListAPIView):
     serializer_class = UserFollowingListSerializer
     pagination_class = CustomPagination
     permission_classes = (IsAuthenticated,)
+    read_from_replica = True
+    query_budgets = {'get': 4}
 
     def get_queryset(self):
-        follow_obj = User.objects.filter(
-            follower__user_id=self.request.user.id)
-        return follow_obj
+        return (User.objects
+                .filter(follower__user_id=self.request.user.id)
+                .annotate(is_subscribed=Value(True, BooleanField()))
+                .order_by('-follower__id'))
+
+    def get_recipes_limit(self):
+        limit = self.request.query_params.get('recipes_limit')
+        if not limit:
+            return None
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = -1
+        if limit < 0:
+            raise ValidationError(
+                {'recipes_limit': ['Укажите неотрицательное число.']})
+        return limit
+
+    def list(self, request, *args, **kwargs):
+        """Превью рецептов всех авторов страницы загружаются одним запросом."""
+        queryset = self.get_queryset()
+        page = self.paginate_queryset(queryset)
+        authors = list(queryset) if page is None else page
+        limit = self.get_recipes_limit()
+        recipes = Recipe.objects.all()
+        if limit == 0:
+            recipes = recipes.none()
+        elif limit is not None:
+            recipes = recipes.newest_per_author(authors, limit)
+        prefetch_related_objects(authors, Prefetch(
+            'recipes', queryset=recipes.order_by('-pub_date', '-id'),
+            to_attr='preview_recipes'))
+        serializer = self.get_serializer(authors, many=True)
+        if page is None:
+            return Response(serialize(serializer))
+        return self.get_paginated_response(serialize(serializer))
 
 
 class PostDeleteViewSet(mixins.CreateModelMixin, generics.DestroyAPIView,
@@ -96,8 +283,20 @@ class CreateDeleteFollowViewSet(PostDeleteViewSet):
         request.data['author'] = author_id
         return super().create(request, *args, **kwargs)
 
+    @transaction.atomic
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        follow = serializer.save(user=self.request.user)
+        User.objects.filter(pk=follow.author_id).update(
+            followers_count=F('followers_count') + 1)
+        FeedEntry.objects.backfill(follow.user, follow.author)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        for follow in instance:
+            FeedEntry.objects.trim(follow.user_id, follow.author_id)
+            follow.delete()
+            User.objects.filter(pk=follow.author_id).update(
+                followers_count=F('followers_count') - 1)
 
     def get_object(self):
         author_id = self.kwargs.get('user_id')
@@ -115,8 +314,18 @@ class FavoriteRecipeViewSet(PostDeleteViewSet):
         request.data['recipe'] = recipe_id
         return super().create(request, *args, **kwargs)
 
+    @transaction.atomic
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        favorite = serializer.save(user=self.request.user)
+        Recipe.objects.filter(pk=favorite.recipe_id).update(
+            favorites_count=F('favorites_count') + 1)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        for favorite in instance:
+            favorite.delete()
+            Recipe.objects.filter(pk=favorite.recipe_id).update(
+                favorites_count=F('favorites_count') - 1)
 
     def get_object(self):
         recipe_id = self.kwargs.get('recipe_id')
@@ -135,8 +344,20 @@ class ShoppingCartViewSet(PostDeleteViewSet):
         request.data['recipe'] = recipe_id
         return super().create(request, *args, **kwargs)
 
+    @transaction.atomic
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        cart = serializer.save(user=self.request.user)
+        Recipe.objects.filter(pk=cart.recipe_id).update(
+            in_carts_count=F('in_carts_count') + 1)
+        ShoppingListItem.objects.add_recipe(cart.user, cart.recipe)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        for cart in instance.select_related('recipe'):
+            cart.delete()
+            Recipe.objects.filter(pk=cart.recipe_id).update(
+                in_carts_count=F('in_carts_count') - 1)
+            ShoppingListItem.objects.remove_recipe(cart.user, cart.recipe)
 
     def get_object(self):
         recipe_id = self.kwargs.get('recipe_id')
@@ -146,25 +367,28 @@ class ShoppingCartViewSet(PostDeleteViewSet):
         return shopping_cart_recipe_obj
 
 
+class DownloadShoppingCart(APIView):
+    permission_classes = (IsAuthenticated,)
+    renderer_classes = (PlainTextRenderer, CSVRenderer, PDFRenderer)
+    content_negotiation_class = ShoppingListNegotiation
+    query_budgets = {'get': 2}
+
+    def get(self, request):
+        renderer = request.accepted_renderer
+        rows = get_shopping_list(request.user)
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type += f'; charset={renderer.charset}'
+        return StreamingHttpResponse(
+            STREAMS[renderer.format](rows),
+            headers={'Content-Type': content_type,
+                     'Content-Disposition': (
+                         'attachment;'
+                         f'filename="ingredients.{renderer.format}"')}
+        )
+
+
 @api_view(['GET'])
-def download_shopping_cart(request):
-    user = request.user
-    ingredients = (IngredientRecipe.objects
-                   .filter(recipe__shopping_users=user)
-                   .values('ingredient')
-                   .annotate(sum_amount=Sum('amount'))
-                   .values_list('ingredient__name',
-                                'ingredient__measurement_unit',
-                                'sum_amount'))
-
-    file_list = [
-        '{} {} - {}'.format(*ingredient) for ingredient in ingredients]
-
-    file = HttpResponse(
-        'Список покупок: \n' + '\n'.join(file_list),
-        headers={'Content-Type': 'text/plain',
-                 'Content-Disposition': ('attachment;'
-                                         'filename="ingredients.txt"')}
-    )
-
-    return file
+@permission_classes((IsAdminUser,))
+def metrics(request):
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE)
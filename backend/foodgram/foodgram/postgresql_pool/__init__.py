@@ -0,0 +1,22 @@
+import os
+
+pools = {}
+
+
+def get_stats():
+    """Счётчики пулов соединений текущего процесса по алиасам БД."""
+    stats = {}
+    for (pid, _, _), pool in list(pools.items()):
+        if pid != os.getpid():
+            continue
+        total = stats.setdefault(pool.alias, {})
+        for name, value in pool.get_stats().items():
+            total[name] = total.get(name, 0) + value
+    return stats
+
+
+def close_pools():
+    """Закрывает свободные соединения всех пулов."""
+    for (pid, _, _), pool in list(pools.items()):
+        if pid == os.getpid():
+            pool.clear()
@@ -0,0 +1,50 @@
+import psycopg2.extras
+from django.db.backends.base.base import NO_DB_ALIAS
+from django.db.backends.postgresql import base
+from django.utils.asyncio import async_unsafe
+
+from .creation import DatabaseCreation
+from .pool import get_pool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """PostgreSQL с пулом соединений процесса.
+
+    Закрытие соединения возвращает его в пул, поэтому при CONN_MAX_AGE=0
+    запрос берёт готовое соединение вместо нового подключения. Размер
+    и ограничения пула задаются ключом POOL в настройках базы.
+    """
+
+    creation_class = DatabaseCreation
+    connection_pool = None
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        if self.alias == NO_DB_ALIAS:
+            # Служебное подключение без базы для создания тестовой БД.
+            self.connection_pool = None
+            return super().get_new_connection(conn_params)
+        self.connection_pool = get_pool(
+            self.alias, conn_params, self.settings_dict.get('POOL', {}))
+        connection = self.connection_pool.getconn()
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level = options['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+        psycopg2.extras.register_default_jsonb(
+            conn_or_curs=connection, loads=lambda x: x)
+        return connection
+
+    def _close(self):
+        if self.connection is None or self.connection_pool is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            if self.in_atomic_block:
+                # Обёртка хранит соединение до выхода из atomic, поэтому
+                # отдавать его другим потокам нельзя.
+                self.connection.close()
+            return self.connection_pool.putconn(self.connection)
@@ -0,0 +1,11 @@
+from django.db.backends.postgresql import creation
+
+from . import close_pools
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Свободные соединения пула к тестовой базе мешают её удалению.
+        close_pools()
+        super()._destroy_test_db(test_database_name, verbosity)
@@ -0,0 +1,165 @@
+import os
+import threading
+import time
+from weakref import WeakKeyDictionary
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2_pool import ThreadSafeConnectionPool
+
+from . import pools
+
+DEFAULTS = {
+    'MIN_SIZE': 1,
+    'MAX_SIZE': 10,
+    'TIMEOUT': 10,
+    'IDLE_TIMEOUT': 300,
+    'MAX_LIFETIME': 1800,
+    'HEALTH_CHECK': True,
+}
+GAUGES = ('size', 'idle', 'in_use', 'max_size')
+COUNTERS = ('checkouts', 'opened', 'expired', 'unhealthy', 'timeouts',
+            'wait_seconds')
+
+lock = threading.Lock()
+
+
+class DatabasePool:
+    """Пул соединений psycopg2_pool с ожиданием, проверкой и сроком жизни.
+
+    Если все MAX_SIZE соединений заняты, ждёт освобождения до TIMEOUT
+    секунд. При выдаче соединение проверяется запросом SELECT 1 и
+    закрывается, если живёт дольше MAX_LIFETIME секунд. Свободные
+    соединения закрываются через IDLE_TIMEOUT секунд. Соединение,
+    возвращённое в незавершённой или прерванной транзакции, закрывается:
+    следующий запрос получил бы чужую транзакцию.
+    """
+
+    def __init__(self, alias, dsn, options):
+        options = {**DEFAULTS, **options}
+        self.alias = alias
+        self.max_size = options['MAX_SIZE']
+        self.timeout = options['TIMEOUT']
+        self.max_lifetime = options['MAX_LIFETIME']
+        self.health_check = options['HEALTH_CHECK']
+        self.slots = threading.BoundedSemaphore(self.max_size)
+        self.lock = threading.Lock()
+        self.opened = WeakKeyDictionary()
+        self.stats = dict.fromkeys(COUNTERS, 0)
+        self.in_use = 0
+        self.pool = ThreadSafeConnectionPool(
+            minconn=options['MIN_SIZE'], maxconn=self.max_size,
+            idle_timeout=options['IDLE_TIMEOUT'], dsn=dsn)
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.stats[name] += value
+
+    def is_expired(self, conn):
+        """Срок жизни отсчитывается с первой выдачи соединения."""
+        with self.lock:
+            opened = self.opened.get(conn)
+            if opened is None:
+                self.opened[conn] = time.monotonic()
+                self.stats['opened'] += 1
+                return False
+        return (bool(self.max_lifetime)
+                and time.monotonic() - opened > self.max_lifetime)
+
+    def is_healthy(self, conn):
+        if conn.closed:
+            return False
+        if not self.health_check:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if not conn.autocommit:
+                conn.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def is_idle(self, conn):
+        return (conn.info.transaction_status
+                == extensions.TRANSACTION_STATUS_IDLE)
+
+    def discard(self, conn):
+        conn.close()
+        self.pool.putconn(conn)
+
+    def getconn(self):
+        start = time.monotonic()
+        if not self.slots.acquire(timeout=self.timeout):
+            self.count('timeouts')
+            raise psycopg2.OperationalError(
+                f'Нет свободных соединений в пуле {self.alias} '
+                f'за {self.timeout} с.')
+        self.count('wait_seconds', time.monotonic() - start)
+        try:
+            while True:
+                conn = self.pool.getconn()
+                if self.is_expired(conn):
+                    self.count('expired')
+                elif not self.is_healthy(conn):
+                    self.count('unhealthy')
+                else:
+                    break
+                self.discard(conn)
+        except BaseException:
+            self.slots.release()
+            raise
+        with self.lock:
+            self.stats['checkouts'] += 1
+            self.in_use += 1
+        return conn
+
+    def putconn(self, conn):
+        try:
+            if not conn.closed:
+                if self.is_expired(conn):
+                    self.count('expired')
+                    conn.close()
+                elif not self.is_idle(conn):
+                    self.count('unhealthy')
+                    conn.close()
+            self.pool.putconn(conn)
+        finally:
+            with self.lock:
+                self.in_use -= 1
+            self.slots.release()
+
+    def clear(self):
+        self.pool.clear()
+
+    def get_stats(self):
+        # connections_in_use в psycopg2_pool не учитывает соединения,
+        # выданные повторно, поэтому выданные считаются здесь.
+        with self.pool.lock:
+            idle = len(self.pool.idle_connections)
+        with self.lock:
+            return {
+                'size': idle + self.in_use,
+                'idle': idle,
+                'in_use': self.in_use,
+                'max_size': self.max_size,
+                **self.stats,
+            }
+
+
+def get_pool(alias, conn_params, options):
+    """Пул процесса для алиаса и параметров подключения.
+
+    После fork пулы родителя не используются: их сокеты общие с ним.
+    """
+    dsn = extensions.make_dsn(**conn_params)
+    key = (os.getpid(), alias, dsn)
+    pool = pools.get(key)
+    if pool is None:
+        with lock:
+            pool = pools.get(key)
+            if pool is None:
+                for stale in [item for item in pools if item[0] != key[0]]:
+                    del pools[stale]
+                pool = pools[key] = DatabasePool(alias, dsn, options)
+    return pool
@@ -0,0 +1,197 @@
+import hashlib
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+PIN_KEY = 'primary_pin_{}'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# Отставание реплики PostgreSQL в секундах. Когда всё полученное WAL
+# применено, реплика догнала основную базу, даже если та давно
+# не получала изменений.
+POSTGRESQL_LAG_SQL = '''
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery()
+            OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+        THEN 0
+        ELSE COALESCE(EXTRACT(
+            EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+'''
+# Реплика без схемы (например, пустой файл SQLite) непригодна для чтения.
+SCHEMA_SQL = 'SELECT 1 FROM django_migrations LIMIT 1'
+
+read_alias = ContextVar('read_alias', default=None)
+
+
+@contextmanager
+def use_primary():
+    """Читает из основной базы внутри блока.
+
+    Нужен для данных, которые кэшируются дольше запроса: прочитанные
+    с отстающей реплики, они остались бы устаревшими до следующей
+    инвалидации.
+    """
+    token = read_alias.set(None)
+    try:
+        yield
+    finally:
+        read_alias.reset(token)
+
+
+def get_client_key(request):
+    """Ключ клиента по токену или сессии.
+
+    Пользователь запроса ещё не аутентифицирован, когда выбирается база.
+    """
+    credentials = (request.META.get('HTTP_AUTHORIZATION')
+                   or request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+    if not credentials:
+        return None
+    return hashlib.sha256(credentials.encode()).hexdigest()
+
+
+def pin_to_primary(key):
+    cache.set(PIN_KEY.format(key), 1, settings.REPLICA_STICKY_SECONDS)
+
+
+def is_pinned(key):
+    return key is not None and cache.get(PIN_KEY.format(key)) is not None
+
+
+class ReplicaMonitor:
+    """Доступность и отставание реплик в текущем процессе.
+
+    Реплика проверяется не чаще раза в REPLICA_CHECK_INTERVAL секунд.
+    Недоступная или отстающая больше REPLICA_MAX_LAG секунд реплика
+    не получает запросы до следующей успешной проверки.
+    """
+
+    def __init__(self):
+        self.checked = {}
+
+    def get_replica(self):
+        replicas = [alias for alias in settings.DATABASE_REPLICAS
+                    if self.is_healthy(alias)]
+        return random.choice(replicas) if replicas else None
+
+    def is_healthy(self, alias):
+        checked_at, healthy = self.checked.get(alias, (None, False))
+        now = time.monotonic()
+        if (checked_at is not None
+                and now - checked_at < settings.REPLICA_CHECK_INTERVAL):
+            return healthy
+        lag = self.get_lag(alias)
+        healthy = lag is not None and lag <= settings.REPLICA_MAX_LAG
+        if not healthy and self.checked.get(alias, (None, True))[1]:
+            logger.warning('Реплика %s отключена: %s', alias,
+                           'недоступна' if lag is None
+                           else f'отставание {lag:.1f} с')
+        self.checked[alias] = (now, healthy)
+        return healthy
+
+    def get_lag(self, alias):
+        connection = connections[alias]
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(SCHEMA_SQL)
+                if connection.vendor != 'postgresql':
+                    return 0.0
+                cursor.execute(POSTGRESQL_LAG_SQL)
+                return float(cursor.fetchone()[0])
+        except DatabaseError:
+            logger.exception('Не удалось проверить реплику %s', alias)
+            return None
+
+    def mark_failed(self, alias):
+        if self.checked.get(alias, (None, True))[1]:
+            logger.warning('Реплика %s отключена после ошибки запроса', alias)
+        self.checked[alias] = (time.monotonic(), False)
+
+
+replica_monitor = ReplicaMonitor()
+
+
+class ReplicaRouter:
+    """Чтение с реплик для представлений с read_from_replica = True.
+
+    Запись и все остальные чтения идут в основную базу. Реплику выбирает
+    ReplicaRoutingMiddleware, поэтому вне HTTP-запросов, например
+    в командах управления, всё читается из основной базы.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = read_alias.get()
+        if (alias is None
+                or model._meta.app_label in settings.REPLICA_PRIMARY_APPS
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """Выбирает базу для чтения на время запроса.
+
+    После небезопасного запроса клиент на REPLICA_STICKY_SECONDS секунд
+    закрепляется за основной базой и видит свои изменения: избранное,
+    корзину, подписки. Ошибка базы при чтении с реплики отключает её,
+    а представление выполняется ещё раз с чтением из основной базы:
+    безопасный запрос ничего не изменил, поэтому повтор ему не вредит.
+    """
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = read_alias.set(None)
+        try:
+            response = self.get_response(request)
+        finally:
+            read_alias.reset(token)
+        if request.method not in SAFE_METHODS:
+            key = get_client_key(request)
+            if key is not None:
+                pin_to_primary(key)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = getattr(view_func, 'cls', view_func)
+        if (request.method in SAFE_METHODS
+                and getattr(view, 'read_from_replica', False)
+                and not is_pinned(get_client_key(request))):
+            read_alias.set(replica_monitor.get_replica())
+            request._replica_view = (view_func, view_args, view_kwargs)
+
+    def process_exception(self, request, exception):
+        alias = read_alias.get()
+        if (alias is None or not isinstance(exception, DatabaseError)
+                or not connections[alias].errors_occurred):
+            return None
+        replica_monitor.mark_failed(alias)
+        read_alias.set(None)
+        view_func, view_args, view_kwargs = request._replica_view
+        return view_func(request, *view_args, **view_kwargs)
@@ -1,4 +1,8 @@
+import atexit
 import os
+import shutil
+import sys
+import tempfile
 from datetime import timedelta
 from pathlib import Path
 
@@ -12,6 +16,8 @@ SECRET_KEY = 'django-insecure-ich-z26^6u-)1rr%0=c0urob2ra2h06^k41evpp8gwv5fjq)uo
 
 DEBUG = False
 
+TESTING = sys.argv[1:2] == ['test'] or 'pytest' in sys.modules
+
 ALLOWED_HOSTS = ['*']
 
 
@@ -33,6 +39,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.ServerTimingMiddleware',
+    'api.queries.QueryInspectorMiddleware',
+    'foodgram.routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -64,14 +73,69 @@ TEMPLATES = [
 WSGI_APPLICATION = 'foodgram.wsgi.application'
 
 
+DB_ENGINE = os.getenv('DB_ENGINE', default='django.db.backends.postgresql')
+
+DB_POOLED = DB_ENGINE == 'foodgram.postgresql_pool'
+
 DATABASES = {
     'default': {
-        'ENGINE': os.getenv('DB_ENGINE', default='django.db.backends.postgresql'),
+        'ENGINE': DB_ENGINE,
         'NAME': os.getenv('DB_NAME', default='foodgram'),
         'USER': os.getenv('POSTGRES_USER', default='foodgram_user'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='08082001'),
         'HOST': os.getenv('DB_HOST', default='127.0.0.1'),
-        'PORT': os.getenv('DB_PORT', default=5432)
+        'PORT': os.getenv('DB_PORT', default=5432),
+        'CONN_MAX_AGE': int(os.getenv(
+            'DB_CONN_MAX_AGE', default=0 if DB_POOLED else 60)),
+        'POOL': {
+            'MIN_SIZE': int(os.getenv('DB_POOL_MIN_SIZE', default=1)),
+            'MAX_SIZE': int(os.getenv('DB_POOL_MAX_SIZE', default=10)),
+            'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', default=10)),
+            'IDLE_TIMEOUT': int(os.getenv('DB_POOL_IDLE_TIMEOUT', default=300)),
+            'MAX_LIFETIME': int(os.getenv('DB_POOL_MAX_LIFETIME', default=1800)),
+            'HEALTH_CHECK': os.getenv('DB_POOL_HEALTH_CHECK', default='1') == '1',
+        },
+    }
+}
+
+DATABASE_REPLICAS = []
+
+for number, address in enumerate(
+        filter(None, os.getenv('DB_REPLICAS', default='').split(',')), 1):
+    alias = f'replica_{number}'
+    if 'sqlite' in DB_ENGINE:
+        location = {'NAME': address}
+    else:
+        host, _, port = address.partition(':')
+        location = {'HOST': host, 'PORT': port or DATABASES['default']['PORT']}
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        **location,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['foodgram.routers.ReplicaRouter']
+
+REPLICA_STICKY_SECONDS = int(os.getenv('DB_REPLICA_STICKY_SECONDS', default=15))
+
+REPLICA_MAX_LAG = float(os.getenv('DB_REPLICA_MAX_LAG', default=5))
+
+REPLICA_CHECK_INTERVAL = 5
+
+REPLICA_PRIMARY_APPS = ('authtoken', 'sessions')
+
+# Кэш общий для всех процессов: в нём версии кэша ответов, состояние
+# пользователей и закрепление за основной базой. LocMemCache подходит
+# только для одного процесса, например для тестов.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache' if TESTING
+            else 'django.core.cache.backends.memcached.PyMemcacheCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION',
+                              default='' if TESTING else 'memcached:11211'),
     }
 }
 
@@ -109,6 +173,45 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'backend_static')
 MEDIA_URL = '/backend_media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'backend_media')
 
+RECIPE_SEARCH_CONFIG = 'russian'
+
+RECIPE_IMAGE_ASYNC = os.getenv('RECIPE_IMAGE_ASYNC', default='1') == '1'
+
+RECIPE_IMAGE_MAX_SIZE = 10 * 1024 * 1024
+
+RECIPE_IMAGE_VARIANTS = {
+    'card': {'geometry': '480x360', 'quality': 80},
+    'detail': {'geometry': '960x720', 'quality': 85},
+    'preview': {'geometry': '160x120', 'quality': 75},
+}
+
+RECIPE_SIMILAR_COUNT = 12
+
+RECIPE_SIMILAR_TAG_WEIGHT = 0.5
+
+SERVER_TIMING = os.getenv('SERVER_TIMING', default='0') == '1'
+
+if TESTING:
+    # Снимки тестов не должны попасть в метрики сервера на том же хосте.
+    METRICS_DIR = tempfile.mkdtemp(prefix='foodgram_metrics_')
+    atexit.register(shutil.rmtree, METRICS_DIR, ignore_errors=True)
+else:
+    METRICS_DIR = os.getenv(
+        'METRICS_DIR',
+        default=os.path.join(tempfile.gettempdir(), 'foodgram_metrics')
+    )
+
+METRICS_FLUSH_INTERVAL = 5
+
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+QUERY_INSPECTION = os.getenv(
+    'QUERY_INSPECTION',
+    default='raise' if TESTING else 'warn' if DEBUG else ''
+)
+
+QUERY_REPEAT_THRESHOLD = 3
+
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -156,6 +259,11 @@ EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
 CORS_ORIGIN_ALLOW_ALL = True
 
 CORS_URLS_REGEX = r'^/api/.*$'
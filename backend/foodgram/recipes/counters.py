@@ -0,0 +1,32 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from users.models import Follow, User
+
+from .models import FavoritedRecipe, Recipe, ShoppingCart
+
+COUNTERS = (
+    (Recipe, 'favorites_count', FavoritedRecipe, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'author'),
+)
+
+
+def count_related(related, field):
+    """Подзапрос с числом строк related, ссылающихся на текущую строку."""
+    return Coalesce(Subquery(
+        related.objects
+        .filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(total=Count('pk'))
+        .values('total')
+    ), 0)
+
+
+def get_drift(model, counter, related, field):
+    """Строки, у которых счётчик counter разошёлся с таблицей related."""
+    return (model.objects
+            .annotate(actual=count_related(related, field))
+            .exclude(**{counter: F('actual')}))
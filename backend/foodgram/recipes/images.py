@@ -0,0 +1,146 @@
+import logging
+import os
+import uuid
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from .models import Recipe, RecipeImageJob
+
+IMAGE_FORMATS = {
+    'JPEG': 'jpg',
+    'PNG': 'png',
+    'GIF': 'gif',
+    'WEBP': 'webp',
+}
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'recipes/variants/'
+
+
+def open_image(image):
+    with image.open('rb'):
+        source = Image.open(image)
+        source.load()
+    return source
+
+
+def save_variants(image, source=None):
+    """Сохраняет уменьшенные копии изображения рецепта в формате WebP.
+
+    Возвращает значение для Recipe.image_variants: имена файлов копий
+    по размерам и имя исходного изображения под ключом source.
+    """
+    if source is None:
+        source = open_image(image)
+    source = ImageOps.exif_transpose(source)
+    if source.mode not in ('RGB', 'RGBA'):
+        source = source.convert(
+            'RGBA' if source.mode in ('LA', 'PA') or 'transparency'
+            in source.info else 'RGB')
+    stem = os.path.splitext(os.path.basename(image.name))[0]
+    variants = {'source': image.name}
+    for variant, options in settings.RECIPE_IMAGE_VARIANTS.items():
+        size = tuple(map(int, options['geometry'].split('x')))
+        buffer = BytesIO()
+        ImageOps.fit(source, size, Image.Resampling.LANCZOS).save(
+            buffer, 'WEBP', quality=options['quality'])
+        variants[variant] = image.storage.save(
+            f'{VARIANTS_DIR}{stem}_{variant}.webp',
+            ContentFile(buffer.getvalue()))
+    return variants
+
+
+def get_variant_names(variants):
+    return [name for key, name in variants.items() if key != 'source']
+
+
+def delete_files(storage, names):
+    """Удаляет заменённые файлы после фиксации транзакции.
+
+    При откате рецепт продолжает ссылаться на них, поэтому удалять
+    раньше нельзя.
+    """
+    names = [name for name in names if name]
+    if not names:
+        return
+
+    def delete():
+        for name in names:
+            try:
+                storage.delete(name)
+            except OSError:
+                logger.exception('Не удалось удалить файл %s', name)
+
+    transaction.on_commit(delete)
+
+
+def get_variant_url(image, variant):
+    """Ссылка на сохранённую копию изображения без обращения к базе.
+
+    Если копии ещё нет или она построена по прежнему изображению,
+    возвращается ссылка на оригинал.
+    """
+    variants = image.instance.image_variants
+    if variants.get('source') == image.name and variant in variants:
+        return image.storage.url(variants[variant])
+    return image.url
+
+
+def update_variants(recipe, force=False):
+    """Строит копии изображения, если они устарели или их нет.
+
+    Прежние копии удаляются из хранилища.
+    """
+    if not recipe.image or (
+            not force
+            and recipe.image_variants.get('source') == recipe.image.name):
+        return
+    stale = get_variant_names(recipe.image_variants)
+    recipe.image_variants = save_variants(recipe.image)
+    Recipe.objects.filter(pk=recipe.pk).update(
+        image_variants=recipe.image_variants)
+    delete_files(recipe.image.storage, stale)
+
+
+def enqueue_image(recipe, data):
+    """Ставит изображение рецепта в очередь на обработку.
+
+    При RECIPE_IMAGE_ASYNC = False обрабатывает его сразу.
+    """
+    job, _ = RecipeImageJob.objects.update_or_create(
+        recipe=recipe, defaults={'data': data})
+    Recipe.objects.filter(pk=recipe.pk).update(
+        image_status=Recipe.IMAGE_PENDING)
+    recipe.image_status = Recipe.IMAGE_PENDING
+    if not settings.RECIPE_IMAGE_ASYNC:
+        process_image_job(job)
+
+
+def process_image_job(job):
+    """Проверяет загруженное изображение и подставляет его в рецепт.
+
+    Прежнее изображение и его копии удаляются из хранилища.
+    """
+    recipe = job.recipe
+    try:
+        image = Image.open(BytesIO(job.data))
+        image.load()
+        extension = IMAGE_FORMATS[image.format]
+    except (OSError, KeyError, ValueError, Image.DecompressionBombError):
+        recipe.image_status = Recipe.IMAGE_FAILED
+        recipe.save(update_fields=('image_status', 'updated_at'))
+    else:
+        stale = [recipe.image.name,
+                 *get_variant_names(recipe.image_variants)]
+        recipe.image.save(f'{uuid.uuid4()}.{extension}',
+                          ContentFile(job.data), save=False)
+        recipe.image_variants = save_variants(recipe.image, image)
+        recipe.image_status = Recipe.IMAGE_READY
+        recipe.save(update_fields=('image', 'image_variants', 'image_status',
+                                   'updated_at'))
+        delete_files(recipe.image.storage, stale)
+    job.delete()
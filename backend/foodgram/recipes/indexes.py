@@ -0,0 +1,17 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.db import models
+
+
+class SearchVectorIndex(GinIndex):
+    """GIN-индекс поискового вектора.
+
+    В SQLite поиск идёт по таблице FTS5, а GIN не поддерживается, поэтому
+    там создаётся обычный индекс: иначе пересоздание таблицы рецептов
+    в миграциях падало бы на USING gin.
+    """
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.vendor == 'postgresql':
+            return super().create_sql(model, schema_editor, using, **kwargs)
+        return models.Index.create_sql(self, model, schema_editor, using,
+                                       **kwargs)
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.similarity import refresh_neighbors
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает похожие рецепты по общим ингредиентам и тегам. '
+            'По умолчанию обрабатывает только изменившиеся рецепты.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Пересчитать соседей всех рецептов.')
+        parser.add_argument(
+            '--batch-size', type=int, default=256,
+            help='Сколько рецептов сравнивать со всеми за один шаг.')
+        parser.add_argument(
+            '--interval', type=float,
+            help='Повторять пересчёт с этой паузой, в секундах.')
+
+    def handle(self, *args, **options):
+        while True:
+            updated = refresh_neighbors(full=options['full'],
+                                        batch_size=options['batch_size'])
+            if updated or options['interval'] is None:
+                self.stdout.write(f'Пересчитано рецептов: {updated}')
+            if options['interval'] is None:
+                return
+            options['full'] = False
+            time.sleep(options['interval'])
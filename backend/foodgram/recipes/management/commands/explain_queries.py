@@ -0,0 +1,102 @@
+import json
+import re
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from recipes.models import (FavoritedRecipe, Ingredient, Recipe, ShoppingCart,
+                            ShoppingListItem, Tag, TaggedRecipe)
+from users.models import Follow, User
+
+HOT_TABLES = (
+    FavoritedRecipe._meta.db_table,
+    ShoppingCart._meta.db_table,
+    TaggedRecipe._meta.db_table,
+    Follow._meta.db_table,
+    ShoppingListItem._meta.db_table,
+    Ingredient._meta.db_table,
+)
+FULL_SCAN_PATTERNS = {
+    'postgresql': r'Seq Scan on "?{table}"?\b',
+    'sqlite': r'\bSCAN {table}\s*$',
+}
+
+
+def get_queries(user):
+    author = (Follow.objects.filter(user=user)
+              .values_list('author', flat=True).first() or user.pk)
+    tags = list(Tag.objects.values_list('slug', flat=True)[:2])
+    return {
+        'recipe_list': Recipe.objects.with_related()[:6],
+        'recipe_favorited': Recipe.objects.filter(following_users=user),
+        'recipe_in_cart': Recipe.objects.filter(shopping_users=user),
+        'recipe_tags': Recipe.objects.filter(tags__slug__in=tags),
+        'is_subscribed': Follow.objects.filter(user=user, author=author),
+        'subscriptions': User.objects.filter(follower__user=user),
+        'ingredient_prefix': Ingredient.objects.filter(
+            name__startswith='аб'),
+        'shopping_list': ShoppingListItem.objects.filter(user=user),
+    }
+
+
+class Command(BaseCommand):
+    help = ('Выводит планы выполнения основных запросов и проверяет, '
+            'что горячие таблицы читаются по индексам.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int,
+                            help='id пользователя для запросов.')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Сколько раз выполнить каждый запрос.')
+        parser.add_argument('--output', help='Файл для результатов в JSON.')
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Завершиться с ошибкой при полном сканировании '
+                 'горячих таблиц.')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(pk=options['user']).first()
+        if user is None:
+            user = User.objects.order_by('pk').first()
+        if user is None:
+            raise CommandError('В базе нет пользователей.')
+        pattern = FULL_SCAN_PATTERNS.get(connection.vendor)
+        results = {}
+        problems = []
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                # На маленьких таблицах планировщик предпочитает Seq Scan,
+                # поэтому проверяем, что индекс вообще может быть выбран.
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            for name, queryset in get_queries(user).items():
+                plan = queryset.explain()
+                timings = []
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    list(queryset.all())
+                    timings.append((time.perf_counter() - start) * 1000)
+                scans = [
+                    table for table in HOT_TABLES
+                    if pattern and re.search(pattern.format(table=table),
+                                             plan, re.MULTILINE)
+                ]
+                results[name] = {
+                    'plan': plan,
+                    'median_ms': round(statistics.median(timings), 3),
+                    'full_scans': scans,
+                }
+                problems.extend(f'{name}: {table}' for table in scans)
+                self.stdout.write(self.style.MIGRATE_HEADING(
+                    f'{name}: {results[name]["median_ms"]} мс'))
+                self.stdout.write(plan)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
+        if problems:
+            message = 'Полное сканирование: ' + ', '.join(problems)
+            if options['check']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
@@ -0,0 +1,53 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.synthetic import SyntheticDataset
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими пользователями, рецептами, '
+            'подписками, избранным и корзинами для нагрузочных тестов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--follows', type=int, default=10,
+                            help='Среднее число подписок у пользователя.')
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='Среднее число рецептов в избранном.')
+        parser.add_argument('--carts', type=int, default=5,
+                            help='Среднее число рецептов в корзине.')
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Показатель закона Ципфа для популярности авторов, '
+                 'рецептов и ингредиентов.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Число процессов загрузки (в SQLite всегда один).')
+        parser.add_argument(
+            '--ingredients',
+            help='Каталог ингредиентов, по умолчанию data/ingredients.json.')
+        parser.add_argument(
+            '--skip-similar', action='store_true',
+            help='Не пересчитывать похожие рецепты: их обработает '
+                 'build_similar_recipes.')
+
+    def handle(self, *args, **options):
+        if options['users'] < 2 or options['recipes'] < 1:
+            raise CommandError('Нужны хотя бы два пользователя и один рецепт.')
+        if options['workers'] < 1:
+            raise CommandError('--workers должен быть не меньше 1.')
+        start = time.perf_counter()
+        SyntheticDataset(
+            users=options['users'], recipes=options['recipes'],
+            follows=options['follows'], favorites=options['favorites'],
+            carts=options['carts'], seed=options['seed'],
+            skew=options['skew'], workers=options['workers'],
+            ingredients=options['ingredients'],
+            similar=not options['skip_similar'], log=self.stdout.write
+        ).generate()
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.perf_counter() - start:.1f} с.'))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import update_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Строит уменьшенные копии изображений рецептов, у которых '
+            'их нет или они построены по прежнему изображению.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Перестроить копии всех изображений, например после '
+                 'изменения RECIPE_IMAGE_VARIANTS.')
+
+    def handle(self, *args, **options):
+        recipes = (Recipe.objects.exclude(image='').order_by('pk')
+                   .only('pk', 'image', 'image_variants'))
+        built = failed = 0
+        for recipe in recipes.iterator():
+            if (not options['force'] and recipe.image_variants.get('source')
+                    == recipe.image.name):
+                continue
+            try:
+                update_variants(recipe, force=options['force'])
+            except (OSError, ValueError) as error:
+                failed += 1
+                self.stderr.write(f'Рецепт {recipe.pk}: {error}')
+            else:
+                built += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Копии построены для {built} рецептов, ошибок: {failed}.'))
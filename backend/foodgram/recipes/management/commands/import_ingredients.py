@@ -0,0 +1,95 @@
+import csv
+import json
+from itertools import islice
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import CatalogVersion, Ingredient
+
+READ_SIZE = 64 * 1024
+
+
+def iter_json_array(file):
+    """Читает элементы JSON-массива по одному, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(READ_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидался JSON-массив.')
+    buffer = buffer[1:]
+    eof = False
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            if eof:
+                raise CommandError('Некорректный JSON.')
+            chunk = file.read(READ_SIZE)
+            eof = not chunk
+            buffer += chunk
+            continue
+        yield item
+        buffer = buffer[end:]
+
+
+def read_json(file):
+    for item in iter_json_array(file):
+        if 'model' in item:
+            if item['model'].lower() != 'recipes.ingredient':
+                continue
+            item = item['fields']
+        yield item['name'], item['measurement_unit']
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if row:
+            yield row[0], row[1]
+
+
+READERS = {
+    '.json': read_json,
+    '.csv': read_csv,
+}
+
+
+class Command(BaseCommand):
+    help = ('Загружает ингредиенты из CSV или JSON пачками, пропуская '
+            'уже существующие.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к .csv или .json файлу.')
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Размер пачки для bulk_create.')
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        reader = READERS.get(path.suffix.lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только .csv и .json файлы.')
+        batch_size = options['batch_size']
+        before = Ingredient.objects.count()
+        processed = 0
+        with path.open(encoding='utf-8') as file:
+            rows = (
+                Ingredient(name=name.strip(),
+                           measurement_unit=measurement_unit.strip())
+                for name, measurement_unit in reader(file)
+            )
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                Ingredient.objects.bulk_create(
+                    batch, batch_size=batch_size, ignore_conflicts=True)
+                processed += len(batch)
+                self.stdout.write(f'Обработано строк: {processed}')
+        added = Ingredient.objects.count() - before
+        if added:
+            CatalogVersion.objects.bump(CatalogVersion.INGREDIENTS)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: обработано {processed}, добавлено {added}.'))
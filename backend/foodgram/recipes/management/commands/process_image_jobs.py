@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.images import process_image_job
+from recipes.models import RecipeImageJob
+
+
+class Command(BaseCommand):
+    help = 'Обрабатывает очередь загруженных изображений рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Обработать текущую очередь и завершиться.')
+        parser.add_argument(
+            '--interval', type=float, default=1.0,
+            help='Пауза между опросами пустой очереди, в секундах.')
+
+    def handle(self, *args, **options):
+        while True:
+            processed = self.process_next()
+            if processed:
+                continue
+            if options['once']:
+                return
+            time.sleep(options['interval'])
+
+    def process_next(self):
+        with transaction.atomic():
+            job = (RecipeImageJob.objects
+                   .select_for_update(skip_locked=True)
+                   .select_related('recipe')
+                   .first())
+            if job is None:
+                return False
+            process_image_job(job)
+        self.stdout.write(f'Обработано изображение рецепта {job.recipe_id}')
+        return True
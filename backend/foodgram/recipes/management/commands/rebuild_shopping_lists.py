@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import ShoppingListItem
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = ('Сверяет списки покупок с корзинами и пересобирает их '
+            'с нуля.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только сверить, ничего не записывая.')
+
+    def handle(self, *args, **options):
+        live = {
+            (user, ingredient): total
+            for user, ingredient, total
+            in ShoppingListItem.objects.live().iterator()
+        }
+        stored = {
+            (user, ingredient): amount
+            for user, ingredient, amount
+            in ShoppingListItem.objects.values_list(
+                'user', 'ingredient', 'amount').iterator()
+        }
+        mismatches = [
+            key for key in {*live, *stored}
+            if live.get(key) != stored.get(key)
+        ]
+        self.stdout.write(
+            f'Позиций: {len(live)}, расхождений: {len(mismatches)}')
+        if options['check']:
+            if mismatches:
+                raise CommandError('Списки покупок расходятся с корзинами.')
+            return
+        with transaction.atomic():
+            ShoppingListItem.objects.all().delete()
+            ShoppingListItem.objects.bulk_create(
+                (ShoppingListItem(user_id=user, ingredient_id=ingredient,
+                                  amount=total)
+                 for (user, ingredient), total in live.items()),
+                batch_size=BATCH_SIZE
+            )
+        self.stdout.write(self.style.SUCCESS('Списки покупок пересобраны.'))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.counters import COUNTERS, count_related, get_drift
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = ('Сверяет счётчики избранного, корзин, рецептов и подписчиков '
+            'с таблицами связей и исправляет расхождения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только сверить, ничего не записывая.')
+
+    def handle(self, *args, **options):
+        total = 0
+        for model, counter, related, field in COUNTERS:
+            drifted = list(get_drift(model, counter, related, field)
+                           .values_list('pk', flat=True))
+            total += len(drifted)
+            self.stdout.write(
+                f'{model._meta.model_name}.{counter}: '
+                f'расхождений {len(drifted)}')
+            if options['check'] or not drifted:
+                continue
+            for start in range(0, len(drifted), BATCH_SIZE):
+                with transaction.atomic():
+                    model.objects.filter(
+                        pk__in=drifted[start:start + BATCH_SIZE]
+                    ).update(**{counter: count_related(related, field)})
+        if options['check']:
+            if total:
+                raise CommandError('Счётчики расходятся с таблицами связей.')
+            return
+        self.stdout.write(self.style.SUCCESS('Счётчики сверены.'))
@@ -0,0 +1,48 @@
+# Generated by Django 3.2.17 on 2026-10-18 18:44
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    duplicates = (Ingredient.objects
+                  .values('name', 'measurement_unit')
+                  .annotate(keep=Min('id'), total=Count('id'))
+                  .filter(total__gt=1))
+    for duplicate in duplicates:
+        keep = duplicate['keep']
+        others = list(Ingredient.objects
+                      .filter(name=duplicate['name'],
+                              measurement_unit=duplicate['measurement_unit'])
+                      .exclude(id=keep)
+                      .values_list('id', flat=True))
+        IngredientRecipe.objects.filter(
+            ingredient__in=others).update(ingredient=keep)
+        for item in ShoppingListItem.objects.filter(ingredient__in=others):
+            kept, created = ShoppingListItem.objects.get_or_create(
+                user_id=item.user_id, ingredient_id=keep,
+                defaults={'amount': item.amount})
+            if not created:
+                kept.amount += item.amount
+                kept.save()
+            item.delete()
+        Ingredient.objects.filter(id__in=others).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipe_image_job'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_ingredients,
+                             migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
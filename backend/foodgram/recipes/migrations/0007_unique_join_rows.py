@@ -0,0 +1,64 @@
+# Generated by Django 3.2.17 on 2026-10-18 18:45
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+UNIQUE_FIELDS = (
+    ('FavoritedRecipe', ('user', 'recipe')),
+    ('ShoppingCart', ('user', 'recipe')),
+    ('TaggedRecipe', ('recipe', 'tag')),
+)
+
+
+def remove_duplicates(apps, schema_editor):
+    for model_name, fields in UNIQUE_FIELDS:
+        model = apps.get_model('recipes', model_name)
+        duplicates = (model.objects.values(*fields)
+                      .annotate(keep=Min('id'), total=Count('id'))
+                      .filter(total__gt=1))
+        for duplicate in duplicates:
+            (model.objects
+             .filter(**{field: duplicate[field] for field in fields})
+             .exclude(id=duplicate['keep'])
+             .delete())
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    duplicates = (IngredientRecipe.objects.values('recipe', 'ingredient')
+                  .annotate(keep=Min('id'), total=Count('id'),
+                            amount=Sum('amount'))
+                  .filter(total__gt=1))
+    for duplicate in duplicates:
+        rows = IngredientRecipe.objects.filter(
+            recipe=duplicate['recipe'], ingredient=duplicate['ingredient'])
+        rows.exclude(id=duplicate['keep']).delete()
+        rows.update(amount=duplicate['amount'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_unique_ingredient'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['name'], name='ingredient_name_prefix_idx', opclasses=['text_pattern_ops']),
+        ),
+        migrations.AddConstraint(
+            model_name='favoritedrecipe',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_favorite'),
+        ),
+        migrations.AddConstraint(
+            model_name='ingredientrecipe',
+            constraint=models.UniqueConstraint(fields=('recipe', 'ingredient'), name='unique_recipe_ingredient'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcart',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_shopping_cart'),
+        ),
+        migrations.AddConstraint(
+            model_name='taggedrecipe',
+            constraint=models.UniqueConstraint(fields=('recipe', 'tag'), name='unique_recipe_tag'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 3.2.17 on 2026-10-18 19:43
+
+from django.db import migrations, models
+
+import recipes.indexes
+
+
+# В PostgreSQL GIN-индекс уже создан миграцией 0008, здесь он только
+# попадает в состояние миграций. В остальных базах SearchVectorIndex
+# создаёт обычный индекс, который потом пересоздаётся вместе с таблицей.
+def get_plain_index():
+    return models.Index(fields=['search_vector'],
+                        name='recipe_search_vector_idx')
+
+
+def add_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        schema_editor.add_index(apps.get_model('recipes', 'Recipe'),
+                                get_plain_index())
+
+
+def remove_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        schema_editor.remove_index(apps.get_model('recipes', 'Recipe'),
+                                   get_plain_index())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_recipe_search_triggers'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='recipe',
+                    index=recipes.indexes.SearchVectorIndex(
+                        fields=['search_vector'],
+                        name='recipe_search_vector_idx'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(add_index, remove_index),
+            ],
+        ),
+    ]
@@ -1,7 +1,70 @@
+from itertools import islice
+
+from django.contrib.postgres.search import SearchVectorField
+from django.core.cache import cache
 from django.core.validators import RegexValidator
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import F, Prefetch, Q, Sum, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from foodgram.routers import use_primary
+from users.models import Follow, User
+
+from .indexes import SearchVectorIndex
+
+CATALOG_VERSIONS_KEY = 'catalog_versions'
+CATALOG_VERSIONS_TIMEOUT = 60 * 60
+
+
+class CatalogVersionQuerySet(models.QuerySet):
+
+    def bump(self, name):
+        updated = self.filter(name=name).update(version=F('version') + 1,
+                                                updated_at=timezone.now())
+        if not updated:
+            self.get_or_create(name=name)
+        # Как и состояние пользователя, сбрасывается сразу и после коммита.
+        cache.delete(CATALOG_VERSIONS_KEY)
+        transaction.on_commit(lambda: cache.delete(CATALOG_VERSIONS_KEY))
 
-from users.models import User
+    def get_cached(self):
+        """Версии справочников по имени из общего кэша.
+
+        База читается только при промахе кэша, иначе проверка свежести
+        индекса ингредиентов стоила бы запроса на каждое нажатие клавиши.
+        """
+        versions = cache.get(CATALOG_VERSIONS_KEY)
+        if versions is None:
+            with use_primary():
+                versions = {version.name: version for version in self.all()}
+            cache.set(CATALOG_VERSIONS_KEY, versions,
+                      CATALOG_VERSIONS_TIMEOUT)
+        return versions
+
+
+class CatalogVersion(models.Model):
+    TAGS = 'tags'
+    INGREDIENTS = 'ingredients'
+    NAMES = (
+        (TAGS, 'Теги'),
+        (INGREDIENTS, 'Ингредиенты'),
+    )
+
+    name = models.CharField('Справочник', max_length=32,
+                            choices=NAMES, unique=True)
+    version = models.PositiveIntegerField('Версия', default=1)
+    updated_at = models.DateTimeField('Дата изменения', auto_now=True)
+
+    objects = CatalogVersionQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Версия справочника'
+        verbose_name_plural = 'Версии справочников'
+
+    def __str__(self):
+        return f'{self.name} v{self.version}'
 
 
 class Ingredient(models.Model):
@@ -16,6 +79,14 @@ class Ingredient(models.Model):
 
     class Meta:
         ordering = ['name']
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'measurement_unit'],
+                                    name='unique_ingredient'),
+        ]
+        indexes = [
+            models.Index(fields=['name'], opclasses=['text_pattern_ops'],
+                         name='ingredient_name_prefix_idx'),
+        ]
         verbose_name = 'Ингридиент'
         verbose_name_plural = 'Ингридиенты'
 
@@ -55,13 +126,70 @@ class Tag(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    def with_related(self):
+        """Рецепты с автором, тегами и ингредиентами.
+
+        Количество запросов не зависит от числа рецептов на странице.
+        Флаги пользователя сериализаторы берут из recipes.user_state.
+        """
+        return self.select_related('author').prefetch_related(
+            'tags',
+            Prefetch('ingredient_list',
+                     queryset=IngredientRecipe.objects.select_related(
+                         'ingredient')),
+        )
+
+    def newest_per_author(self, authors, limit):
+        """Не больше limit новых рецептов каждого из authors.
+
+        Рецепты нумеруются оконной функцией внутри автора, нумерация
+        считается только по рецептам authors. Django 3.2 не умеет
+        фильтровать по оконным функциям, поэтому отбор по номеру
+        делается во внешнем подзапросе.
+        """
+        ranked = (Recipe.objects
+                  .filter(author__in=authors)
+                  .annotate(position=Window(
+                      RowNumber(), partition_by=[F('author')],
+                      order_by=[F('pub_date').desc(), F('id').desc()]))
+                  .order_by()
+                  .values('id', 'position'))
+        sql, params = ranked.query.sql_with_params()
+        quote = connection.ops.quote_name
+        return self.filter(pk__in=RawSQL(
+            f'SELECT {quote("ranked")}.{quote("id")} FROM ({sql}) '
+            f'{quote("ranked")} WHERE {quote("ranked")}.'
+            f'{quote("position")} <= %s',
+            (*params, limit)))
+
+
 class Recipe(models.Model):
+    IMAGE_PENDING = 'pending'
+    IMAGE_READY = 'ready'
+    IMAGE_FAILED = 'failed'
+    IMAGE_STATUSES = (
+        (IMAGE_PENDING, 'Обрабатывается'),
+        (IMAGE_READY, 'Готово'),
+        (IMAGE_FAILED, 'Ошибка обработки'),
+    )
+
     author = models.ForeignKey(User, verbose_name='Автор',
                                on_delete=models.CASCADE,
                                related_name='recipes')
     name = models.CharField('Название', max_length=256)
     image = models.ImageField('Изображение',
-                              upload_to='recipes/')
+                              upload_to='recipes/',
+                              blank=True)
+    image_status = models.CharField('Состояние изображения',
+                                    max_length=16,
+                                    choices=IMAGE_STATUSES,
+                                    default=IMAGE_READY)
+    image_variants = models.JSONField('Уменьшенные копии изображения',
+                                      default=dict,
+                                      blank=True,
+                                      editable=False)
     text = models.TextField('Описание рецепта')
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -87,15 +215,100 @@ class Recipe(models.Model):
         'Дата публикации',
         auto_now_add=True
     )
+    updated_at = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True
+    )
+    search_vector = SearchVectorField(
+        'Поисковый вектор',
+        null=True,
+        editable=False
+    )
+    favorites_count = models.PositiveIntegerField(
+        'В избранном',
+        default=0,
+        editable=False
+    )
+    in_carts_count = models.PositiveIntegerField(
+        'В корзинах',
+        default=0,
+        editable=False
+    )
+    neighbors_stale = models.BooleanField(
+        'Похожие рецепты устарели',
+        default=True,
+        editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='recipe_pub_date_id_idx'),
+            models.Index(fields=['id'], name='recipe_neighbors_stale_idx',
+                         condition=Q(neighbors_stale=True)),
+            models.Index(fields=['-favorites_count', '-in_carts_count',
+                                 '-pub_date', '-id'],
+                         name='recipe_popular_idx'),
+            SearchVectorIndex(fields=['search_vector'],
+                              name='recipe_search_vector_idx'),
+        ]
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
     def __str__(self) -> str:
         return self.name
 
+    def get_ingredient_amounts(self):
+        return dict(self.ingredient_list
+                    .values('ingredient')
+                    .annotate(total=Sum('amount'))
+                    .values_list('ingredient', 'total'))
+
+
+class RecipeImageJob(models.Model):
+    recipe = models.OneToOneField(Recipe, verbose_name='Рецепт',
+                                  related_name='image_job',
+                                  on_delete=models.CASCADE)
+    data = models.BinaryField('Загруженное изображение')
+    created = models.DateTimeField('Дата загрузки', auto_now_add=True)
+
+    class Meta:
+        ordering = ['created']
+        verbose_name = 'Обработка изображения'
+        verbose_name_plural = 'Обработка изображений'
+
+    def __str__(self):
+        return f'{self.recipe}: {self.created}'
+
+
+class RecipeNeighbor(models.Model):
+    recipe = models.ForeignKey(Recipe, verbose_name='Рецепт',
+                               related_name='neighbors',
+                               on_delete=models.CASCADE)
+    neighbor = models.ForeignKey(Recipe, verbose_name='Похожий рецепт',
+                                 related_name='neighbor_of',
+                                 on_delete=models.CASCADE)
+    score = models.FloatField('Сходство')
+
+    class Meta:
+        ordering = ['recipe', '-score']
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(fields=['recipe', 'neighbor'],
+                                    name='unique_recipe_neighbor'),
+        ]
+        indexes = [
+            models.Index(fields=['recipe', '-score'],
+                         name='recipe_neighbor_score_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} ~ {self.neighbor}: {self.score:.3f}'
+
 
 class IngredientRecipe(models.Model):
     ingredient = models.ForeignKey(
@@ -109,6 +322,10 @@ class IngredientRecipe(models.Model):
     amount = models.IntegerField('Количество')
 
     class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['recipe', 'ingredient'],
+                                    name='unique_recipe_ingredient'),
+        ]
         verbose_name = 'Ингедиент и рецепт'
         verbose_name_plural = 'Ингредиенты и рецепты'
 
@@ -121,6 +338,10 @@ class TaggedRecipe(models.Model):
         on_delete=models.CASCADE)
 
     class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['recipe', 'tag'],
+                                    name='unique_recipe_tag'),
+        ]
         verbose_name = 'Тег и рецепт'
         verbose_name_plural = 'Теги и рецепты'
 
@@ -134,6 +355,10 @@ class FavoritedRecipe(models.Model):
                                on_delete=models.CASCADE)
 
     class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'recipe'],
+                                    name='unique_favorite'),
+        ]
         verbose_name = 'Избранный рецепт'
         verbose_name_plural = 'Избранные рецепты'
 
@@ -147,5 +372,186 @@ class ShoppingCart(models.Model):
                                on_delete=models.CASCADE)
 
     class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'recipe'],
+                                    name='unique_shopping_cart'),
+        ]
         verbose_name = 'Продуктовая корзина'
         verbose_name_plural = 'Продуктовые корзины'
+
+
+class ShoppingListItemQuerySet(models.QuerySet):
+
+    def add_recipe(self, user, recipe):
+        self.apply((user.pk,), recipe.get_ingredient_amounts())
+
+    def remove_recipe(self, user, recipe):
+        self.apply((user.pk,), {
+            ingredient: -amount
+            for ingredient, amount in recipe.get_ingredient_amounts().items()
+        })
+
+    def change_recipe(self, recipe, old_amounts, new_amounts):
+        """Переносит изменение рецепта в списки покупок его корзин."""
+        deltas = {
+            ingredient: (new_amounts.get(ingredient, 0)
+                         - old_amounts.get(ingredient, 0))
+            for ingredient in {*old_amounts, *new_amounts}
+        }
+        if not any(deltas.values()):
+            return
+        user_ids = ShoppingCart.objects.filter(
+            recipe=recipe).values_list('user', flat=True)
+        self.apply(list(user_ids), deltas)
+
+    def apply(self, user_ids, deltas):
+        deltas = {
+            ingredient: delta for ingredient, delta in deltas.items() if delta
+        }
+        if not user_ids or not deltas:
+            return
+        with transaction.atomic():
+            list(User.objects.select_for_update()
+                 .filter(pk__in=user_ids).order_by('pk').values_list('pk'))
+            items = {
+                (item.user_id, item.ingredient_id): item
+                for item in self.filter(user__in=user_ids,
+                                        ingredient__in=deltas)
+            }
+            created, updated, deleted = [], [], []
+            for user_id in user_ids:
+                for ingredient_id, delta in deltas.items():
+                    item = items.get((user_id, ingredient_id))
+                    if item is None:
+                        if delta > 0:
+                            created.append(self.model(
+                                user_id=user_id, ingredient_id=ingredient_id,
+                                amount=delta))
+                        continue
+                    item.amount += delta
+                    if item.amount > 0:
+                        updated.append(item)
+                    else:
+                        deleted.append(item.pk)
+            self.bulk_create(created)
+            self.bulk_update(updated, ('amount',))
+            self.filter(pk__in=deleted).delete()
+
+    def live(self):
+        """Суммы ингредиентов, посчитанные по корзинам напрямую."""
+        return (IngredientRecipe.objects
+                .filter(recipe__shopped_users__isnull=False)
+                .values('recipe__shopped_users__user', 'ingredient')
+                .annotate(total=Sum('amount'))
+                .values_list('recipe__shopped_users__user', 'ingredient',
+                             'total'))
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(User,
+                             related_name='shopping_list',
+                             on_delete=models.CASCADE)
+    ingredient = models.ForeignKey(Ingredient,
+                                   related_name='shopping_list_items',
+                                   on_delete=models.CASCADE)
+    amount = models.IntegerField('Количество')
+
+    objects = ShoppingListItemQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Списки покупок'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'ingredient'],
+                                    name='unique_shopping_list_item'),
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} - {self.amount}'
+
+
+class FeedEntryQuerySet(models.QuerySet):
+    batch_size = 1000
+
+    def fan_out(self, recipe):
+        """Добавляет новый рецепт в ленты подписчиков автора."""
+        followers = Follow.objects.filter(
+            author=recipe.author_id).values_list('user', flat=True)
+        self._create(
+            self.model(user_id=user, recipe_id=recipe.pk,
+                       author_id=recipe.author_id, pub_date=recipe.pub_date)
+            for user in followers.iterator(chunk_size=self.batch_size)
+        )
+
+    def backfill(self, user, author):
+        """Добавляет в ленту подписчика уже опубликованные рецепты автора."""
+        recipes = Recipe.objects.filter(author=author).values_list(
+            'pk', 'pub_date')
+        self._create(
+            self.model(user_id=user.pk, recipe_id=recipe, author_id=author.pk,
+                       pub_date=pub_date)
+            for recipe, pub_date in recipes.iterator(
+                chunk_size=self.batch_size)
+        )
+
+    def trim(self, user, author):
+        self.filter(user=user, author=author).delete()
+
+    def _create(self, entries):
+        entries = iter(entries)
+        while True:
+            batch = list(islice(entries, self.batch_size))
+            if not batch:
+                return
+            self.bulk_create(batch, ignore_conflicts=True)
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(User, verbose_name='Подписчик',
+                             related_name='feed',
+                             on_delete=models.CASCADE)
+    recipe = models.ForeignKey(Recipe, verbose_name='Рецепт',
+                               related_name='feed_entries',
+                               on_delete=models.CASCADE)
+    author = models.ForeignKey(User, verbose_name='Автор',
+                               related_name='+',
+                               on_delete=models.CASCADE)
+    pub_date = models.DateTimeField('Дата публикации')
+
+    objects = FeedEntryQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-pub_date', '-id']
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'recipe'],
+                                    name='unique_feed_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-id'],
+                         name='feed_user_pub_date_idx'),
+            models.Index(fields=['user', 'author'],
+                         name='feed_user_author_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.recipe}'
+
+
+class PantryIndexChange(models.Model):
+    """Журнал изменений для индексов продуктов в памяти процессов.
+
+    Пустой recipe_id означает, что индекс нужно построить заново.
+    """
+    recipe_id = models.BigIntegerField('Рецепт', null=True)
+    created = models.DateTimeField('Дата изменения', auto_now_add=True,
+                                   db_index=True)
+
+    class Meta:
+        ordering = ['id']
+        verbose_name = 'Изменение индекса продуктов'
+        verbose_name_plural = 'Изменения индекса продуктов'
+
+    def __str__(self):
+        return f'{self.pk}: {self.recipe_id or "перестроение"}'
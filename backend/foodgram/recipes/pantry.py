@@ -0,0 +1,194 @@
+import time
+from collections import namedtuple
+from datetime import timedelta
+from threading import Lock
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from foodgram.routers import use_primary
+
+from .models import IngredientRecipe, PantryIndexChange
+
+# Если процесс отстал больше чем на столько изменений, индекс строится заново.
+PANTRY_INDEX_MAX_REPLAY = 1000
+# Записи журнала с номерами чуть меньше последней применённой перечитываются:
+# транзакция, получившая номер раньше, могла зафиксироваться позже.
+PANTRY_INDEX_LOOKBACK = 100
+# Процесс, не сверявшийся с журналом дольше этого срока, строит индекс
+# заново. Записи журнала хранятся вдвое дольше.
+PANTRY_INDEX_RETENTION = 60 * 60
+PANTRY_INDEX_PRUNE_EVERY = 1000
+
+PantryMatch = namedtuple('PantryMatch', ('recipe', 'coverage', 'missing'))
+
+
+class PantryMatches:
+    """Результат подбора рецептов по продуктам, отсортированный по покрытию.
+
+    Поддерживает len() и срезы, поэтому его можно отдать пагинатору:
+    объекты PantryMatch создаются только для запрошенной страницы.
+    """
+
+    def __init__(self, index, rows, hits, pantry):
+        self._index = index
+        self._rows = rows
+        self._hits = hits
+        self._pantry = pantry
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __getitem__(self, item):
+        pks, sizes, forward, _ = self._index
+        rows = self._rows[item]
+        return [
+            PantryMatch(
+                recipe=int(pks[row]),
+                coverage=float(self._hits[row] / sizes[row]),
+                missing=np.setdiff1d(forward[row], self._pantry,
+                                     assume_unique=True).tolist()
+            )
+            for row in np.atleast_1d(rows)
+        ]
+
+
+class PantryIndex:
+    """Инвертированный индекс ингредиент -> рецепты в памяти процесса.
+
+    Для каждого ингредиента хранится массив номеров рецептов, в которых он
+    есть, поэтому число совпадений с набором продуктов для всех рецептов
+    считается одним np.bincount. Изменения рецептов записываются в журнал
+    PantryIndexChange в базе, общий для всех процессов: процесс догоняет
+    его, перечитывая только изменившиеся рецепты, а если отстал слишком
+    сильно - строит индекс заново.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._index = None
+        self._version = 0
+        self._applied = set()
+        self._synced_at = None
+
+    def recipe_changed(self, pk):
+        """Отмечает изменение ингредиентов рецепта после коммита."""
+        transaction.on_commit(lambda: self._publish(pk))
+
+    def invalidate(self):
+        """Перестраивает индексы всех процессов после коммита."""
+        transaction.on_commit(lambda: self._publish(None))
+
+    def match(self, ingredients):
+        """Рецепты, в которых есть хотя бы один продукт из ingredients.
+
+        Сначала рецепты с большей долей имеющихся ингредиентов, при равной
+        доле - с меньшим числом недостающих, затем более новые.
+        """
+        self._ensure_current()
+        index = self._index
+        pks, sizes, _, postings = index
+        pantry = np.unique(np.asarray(list(ingredients), dtype=np.int64))
+        found = [postings[item] for item in pantry.tolist()
+                 if item in postings]
+        if not found:
+            return PantryMatches(index, np.empty(0, dtype=np.int64), None,
+                                 pantry)
+        hits = np.bincount(np.concatenate(found), minlength=len(pks))
+        rows = np.flatnonzero(hits)
+        order = np.lexsort((-pks[rows], sizes[rows] - hits[rows],
+                            -hits[rows] / sizes[rows]))
+        return PantryMatches(index, rows[order], hits, pantry)
+
+    def _publish(self, pk):
+        change = PantryIndexChange.objects.create(recipe_id=pk)
+        if change.pk % PANTRY_INDEX_PRUNE_EVERY == 0:
+            PantryIndexChange.objects.filter(
+                created__lt=timezone.now() - timedelta(
+                    seconds=2 * PANTRY_INDEX_RETENTION)).delete()
+
+    def _ensure_current(self):
+        with self._lock, use_primary():
+            changes = self._get_changes()
+            if changes is None:
+                self._rebuild()
+            elif changes:
+                self._update({pk for _, pk in changes})
+                self._applied.update(number for number, _ in changes)
+                self._version = max(self._version, changes[-1][0])
+                self._applied = {
+                    number for number in self._applied
+                    if number > self._version - PANTRY_INDEX_LOOKBACK}
+            self._synced_at = time.monotonic()
+
+    def _get_changes(self):
+        """Неприменённые записи журнала или None, если проще перестроить."""
+        if (self._index is None or time.monotonic() - self._synced_at
+                > PANTRY_INDEX_RETENTION):
+            return None
+        changes = [
+            change for change in PantryIndexChange.objects.filter(
+                id__gt=self._version - PANTRY_INDEX_LOOKBACK
+            ).order_by('id').values_list('id', 'recipe_id')[
+                :PANTRY_INDEX_LOOKBACK + PANTRY_INDEX_MAX_REPLAY + 1]
+            if change[0] not in self._applied
+        ]
+        if (len(changes) > PANTRY_INDEX_MAX_REPLAY
+                or any(pk is None for _, pk in changes)):
+            return None
+        return changes
+
+    def _rebuild(self):
+        # Номера журнала читаются до индекса: изменения, записанные
+        # во время построения, применятся повторно, это безопасно.
+        self._applied = set(PantryIndexChange.objects.order_by(
+            '-id').values_list('id', flat=True)[:PANTRY_INDEX_LOOKBACK])
+        self._version = max(self._applied, default=0)
+        self._build()
+
+    def _build(self):
+        pairs = np.array(
+            IngredientRecipe.objects.values_list('recipe', 'ingredient'),
+            dtype=np.int64).reshape(-1, 2)
+        pks, rows = np.unique(pairs[:, 0], return_inverse=True)
+        order = np.lexsort((pairs[:, 1], rows))
+        rows, ingredients = rows[order], pairs[order, 1]
+        sizes = np.bincount(rows, minlength=len(pks))
+        forward = (np.split(ingredients, np.cumsum(sizes)[:-1])
+                   if len(pks) else [])
+        order = np.argsort(ingredients, kind='stable')
+        keys, starts = np.unique(ingredients[order], return_index=True)
+        postings = dict(zip(keys.tolist(),
+                            np.split(rows[order], starts[1:])))
+        self._index = (pks, sizes, forward, postings)
+
+    def _update(self, changes):
+        pks, sizes, forward, postings = self._index
+        pks, sizes = pks.copy(), sizes.copy()
+        forward, postings = list(forward), dict(postings)
+        current = {pk: [] for pk in changes}
+        for recipe, ingredient in IngredientRecipe.objects.filter(
+                recipe__in=changes).values_list('recipe', 'ingredient'):
+            current[recipe].append(ingredient)
+        positions = {pk: row for row, pk in enumerate(pks.tolist())}
+        for pk, ingredients in current.items():
+            new = np.unique(np.asarray(ingredients, dtype=np.int64))
+            row = positions.get(pk)
+            if row is None:
+                row = len(pks)
+                pks = np.append(pks, pk)
+                sizes = np.append(sizes, 0)
+                forward.append(np.empty(0, dtype=np.int64))
+            old = forward[row]
+            for item in np.setdiff1d(old, new, assume_unique=True).tolist():
+                postings[item] = postings[item][postings[item] != row]
+            for item in np.setdiff1d(new, old, assume_unique=True).tolist():
+                postings[item] = np.append(
+                    postings.get(item, np.empty(0, dtype=np.int64)), row)
+            forward[row] = new
+            sizes[row] = len(new)
+        self._index = (pks, sizes, forward, postings)
+
+
+pantry_index = PantryIndex()
@@ -0,0 +1,174 @@
+import logging
+from bisect import bisect_left
+from threading import Lock
+
+from django.conf import settings
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connection, connections
+from django.db.models import F, FloatField
+from django.db.models.expressions import RawSQL
+
+from foodgram.routers import use_primary
+
+from .models import Ingredient, Recipe
+
+logger = logging.getLogger(__name__)
+
+SQLITE_FTS_TABLE = 'recipes_recipe_fts'
+SQLITE_FTS_TRIGGERS = {
+    'recipes_recipe_fts_insert': (
+        'AFTER INSERT ON recipes_recipe '
+        'BEGIN INSERT INTO recipes_recipe_fts(rowid, name, text) '
+        'VALUES (new.id, new.name, new.text); END'),
+    'recipes_recipe_fts_delete': (
+        'AFTER DELETE ON recipes_recipe '
+        'BEGIN INSERT INTO recipes_recipe_fts(recipes_recipe_fts, rowid, '
+        "name, text) VALUES ('delete', old.id, old.name, old.text); END"),
+    'recipes_recipe_fts_update': (
+        'AFTER UPDATE OF name, text ON recipes_recipe BEGIN '
+        'INSERT INTO recipes_recipe_fts(recipes_recipe_fts, rowid, name, '
+        "text) VALUES ('delete', old.id, old.name, old.text); "
+        'INSERT INTO recipes_recipe_fts(rowid, name, text) '
+        'VALUES (new.id, new.name, new.text); END'),
+}
+
+
+def normalize(value):
+    return value.strip().casefold()
+
+
+class IngredientIndex:
+    """Отсортированный индекс названий ингредиентов в памяти процесса.
+
+    Префиксный поиск выполняется бинарным поиском, совпадения по подстроке
+    выдаются после совпадений по префиксу. Индекс перестраивается, когда
+    меняется CatalogVersion справочника ингредиентов: версия хранится
+    в базе, поэтому импорт из другого процесса виден всем процессам.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._index = ([], [])
+        self._version = None
+
+    def search(self, query, version):
+        """Ищет по индексу, построенному для версии справочника.
+
+        version — CatalogVersion ингредиентов или None, если справочник
+        ещё не менялся.
+        """
+        self._ensure_built(
+            version and (version.version, version.updated_at))
+        prefix = normalize(query)
+        keys, items = self._index
+        start = bisect_left(keys, prefix)
+        end = start
+        while end < len(keys) and keys[end].startswith(prefix):
+            end += 1
+        result = items[start:end]
+        if prefix:
+            result.extend(
+                item for key, item in zip(keys, items)
+                if prefix in key and not key.startswith(prefix)
+            )
+        return result
+
+    def _ensure_built(self, version):
+        if self._version == version:
+            return
+        with self._lock:
+            if self._version == version:
+                return
+            with use_primary():
+                ingredients = list(Ingredient.objects.all())
+            ingredients = sorted(
+                ingredients,
+                key=lambda ingredient: (normalize(ingredient.name),
+                                        ingredient.pk)
+            )
+            keys = [normalize(item.name) for item in ingredients]
+            self._index = (keys, ingredients)
+            self._version = version
+
+
+ingredient_index = IngredientIndex()
+
+
+def get_search_vector():
+    config = settings.RECIPE_SEARCH_CONFIG
+    return (SearchVector('name', weight='A', config=config)
+            + SearchVector('text', weight='B', config=config))
+
+
+def update_search_vector(recipe):
+    """Пересчитывает поисковый вектор рецепта в Postgres.
+
+    В SQLite индекс FTS5 обновляют триггеры, заведённые миграцией;
+    ensure_search_triggers восстанавливает их после каждого migrate.
+    """
+    if connection.vendor == 'postgresql':
+        Recipe.objects.filter(pk=recipe.pk).update(
+            search_vector=get_search_vector())
+
+
+def ensure_search_triggers(using='default', **kwargs):
+    """Восстанавливает триггеры FTS5 после миграций в SQLite.
+
+    SQLite пересоздаёт таблицу рецептов при изменении её полей, и триггеры
+    удаляются вместе со старой таблицей. Если какого-то нет, он создаётся
+    заново, а индекс перестраивается по содержимому таблицы.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT type, name FROM sqlite_master "
+                       "WHERE type IN ('table', 'trigger')")
+        existing = {(kind, name) for kind, name in cursor.fetchall()}
+        if ('table', SQLITE_FTS_TABLE) not in existing:
+            return
+        missing = [name for name in SQLITE_FTS_TRIGGERS
+                   if ('trigger', name) not in existing]
+        if not missing:
+            return
+        logger.info('Восстановлены триггеры поиска: %s',
+                    ', '.join(missing))
+        for name in missing:
+            cursor.execute(
+                f'CREATE TRIGGER {name} {SQLITE_FTS_TRIGGERS[name]}')
+        cursor.execute(f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}) "
+                       "VALUES ('rebuild')")
+
+
+def get_fts5_query(value):
+    return ' '.join(
+        '"{}"*'.format(word.replace('"', '""')) for word in value.split()
+    )
+
+
+def search_recipes(queryset, value):
+    """Полнотекстовый поиск по названию и описанию, лучшие совпадения первыми.
+
+    Postgres ищет по search_vector с GIN-индексом, SQLite - по таблице FTS5.
+    """
+    if not value.strip():
+        return queryset
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(value, config=settings.RECIPE_SEARCH_CONFIG,
+                            search_type='websearch')
+        return (queryset
+                .filter(search_vector=query)
+                .annotate(rank=SearchRank(F('search_vector'), query))
+                .order_by('-rank', '-pub_date'))
+    rank = RawSQL(
+        'SELECT -bm25(recipes_recipe_fts, 10.0, 1.0) FROM recipes_recipe_fts '
+        'WHERE recipes_recipe_fts MATCH %s '
+        'AND recipes_recipe_fts.rowid = recipes_recipe.id',
+        (get_fts5_query(value),),
+        output_field=FloatField()
+    )
+    return (queryset
+            .annotate(rank=rank)
+            .filter(rank__isnull=False)
+            .order_by('-rank', '-pub_date'))
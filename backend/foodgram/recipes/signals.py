@@ -0,0 +1,70 @@
+import logging
+
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from users.models import Follow
+
+from .images import update_variants
+from .models import (CatalogVersion, FavoritedRecipe, Ingredient, Recipe,
+                     ShoppingCart, Tag)
+from .pantry import pantry_index
+from .search import update_search_vector
+from .user_state import invalidate_user_state
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def bump_ingredients_version(sender, **kwargs):
+    CatalogVersion.objects.bump(CatalogVersion.INGREDIENTS)
+
+
+@receiver(post_delete, sender=Ingredient)
+def invalidate_pantry_index(sender, **kwargs):
+    pantry_index.invalidate()
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_from_pantry_index(sender, instance, **kwargs):
+    pantry_index.recipe_changed(instance.pk)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def bump_tags_version(sender, **kwargs):
+    CatalogVersion.objects.bump(CatalogVersion.TAGS)
+
+
+@receiver(post_save, sender=Recipe)
+def generate_image_variants(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    try:
+        update_variants(instance)
+    except (OSError, ValueError):
+        logger.exception('Не удалось построить копии изображения рецепта %s',
+                         instance.pk)
+
+
+@receiver(post_save, sender=Recipe)
+def sync_search_vector(sender, instance, raw=False, **kwargs):
+    if not raw:
+        update_search_vector(instance)
+
+
+@receiver(pre_delete, sender=Recipe)
+def mark_neighbors_stale(sender, instance, **kwargs):
+    Recipe.objects.filter(neighbors__neighbor=instance).update(
+        neighbors_stale=True)
+
+
+@receiver(post_save, sender=FavoritedRecipe)
+@receiver(post_delete, sender=FavoritedRecipe)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def reset_user_state(sender, instance, **kwargs):
+    invalidate_user_state(instance.user_id)
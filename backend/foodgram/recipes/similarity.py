@@ -0,0 +1,174 @@
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from .models import IngredientRecipe, Recipe, RecipeNeighbor, TaggedRecipe
+
+# Верхняя граница памяти под промежуточный массив одного пакета, в байтах.
+BATCH_MEMORY = 64 * 1024 * 1024
+
+
+class RecipeMatrix:
+    """Разреженная матрица рецепт x признак в формате CSR.
+
+    Признаки - ингредиенты и теги рецепта. Вес признака равен его IDF,
+    веса тегов дополнительно умножаются на RECIPE_SIMILAR_TAG_WEIGHT.
+    Строки нормированы, поэтому скалярное произведение строк - косинусная
+    мера сходства рецептов.
+    """
+
+    def __init__(self, pairs):
+        recipes, features, weights = pairs
+        self.ids, rows = np.unique(recipes, return_inverse=True)
+        _, columns = np.unique(features, return_inverse=True)
+        frequency = np.bincount(columns)
+        data = weights * np.log(len(self.ids) / frequency[columns]) + weights
+        order = np.argsort(rows, kind='stable')
+        rows, self.indices, data = rows[order], columns[order], data[order]
+        norms = np.sqrt(np.bincount(rows, weights=data ** 2))
+        self.data = (data / norms[rows]).astype(np.float32)
+        self.indptr = np.zeros(len(self.ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(self.ids)),
+                  out=self.indptr[1:])
+        self.width = len(frequency)
+        self.pks = self.ids.tolist()
+        self.positions = {pk: row for row, pk in enumerate(self.pks)}
+
+    @classmethod
+    def load(cls):
+        ingredients = np.array(
+            IngredientRecipe.objects.values_list('recipe', 'ingredient'),
+            dtype=np.int64).reshape(-1, 2)
+        tags = np.array(
+            TaggedRecipe.objects.values_list('recipe', 'tag'),
+            dtype=np.int64).reshape(-1, 2)
+        # Теги и ингредиенты живут в одном пространстве признаков:
+        # идентификаторы тегов сдвигаются за последний ингредиент.
+        offset = ingredients[:, 1].max(initial=0) + 1
+        return cls((
+            np.concatenate((ingredients[:, 0], tags[:, 0])),
+            np.concatenate((ingredients[:, 1], tags[:, 1] + offset)),
+            np.concatenate((
+                np.ones(len(ingredients)),
+                np.full(len(tags), settings.RECIPE_SIMILAR_TAG_WEIGHT)
+            ))
+        ))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def scores(self, rows):
+        """Сходство строк rows со всеми рецептами, массив len(rows) x n."""
+        rows = np.asarray(rows, dtype=np.int64)
+        lengths = self.indptr[rows + 1] - self.indptr[rows]
+        offsets = (np.repeat(self.indptr[rows] - np.cumsum(lengths) + lengths,
+                             lengths)
+                   + np.arange(lengths.sum()))
+        batch = np.zeros((len(rows), self.width), dtype=np.float32)
+        batch[np.repeat(np.arange(len(rows)), lengths),
+              self.indices[offsets]] = self.data[offsets]
+        products = batch[:, self.indices] * self.data
+        scores = np.add.reduceat(products, self.indptr[:-1], axis=1)
+        scores[np.arange(len(rows)), rows] = 0
+        return scores
+
+    def batches(self, rows, batch_size):
+        batch_size = max(1, min(
+            batch_size, BATCH_MEMORY // (self.data.itemsize * len(self.data))))
+        for start in range(0, len(rows), batch_size):
+            chunk = rows[start:start + batch_size]
+            yield chunk, self.scores(chunk)
+
+
+def get_neighbors(matrix, rows, scores, count):
+    """Лучшие count соседей для каждой строки пакета."""
+    count = min(count, len(matrix) - 1)
+    if count <= 0:
+        return []
+    top = np.argpartition(-scores, count - 1, axis=1)[:, :count]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    return [
+        RecipeNeighbor(recipe_id=matrix.pks[row], neighbor_id=matrix.pks[col],
+                       score=score)
+        for row, cols, values in zip(rows, top.tolist(), top_scores.tolist())
+        for col, score in zip(cols, values)
+        if score > 0
+    ]
+
+
+def get_thresholds(matrix, count):
+    """Сходство с худшим из count соседей для каждой строки матрицы.
+
+    Для рецептов, у которых соседей меньше count, порог нулевой.
+    """
+    threshold = np.zeros(len(matrix), dtype=np.float32)
+    rows = np.array(
+        RecipeNeighbor.objects.order_by('recipe', '-score')
+        .values_list('recipe', 'score'), dtype=np.float64).reshape(-1, 2)
+    recipes = rows[:, 0].astype(np.int64)
+    _, starts, groups = np.unique(recipes, return_index=True,
+                                  return_inverse=True)
+    last = np.flatnonzero(np.arange(len(rows)) - starts[groups] == count - 1)
+    known = np.isin(recipes[last], matrix.ids)
+    positions = np.searchsorted(matrix.ids, recipes[last][known])
+    threshold[positions] = rows[last, 1][known]
+    return threshold
+
+
+def get_stale_rows(matrix, stale, count, batch_size):
+    """Строки, списки соседей которых могли измениться из-за stale.
+
+    Это сами изменившиеся рецепты, рецепты, у которых они уже есть среди
+    соседей, и рецепты, у которых они теперь превышают худшего соседа.
+    """
+    threshold = get_thresholds(matrix, count)
+    affected = np.zeros(len(matrix), dtype=bool)
+    rows = [matrix.positions[pk] for pk in stale if pk in matrix.positions]
+    affected[rows] = True
+    for _, scores in matrix.batches(rows, batch_size):
+        affected |= (scores > threshold).any(axis=0)
+    referencing = RecipeNeighbor.objects.filter(
+        neighbor__in=stale).values_list('recipe', flat=True)
+    affected[[matrix.positions[pk] for pk in referencing
+              if pk in matrix.positions]] = True
+    return np.flatnonzero(affected)
+
+
+def refresh_neighbors(full=False, batch_size=256, count=None):
+    """Пересчитывает таблицу похожих рецептов.
+
+    Без full обрабатывает только рецепты с флагом neighbors_stale и те,
+    чьи списки соседей от них зависят; небольшой сдвиг весов IDF у
+    остальных рецептов учитывает только полный пересчёт. Возвращает число
+    пересчитанных рецептов.
+    """
+    count = count or settings.RECIPE_SIMILAR_COUNT
+    if full:
+        stale = list(Recipe.objects.values_list('pk', flat=True))
+        Recipe.objects.update(neighbors_stale=False)
+    else:
+        stale = list(Recipe.objects.filter(
+            neighbors_stale=True).values_list('pk', flat=True))
+        Recipe.objects.filter(pk__in=stale).update(neighbors_stale=False)
+    if not stale:
+        return 0
+    matrix = RecipeMatrix.load()
+    if full:
+        rows = np.arange(len(matrix))
+    else:
+        rows = get_stale_rows(matrix, stale, count, batch_size)
+    # Рецепты без ингредиентов и тегов ни на кого не похожи.
+    featureless = RecipeNeighbor.objects.filter(
+        ~Exists(IngredientRecipe.objects.filter(recipe=OuterRef('recipe'))),
+        ~Exists(TaggedRecipe.objects.filter(recipe=OuterRef('recipe'))))
+    if not full:
+        featureless = featureless.filter(recipe__in=stale)
+    featureless.delete()
+    for chunk, scores in matrix.batches(rows, batch_size):
+        with transaction.atomic():
+            RecipeNeighbor.objects.filter(
+                recipe__in=[matrix.pks[row] for row in chunk]).delete()
+            RecipeNeighbor.objects.bulk_create(
+                get_neighbors(matrix, chunk, scores, count))
+    return len(rows)
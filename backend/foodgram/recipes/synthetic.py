@@ -0,0 +1,398 @@
+import csv
+import multiprocessing
+import random
+from collections import Counter
+from datetime import timedelta
+from io import StringIO
+from itertools import accumulate
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.models import DateTimeField, Max
+from django.utils import timezone
+
+from users.models import Follow, User
+
+from .counters import COUNTERS, count_related
+from .models import (CatalogVersion, FavoritedRecipe, FeedEntry, Ingredient,
+                     IngredientRecipe, Recipe, ShoppingCart, ShoppingListItem,
+                     Tag, TaggedRecipe)
+from .pantry import pantry_index
+from .search import get_search_vector
+from .similarity import refresh_neighbors
+
+BATCH_SIZE = 2000
+# Пользователей или рецептов в одном задании. От размера зависит, какие
+# данные получатся при данном seed, поэтому он не настраивается.
+CHUNK_SIZE = 5000
+INGREDIENTS_PATHS = (
+    Path(settings.BASE_DIR).parent.parent / 'data' / 'ingredients.json',
+    Path(settings.BASE_DIR) / 'ingredients.json',
+)
+PASSWORD = 'synthetic-password'
+TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+    ('Десерт', '#F2C94C', 'dessert'),
+    ('Суп', '#2D9CDB', 'soup'),
+    ('Выпечка', '#BB6BD9', 'bakery'),
+    ('Салат', '#27AE60', 'salad'),
+    ('Напиток', '#56CCF2', 'drink'),
+)
+WORDS = (
+    'домашний', 'быстрый', 'пряный', 'сливочный', 'запечённый', 'летний',
+    'острый', 'нежный', 'хрустящий', 'овощной', 'фермерский', 'лёгкий',
+    'пирог', 'суп', 'салат', 'рагу', 'омлет', 'паста', 'плов', 'соус',
+    'курица', 'грибы', 'сыр', 'тыква', 'шпинат', 'лосось', 'яблоки',
+)
+USER_FIELDS = ('id', 'username', 'email', 'first_name', 'last_name',
+               'password')
+RECIPE_FIELDS = ('id', 'author_id', 'name', 'text', 'cooking_time')
+NULL = r'\N'
+# Даты создания и изменения строк, записанных COPY, разбросаны по этому
+# промежутку до момента записи.
+TIMESTAMP_WINDOW = timedelta(days=365)
+
+_dataset = None
+
+
+def get_ingredients_path():
+    for path in INGREDIENTS_PATHS:
+        if path.exists():
+            return path
+    return None
+
+
+def power_law(size, skew):
+    """Накопленные веса закона Ципфа: элемент ранга r весит 1 / r ** skew."""
+    return list(accumulate(1 / rank ** skew for rank in range(1, size + 1)))
+
+
+def weighted_sample(rng, population, cum_weights, k):
+    """k различных элементов, выбранных с учётом весов."""
+    k = min(k, len(population))
+    if k * 2 > len(population):
+        return rng.sample(population, k)
+    picked = []
+    seen = set()
+    while len(picked) < k:
+        for item in rng.choices(population, cum_weights=cum_weights,
+                                k=k - len(picked)):
+            if item not in seen:
+                seen.add(item)
+                picked.append(item)
+    return picked
+
+
+def is_timestamp(field):
+    return isinstance(field, DateTimeField) and (
+        field.auto_now or field.auto_now_add
+        or field.default is timezone.now)
+
+
+def copy_rows(model, fields, rows, rng):
+    """Загружает строки в Postgres одной командой COPY.
+
+    Остальные столбцы получают значения по умолчанию так же, как при
+    save(): их один раз вычисляет pre_save пустого объекта. Только даты
+    создания и изменения у каждой строки свои: момент записи минус
+    случайный сдвиг в пределах TIMESTAMP_WINDOW, одинаковый для всех дат
+    строки.
+    """
+    opts = model._meta
+    template = model()
+    missing = [
+        field for field in opts.concrete_fields
+        if field.attname not in fields and not field.primary_key
+    ]
+    defaults = [
+        field.get_db_prep_save(field.pre_save(template, True), connection)
+        for field in missing
+    ]
+    defaults = [NULL if value is None else value for value in defaults]
+    timestamps = [
+        (index, field) for index, field in enumerate(missing)
+        if is_timestamp(field)
+    ]
+    now = timezone.now()
+
+    def fill(row):
+        values = [*row, *defaults]
+        if timestamps:
+            moment = now - rng.random() * TIMESTAMP_WINDOW
+            for index, field in timestamps:
+                values[len(row) + index] = field.get_db_prep_save(
+                    moment, connection)
+        return values
+
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows(map(fill, rows))
+    buffer.seek(0)
+    quote = connection.ops.quote_name
+    columns = ', '.join(
+        quote(field.column)
+        for field in [*map(opts.get_field, fields), *missing])
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f'COPY {quote(opts.db_table)} ({columns}) '
+            f"FROM STDIN WITH (FORMAT csv, NULL '{NULL}')",
+            buffer)
+
+
+def write(model, fields, rows, rng):
+    if not rows:
+        return
+    if connection.vendor == 'postgresql':
+        copy_rows(model, fields, rows, rng)
+    else:
+        model.objects.bulk_create(
+            (model(**dict(zip(fields, row))) for row in rows),
+            batch_size=BATCH_SIZE)
+
+
+def insert_select(model, fields, queryset):
+    """INSERT ... SELECT: переносит строки, не выгружая их в Python."""
+    sql, params = queryset.query.sql_with_params()
+    quote = connection.ops.quote_name
+    columns = ', '.join(
+        quote(model._meta.get_field(field).column) for field in fields)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(model._meta.db_table)} ({columns}) {sql}',
+            params)
+
+
+def _init_worker(dataset):
+    global _dataset
+    _dataset = dataset
+
+
+def _run_task(task):
+    return _dataset.run_task(*task)
+
+
+class SyntheticDataset:
+    """Воспроизводимый набор пользователей, рецептов и связей между ними.
+
+    Популярность авторов, рецептов и ингредиентов подчиняется закону Ципфа
+    с показателем skew. Данные создаются заданиями по CHUNK_SIZE строк,
+    у каждого задания свой генератор случайных чисел, поэтому при том же
+    seed результат не зависит от числа процессов workers. В Postgres строки
+    загружаются через COPY, в остальных базах через bulk_create; производные
+    таблицы (счётчики, ленты, списки покупок, похожие рецепты) заполняются
+    в конце запросами INSERT ... SELECT и UPDATE.
+    """
+
+    def __init__(self, users=200, recipes=2000, follows=10, favorites=20,
+                 carts=5, seed=0, skew=1.1, workers=1, ingredients=None,
+                 similar=True, log=None):
+        self.users = users
+        self.recipes = recipes
+        self.follows = follows
+        self.favorites = favorites
+        self.carts = carts
+        self.seed = seed
+        self.skew = skew
+        self.workers = workers
+        self.ingredients_path = ingredients or get_ingredients_path()
+        self.similar = similar
+        self.log = log or (lambda message: None)
+
+    def generate(self):
+        self.prepare()
+        self.run('create_users', self.user_ids)
+        self.run('create_recipes', self.recipe_ids)
+        self.run('create_recipe_links', self.recipe_ids)
+        self.run('create_user_links', self.user_ids)
+        with transaction.atomic():
+            self.reset_sequences()
+            self.fill_derived()
+        if self.similar:
+            refresh_neighbors(full=True)
+        pantry_index.invalidate()
+
+    def prepare(self):
+        rng = self.get_random('prepare')
+        self.tags = self.create_tags()
+        self.ingredient_ids = self.create_ingredients()
+        rng.shuffle(self.ingredient_ids)
+        self.ingredient_weights = power_law(len(self.ingredient_ids),
+                                            self.skew)
+        first_user = (User.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+        first_recipe = (
+            Recipe.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+        self.user_ids = range(first_user, first_user + self.users)
+        self.recipe_ids = range(first_recipe, first_recipe + self.recipes)
+        # Плодовитость авторов и число их подписчиков распределены
+        # независимо, иначе лента самого популярного автора заняла бы
+        # большую часть FeedEntry.
+        self.authors = rng.sample(self.user_ids, self.users)
+        self.followed = rng.sample(self.user_ids, self.users)
+        self.popular = rng.sample(self.recipe_ids, self.recipes)
+        self.user_weights = power_law(self.users, self.skew)
+        self.recipe_weights = power_law(self.recipes, self.skew)
+        self.password = make_password(PASSWORD)
+
+    def get_random(self, *key):
+        return random.Random(':'.join(map(str, (self.seed, *key))))
+
+    def run(self, method, ids):
+        tasks = [
+            (method, number)
+            for number in range((len(ids) + CHUNK_SIZE - 1) // CHUNK_SIZE)
+        ]
+        totals = Counter()
+        workers = min(self.workers, len(tasks))
+        if connection.vendor == 'sqlite':
+            # SQLite допускает только одного пишущего.
+            workers = 1
+        if workers > 1:
+            connections.close_all()
+            context = multiprocessing.get_context('fork')
+            with context.Pool(workers, initializer=_init_worker,
+                              initargs=(self,)) as pool:
+                for counts in pool.imap_unordered(_run_task, tasks):
+                    totals.update(counts)
+        else:
+            for task in tasks:
+                totals.update(self.run_task(*task))
+        for name, count in totals.items():
+            self.log(f'{name}: {count}')
+
+    def run_task(self, method, number):
+        rng = self.get_random(method, number)
+        # Отдельный генератор: даты строк не меняют сами данные при seed.
+        timestamps = self.get_random(method, number, 'timestamps')
+        counts = {}
+        with transaction.atomic():
+            for model, fields, rows in getattr(self, method)(rng, number):
+                write(model, fields, rows, timestamps)
+                name = str(model._meta.verbose_name_plural)
+                counts[name] = counts.get(name, 0) + len(rows)
+        return counts
+
+    def get_chunk(self, ids, number):
+        return ids[number * CHUNK_SIZE:(number + 1) * CHUNK_SIZE]
+
+    def get_count(self, rng, mean, limit):
+        """Число связей у строки: экспоненциальное распределение."""
+        if mean <= 0:
+            return 0
+        return min(int(rng.expovariate(1 / mean)), limit)
+
+    def create_tags(self):
+        Tag.objects.bulk_create([
+            Tag(name=name, color=color, slug=slug)
+            for name, color, slug in TAGS
+        ], ignore_conflicts=True)
+        return list(Tag.objects.order_by('pk').values_list('pk', flat=True))
+
+    def create_ingredients(self):
+        if self.ingredients_path is not None:
+            call_command('import_ingredients', str(self.ingredients_path),
+                         stdout=StringIO())
+        elif not Ingredient.objects.exists():
+            Ingredient.objects.bulk_create(
+                Ingredient(name=f'ингредиент {number}',
+                           measurement_unit='г')
+                for number in range(1000)
+            )
+        return list(Ingredient.objects.order_by('pk').values_list(
+            'pk', flat=True))
+
+    def create_users(self, rng, number):
+        yield User, USER_FIELDS, [
+            (pk, f'user{pk}', f'user{pk}@example.com', 'Имя',
+             f'Фамилия {pk}', self.password)
+            for pk in self.get_chunk(self.user_ids, number)
+        ]
+
+    def create_recipes(self, rng, number):
+        recipe_ids = self.get_chunk(self.recipe_ids, number)
+        authors = rng.choices(self.authors, cum_weights=self.user_weights,
+                              k=len(recipe_ids))
+        yield Recipe, RECIPE_FIELDS, [
+            (pk, author, ' '.join(rng.sample(WORDS, 3)).capitalize(),
+             ' '.join(rng.choices(WORDS, k=30)), rng.randint(5, 180))
+            for pk, author in zip(recipe_ids, authors)
+        ]
+
+    def create_recipe_links(self, rng, number):
+        ingredients, tags = [], []
+        for recipe in self.get_chunk(self.recipe_ids, number):
+            count = min(max(round(rng.lognormvariate(2, 0.35)), 2), 20)
+            ingredients.extend(
+                (recipe, ingredient, rng.randint(1, 500))
+                for ingredient in weighted_sample(
+                    rng, self.ingredient_ids, self.ingredient_weights, count)
+            )
+            tags.extend(
+                (recipe, tag)
+                for tag in rng.sample(self.tags, rng.randint(1, 3))
+            )
+        yield IngredientRecipe, ('recipe_id', 'ingredient_id', 'amount'), (
+            ingredients)
+        yield TaggedRecipe, ('recipe_id', 'tag_id'), tags
+
+    def create_user_links(self, rng, number):
+        follows, favorites, carts = [], [], []
+        for user in self.get_chunk(self.user_ids, number):
+            count = self.get_count(rng, self.follows, len(self.user_ids) - 1)
+            authors = weighted_sample(rng, self.followed, self.user_weights,
+                                      count + 1)
+            follows.extend(
+                (user, author)
+                for author in [author for author in authors
+                               if author != user][:count]
+            )
+            for links, mean in ((favorites, self.favorites),
+                                (carts, self.carts)):
+                count = self.get_count(rng, mean, len(self.recipe_ids))
+                links.extend(
+                    (user, recipe)
+                    for recipe in weighted_sample(
+                        rng, self.popular, self.recipe_weights, count)
+                )
+        yield Follow, ('user_id', 'author_id'), follows
+        yield FavoritedRecipe, ('user_id', 'recipe_id'), favorites
+        yield ShoppingCart, ('user_id', 'recipe_id'), carts
+
+    def reset_sequences(self):
+        """Сдвигает последовательности после вставки с явными id."""
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [User, Recipe])
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+    def fill_derived(self):
+        """Производные таблицы для новых пользователей и рецептов.
+
+        Новые пользователи ссылаются только на новые рецепты и авторов,
+        поэтому старые строки пересчитывать не нужно.
+        """
+        first = {User: self.user_ids.start, Recipe: self.recipe_ids.start}
+        for model, counter, related, field in COUNTERS:
+            model.objects.filter(pk__gte=first[model]).update(
+                **{counter: count_related(related, field)})
+        insert_select(
+            ShoppingListItem, ('user', 'ingredient', 'amount'),
+            ShoppingListItem.objects.live().filter(
+                recipe__gte=first[Recipe]).order_by())
+        insert_select(
+            FeedEntry, ('user', 'author', 'recipe', 'pub_date'),
+            Recipe.objects.filter(
+                pk__gte=first[Recipe], author__follower__isnull=False
+            ).order_by().values_list(
+                'author__follower__user', 'author', 'pk', 'pub_date'))
+        if connection.vendor == 'postgresql':
+            Recipe.objects.filter(pk__gte=first[Recipe]).update(
+                search_vector=get_search_vector())
+        CatalogVersion.objects.bump(CatalogVersion.TAGS)
+        CatalogVersion.objects.bump(CatalogVersion.INGREDIENTS)
@@ -0,0 +1,57 @@
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db import transaction
+
+from foodgram.routers import use_primary
+from users.models import Follow
+
+from .models import FavoritedRecipe, ShoppingCart
+
+USER_STATE_KEY = 'user_state_{}'
+USER_STATE_TIMEOUT = 60 * 60
+
+UserState = namedtuple('UserState', ('favorites', 'cart', 'following'))
+EMPTY_USER_STATE = UserState(frozenset(), frozenset(), frozenset())
+
+
+def load_user_state(user_id):
+    return UserState(
+        favorites=frozenset(FavoritedRecipe.objects.filter(
+            user=user_id).values_list('recipe', flat=True)),
+        cart=frozenset(ShoppingCart.objects.filter(
+            user=user_id).values_list('recipe', flat=True)),
+        following=frozenset(Follow.objects.filter(
+            user=user_id).values_list('author', flat=True)),
+    )
+
+
+def get_user_state(request):
+    """Избранное, корзина и подписки пользователя запроса.
+
+    Множества id хранятся в кэше и читаются из него не больше одного раза
+    за HTTP-запрос.
+    """
+    if not hasattr(request, '_user_state'):
+        user = request.user
+        state = EMPTY_USER_STATE
+        if user.is_authenticated:
+            key = USER_STATE_KEY.format(user.pk)
+            state = cache.get(key)
+            if state is None:
+                with use_primary():
+                    state = load_user_state(user.pk)
+                cache.set(key, state, USER_STATE_TIMEOUT)
+        request._user_state = state
+    return request._user_state
+
+
+def invalidate_user_state(user_id):
+    """Сбрасывает кэш сразу и ещё раз после коммита транзакции.
+
+    Повторный сброс убирает состояние, которое параллельный запрос мог
+    прочитать из базы до коммита.
+    """
+    key = USER_STATE_KEY.format(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
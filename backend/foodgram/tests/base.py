@@ -0,0 +1,84 @@
+import base64
+from io import BytesIO
+
+from django.core.cache import cache
+from django.test import TestCase
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import (FavoritedRecipe, FeedEntry, Ingredient,
+                            IngredientRecipe, Recipe, RecipeNeighbor,
+                            ShoppingCart, ShoppingListItem, Tag, TaggedRecipe)
+from users.models import Follow, User
+
+
+def make_image_data():
+    buffer = BytesIO()
+    Image.new('RGB', (10, 10), 'red').save(buffer, 'PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+class BaseTestCase(TestCase):
+    """Кэш общий для всех тестов процесса и очищается перед каждым."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    @staticmethod
+    def create_user(name, **kwargs):
+        return User.objects.create_user(
+            username=name, email=f'{name}@example.com', password='pass',
+            first_name=name.title(), last_name=name.title(), **kwargs)
+
+
+class CatalogTestCase(BaseTestCase):
+    """Авторы с рецептами, подписки, избранное и корзина читателя."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tags = [
+            Tag.objects.create(name=name, color=color, slug=slug)
+            for name, color, slug in (('Завтрак', '#E26C2D', 'breakfast'),
+                                      ('Обед', '#49B64E', 'lunch'))]
+        cls.ingredients = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Мука', 'Сахар', 'Соль')]
+        cls.reader = cls.create_user('reader')
+        cls.token = Token.objects.create(user=cls.reader)
+        cls.authors = [cls.create_user(f'author{number}')
+                       for number in range(3)]
+        cls.recipes = []
+        for author in cls.authors:
+            Follow.objects.create(user=cls.reader, author=author)
+            for number in range(4):
+                cls.recipes.append(cls.create_recipe(author, number))
+        for recipe in cls.recipes[::3]:
+            FavoritedRecipe.objects.create(user=cls.reader, recipe=recipe)
+            ShoppingCart.objects.create(user=cls.reader, recipe=recipe)
+            ShoppingListItem.objects.add_recipe(cls.reader, recipe)
+        for author in cls.authors:
+            FeedEntry.objects.backfill(cls.reader, author)
+        for recipe, neighbor in zip(cls.recipes, cls.recipes[1:]):
+            RecipeNeighbor.objects.create(recipe=recipe, neighbor=neighbor,
+                                          score=0.5)
+
+    @classmethod
+    def create_recipe(cls, author, number):
+        recipe = Recipe.objects.create(
+            author=author, name=f'Рецепт {author.username} {number}',
+            text='Описание.', cooking_time=10 + number)
+        for tag in cls.tags:
+            TaggedRecipe.objects.create(recipe=recipe, tag=tag)
+        for ingredient in cls.ingredients[number % 2:]:
+            IngredientRecipe.objects.create(recipe=recipe,
+                                            ingredient=ingredient, amount=5)
+        return recipe
+
+    def get_client(self, authenticated):
+        client = APIClient()
+        if authenticated:
+            client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        return client
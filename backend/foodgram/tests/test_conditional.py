@@ -0,0 +1,39 @@
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe
+
+from .base import BaseTestCase
+
+
+class RecipeConditionalGetTests(BaseTestCase):
+    """ETag рецепта меняется вместе с данными автора."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = cls.create_user('author')
+        cls.recipe = Recipe.objects.create(author=cls.author, name='Борщ',
+                                           text='Свекла.', cooking_time=90)
+
+    def setUp(self):
+        super().setUp()
+        self.url = f'/api/recipes/{self.recipe.pk}/'
+        self.client = APIClient()
+        self.etag = self.client.get(self.url)['ETag']
+
+    def get(self):
+        return self.client.get(self.url, HTTP_IF_NONE_MATCH=self.etag)
+
+    def test_not_modified(self):
+        self.assertEqual(self.get().status_code, 304)
+
+    def test_author_rename_changes_etag(self):
+        self.author.first_name = 'Автор'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.save(update_fields=('first_name',))
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['author']['first_name'], 'Автор')
+
+    def test_login_keeps_etag(self):
+        self.author.save(update_fields=('last_login',))
+        self.assertEqual(self.get().status_code, 304)
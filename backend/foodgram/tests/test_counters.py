@@ -0,0 +1,107 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.counters import COUNTERS, get_drift
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+from .base import BaseTestCase, make_image_data
+
+
+class CounterTests(BaseTestCase):
+    """Счётчики меняются вместе с таблицами связей."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = cls.create_user('reader')
+        cls.author = cls.create_user('author')
+        cls.tag = Tag.objects.create(name='Обед', color='#49B64E',
+                                     slug='lunch')
+        cls.ingredient = Ingredient.objects.create(name='Соль',
+                                                   measurement_unit='г')
+
+    def get_client(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token {}'.format(
+            Token.objects.get_or_create(user=user)[0].key))
+        return client
+
+    def create_recipe(self):
+        response = self.get_client(self.author).post('/api/recipes/', {
+            'tags': [self.tag.pk],
+            'ingredients': [{'id': self.ingredient.pk, 'amount': 5}],
+            'image': make_image_data(),
+            'name': 'Суп', 'text': 'Суп.', 'cooking_time': 30,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return Recipe.objects.get(pk=response.json()['id'])
+
+    def assert_counters(self, obj, **counters):
+        obj.refresh_from_db()
+        self.assertEqual(
+            {counter: getattr(obj, counter) for counter in counters},
+            counters)
+        for model, counter, related, field in COUNTERS:
+            self.assertFalse(get_drift(model, counter, related, field),
+                             f'{model._meta.model_name}.{counter}')
+
+    def test_recipe_create_and_delete(self):
+        recipe = self.create_recipe()
+        self.assert_counters(self.author, recipes_count=1)
+        response = self.get_client(self.author).delete(
+            f'/api/recipes/{recipe.pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assert_counters(self.author, recipes_count=0)
+
+    def test_follow_and_unfollow(self):
+        client = self.get_client(self.reader)
+        url = f'/api/users/{self.author.pk}/subscribe/'
+        self.assertEqual(client.post(url).status_code, 201)
+        self.assertEqual(client.post(url).status_code, 400)
+        self.assert_counters(self.author, followers_count=1)
+        self.assertEqual(client.delete(url).status_code, 204)
+        self.assert_counters(self.author, followers_count=0)
+
+    def test_favorite_and_cart(self):
+        recipe = self.create_recipe()
+        client = self.get_client(self.reader)
+        for path, counter in (('favorite', 'favorites_count'),
+                              ('shopping_cart', 'in_carts_count')):
+            with self.subTest(path=path):
+                url = f'/api/recipes/{recipe.pk}/{path}/'
+                self.assertEqual(client.post(url).status_code, 201)
+                self.assertEqual(client.post(url).status_code, 400)
+                self.assert_counters(recipe, **{counter: 1})
+                self.assertEqual(client.delete(url).status_code, 204)
+                self.assert_counters(recipe, **{counter: 0})
+
+    def test_recipe_deleted_with_links(self):
+        recipe = self.create_recipe()
+        client = self.get_client(self.reader)
+        for path in ('favorite', 'shopping_cart'):
+            client.post(f'/api/recipes/{recipe.pk}/{path}/')
+        self.assert_counters(recipe, favorites_count=1, in_carts_count=1)
+        response = self.get_client(self.author).delete(
+            f'/api/recipes/{recipe.pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Recipe.objects.filter(pk=recipe.pk).exists())
+        self.assert_counters(self.author, recipes_count=0)
+
+    def test_reconcile_repairs_drift(self):
+        recipe = self.create_recipe()
+        self.get_client(self.reader).post(
+            f'/api/recipes/{recipe.pk}/favorite/')
+        Recipe.objects.filter(pk=recipe.pk).update(favorites_count=5,
+                                                   in_carts_count=2)
+        User.objects.filter(pk=self.author.pk).update(recipes_count=3,
+                                                      followers_count=1)
+        with self.assertRaises(CommandError):
+            call_command('reconcile_counters', '--check', stdout=StringIO())
+        call_command('reconcile_counters', stdout=StringIO())
+        call_command('reconcile_counters', '--check', stdout=StringIO())
+        self.assert_counters(recipe, favorites_count=1, in_carts_count=0)
+        self.assert_counters(self.author, recipes_count=1, followers_count=0)
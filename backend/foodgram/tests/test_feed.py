@@ -0,0 +1,98 @@
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import FeedEntry, Ingredient, Recipe, Tag
+from users.models import Follow, User
+
+from .base import BaseTestCase, make_image_data
+
+FEED_URL = '/api/recipes/feed/'
+
+
+class FeedTests(BaseTestCase):
+    """Лента подписок: раздача при публикации, подписке и отписке."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = cls.create_user('reader')
+        cls.author = cls.create_user('author')
+        cls.other = cls.create_user('other')
+        cls.tag = Tag.objects.create(name='Обед', color='#49B64E',
+                                     slug='lunch')
+        cls.ingredient = Ingredient.objects.create(name='Соль',
+                                                   measurement_unit='г')
+
+    def get_client(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token {}'.format(
+            Token.objects.get_or_create(user=user)[0].key))
+        return client
+
+    def create_recipes(self, author, count):
+        return [Recipe.objects.create(author=author, name=f'Рецепт {number}',
+                                      text='Описание.', cooking_time=10)
+                for number in range(count)]
+
+    def get_feed(self, **params):
+        response = self.get_client(self.reader).get(FEED_URL, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_paginated_without_limit(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        recipes = self.create_recipes(self.author, 8)
+        FeedEntry.objects.backfill(self.reader, self.author)
+        feed = self.get_feed()
+        self.assertEqual(feed['count'], 8)
+        self.assertEqual([recipe['id'] for recipe in feed['results']],
+                         [recipe.pk for recipe in recipes[::-1][:6]])
+        self.assertIsNotNone(feed['next'])
+        self.assertEqual(len(self.get_feed(limit=1000)['results']), 8)
+
+    def test_fan_out_on_create(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        response = self.get_client(self.author).post('/api/recipes/', {
+            'tags': [self.tag.pk],
+            'ingredients': [{'id': self.ingredient.pk, 'amount': 5}],
+            'image': make_image_data(),
+            'name': 'Суп', 'text': 'Суп.', 'cooking_time': 30,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual([recipe['id'] for recipe in
+                          self.get_feed()['results']],
+                         [response.json()['id']])
+        self.assertFalse(FeedEntry.objects.filter(user=self.other).exists())
+
+    def test_backfill_on_follow(self):
+        recipes = self.create_recipes(self.author, 2)
+        response = self.get_client(self.reader).post(
+            f'/api/users/{self.author.pk}/subscribe/')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(
+            set(FeedEntry.objects.filter(user=self.reader)
+                .values_list('recipe', flat=True)),
+            {recipe.pk for recipe in recipes})
+
+    def test_trimmed_on_unfollow(self):
+        client = self.get_client(self.reader)
+        for author in (self.author, self.other):
+            self.create_recipes(author, 2)
+            client.post(f'/api/users/{author.pk}/subscribe/')
+        response = client.delete(
+            f'/api/users/{self.author.pk}/subscribe/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(
+            set(FeedEntry.objects.filter(user=self.reader)
+                .values_list('author', flat=True)),
+            {self.other.pk})
+
+    def test_removed_with_recipe(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        deleted, kept = self.create_recipes(self.author, 2)
+        User.objects.filter(pk=self.author.pk).update(recipes_count=2)
+        FeedEntry.objects.backfill(self.reader, self.author)
+        response = self.get_client(self.author).delete(
+            f'/api/recipes/{deleted.pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual([recipe['id'] for recipe in
+                          self.get_feed()['results']], [kept.pk])
@@ -0,0 +1,146 @@
+import base64
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+
+from api.fields import DeferredImageField
+from recipes.images import process_image_job
+from recipes.models import Ingredient, Recipe, RecipeImageJob, Tag
+
+from .base import BaseTestCase
+
+
+def make_image(color='red', size=(1200, 900), image_format='JPEG'):
+    buffer = BytesIO()
+    Image.new('RGB', size, color).save(buffer, image_format)
+    return buffer.getvalue()
+
+
+class RecipeImageVariantTests(BaseTestCase):
+    """Копии изображения строятся при обработке и только читаются API."""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.recipe = Recipe.objects.create(
+            author=self.create_user('author'), name='Борщ',
+            text='Свекла.', cooking_time=90)
+
+    def process(self, data):
+        job = RecipeImageJob.objects.create(recipe=self.recipe, data=data)
+        process_image_job(job)
+        self.recipe.refresh_from_db()
+
+    def test_variants_saved_with_image(self):
+        self.process(make_image())
+        variants = self.recipe.image_variants
+        self.assertEqual(variants['source'], self.recipe.image.name)
+        for variant, size in (('card', (480, 360)), ('detail', (960, 720)),
+                              ('preview', (160, 120))):
+            with self.recipe.image.storage.open(variants[variant]) as file:
+                image = Image.open(file)
+                self.assertEqual((image.format, image.size), ('WEBP', size))
+
+    def test_representation_reads_stored_variants(self):
+        self.process(make_image())
+        variants = self.recipe.image_variants
+        client = APIClient()
+        with mock.patch('recipes.images.save_variants') as save_variants:
+            with mock.patch('recipes.images.Image.open') as image_open:
+                detail = client.get(f'/api/recipes/{self.recipe.pk}/').json()
+                listed = client.get('/api/recipes/', {'limit': 10}).json()
+        save_variants.assert_not_called()
+        image_open.assert_not_called()
+        self.assertTrue(detail['image'].endswith(variants['detail']))
+        self.assertTrue(
+            listed['results'][0]['image'].endswith(variants['card']))
+
+    def test_original_served_until_variants_built(self):
+        self.process(make_image())
+        Recipe.objects.filter(pk=self.recipe.pk).update(image_variants={})
+        response = APIClient().get(f'/api/recipes/{self.recipe.pk}/')
+        self.assertTrue(
+            response.json()['image'].endswith(self.recipe.image.name))
+        call_command('generate_image_variants', stdout=StringIO())
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_variants['source'],
+                         self.recipe.image.name)
+
+    def test_replaced_image_files_deleted(self):
+        self.process(make_image())
+        storage = self.recipe.image.storage
+        old_names = list(self.recipe.image_variants.values())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.process(make_image('blue', image_format='PNG'))
+        for name in old_names:
+            self.assertFalse(storage.exists(name), name)
+        for name in self.recipe.image_variants.values():
+            self.assertTrue(storage.exists(name), name)
+
+    def test_decompression_bomb_marked_failed(self):
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 100):
+            self.process(make_image(size=(20, 20)))
+        self.assertEqual(self.recipe.image_status, Recipe.IMAGE_FAILED)
+        self.assertFalse(self.recipe.image)
+
+
+class DeferredImageFieldTests(SimpleTestCase):
+    """Заголовок изображения проверяется до постановки в очередь."""
+
+    def validate(self, data):
+        return DeferredImageField(variant='detail').to_internal_value(
+            base64.b64encode(data).decode())
+
+    def test_valid_image_returned_as_bytes(self):
+        data = make_image(size=(10, 10), image_format='PNG')
+        self.assertEqual(self.validate(data), data)
+
+    def test_decompression_bomb_rejected(self):
+        # Предупреждение Pillow выдаёт выше MAX_IMAGE_PIXELS,
+        # ошибку - выше двойного значения.
+        for size in ((12, 10), (20, 20)):
+            with self.subTest(size=size):
+                data = make_image(size=size, image_format='PNG')
+                with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 100):
+                    with self.assertRaisesMessage(ValidationError,
+                                                  '100 пикселей'):
+                        self.validate(data)
+
+
+class RecipeImageStatusTests(BaseTestCase):
+    """Состояние изображения отдаётся в ответе и не меняется клиентом."""
+
+    def test_pending_after_upload(self):
+        author = self.create_user('author')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token {}'.format(
+            Token.objects.create(user=author).key))
+        tag = Tag.objects.create(name='Обед', color='#49B64E', slug='lunch')
+        ingredient = Ingredient.objects.create(name='Соль',
+                                               measurement_unit='г')
+        with override_settings(RECIPE_IMAGE_ASYNC=True):
+            response = client.post('/api/recipes/', {
+                'tags': [tag.pk],
+                'ingredients': [{'id': ingredient.pk, 'amount': 5}],
+                'image': base64.b64encode(make_image()).decode(),
+                'image_status': Recipe.IMAGE_READY,
+                'name': 'Суп', 'text': 'Суп.', 'cooking_time': 30,
+            }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['image_status'],
+                         Recipe.IMAGE_PENDING)
+        response = client.get(f'/api/recipes/{response.json()["id"]}/')
+        self.assertEqual(response.json()['image_status'],
+                         Recipe.IMAGE_PENDING)
@@ -0,0 +1,48 @@
+from rest_framework.test import APIClient
+
+from recipes.models import CatalogVersion, Ingredient
+
+from .base import BaseTestCase
+
+
+class IngredientSearchTests(BaseTestCase):
+    """Индекс ингредиентов следует за версией справочника в базе."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create([
+            Ingredient(name='Сахар', measurement_unit='г'),
+            Ingredient(name='Соль', measurement_unit='г'),
+            Ingredient(name='Ванильный сахар', measurement_unit='г'),
+        ])
+        CatalogVersion.objects.bump(CatalogVersion.INGREDIENTS)
+
+    def search(self, name):
+        response = APIClient().get('/api/ingredients/', {'name': name})
+        self.assertEqual(response.status_code, 200)
+        return [ingredient['name'] for ingredient in response.json()]
+
+    def test_prefix_matches_first(self):
+        self.assertEqual(self.search('сах'), ['Сахар', 'Ванильный сахар'])
+
+    def test_import_from_another_process_visible(self):
+        self.assertEqual(self.search('сол'), ['Соль'])
+        # Так импортирует import_ingredients: без сигналов модели,
+        # только со сменой версии справочника.
+        Ingredient.objects.bulk_create(
+            [Ingredient(name='Солод', measurement_unit='г')])
+        CatalogVersion.objects.bump(CatalogVersion.INGREDIENTS)
+        self.assertEqual(self.search('сол'), ['Солод', 'Соль'])
+
+    def test_warm_search_without_queries(self):
+        self.search('сах')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.search('сол'), ['Соль'])
+
+    def test_bump_invalidates_cached_versions(self):
+        version = CatalogVersion.objects.get_cached()[
+            CatalogVersion.INGREDIENTS].version
+        with self.captureOnCommitCallbacks(execute=True):
+            CatalogVersion.objects.bump(CatalogVersion.INGREDIENTS)
+        self.assertEqual(CatalogVersion.objects.get_cached()[
+            CatalogVersion.INGREDIENTS].version, version + 1)
@@ -0,0 +1,97 @@
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+from rest_framework.test import APIClient
+
+from api.metrics import (ARCHIVE_NAME, RequestTimings, current_timings,
+                         metrics_store, serialize)
+from api.serializers import TagSerializer
+from recipes.models import Tag
+
+from .base import BaseTestCase
+
+
+class ServerTimingTests(BaseTestCase):
+    """Заголовок Server-Timing со стадиями запроса."""
+
+    @override_settings(SERVER_TIMING=True)
+    def test_header_stages(self):
+        Tag.objects.create(name='Завтрак', color='#E26C2D', slug='breakfast')
+        for url in ('/api/tags/', '/api/recipes/', '/api/ingredients/'):
+            with self.subTest(url=url):
+                response = APIClient().get(url)
+                stages = [stage.split(';', 1)[0]
+                          for stage in response['Server-Timing'].split(', ')]
+                self.assertEqual(
+                    stages, ['db', 'serialize', 'view', 'render', 'total'])
+                self.assertIn('serialize;dur=', response['Server-Timing'])
+
+    def test_serialize_excludes_queries(self):
+        Tag.objects.create(name='Завтрак', color='#E26C2D', slug='breakfast')
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        self.addCleanup(current_timings.reset, token)
+        start = time.perf_counter()
+        with timings.capture_queries():
+            data = serialize(TagSerializer(Tag.objects.all(), many=True))
+        elapsed = time.perf_counter() - start
+        self.assertEqual(len(data), 1)
+        self.assertEqual(timings.queries, 1)
+        self.assertGreater(timings.serialize, 0)
+        self.assertLessEqual(timings.serialize + timings.db, elapsed)
+
+    def test_serialize_without_timings(self):
+        tag = Tag.objects.create(
+            name='Завтрак', color='#E26C2D', slug='breakfast')
+        self.assertEqual(serialize(TagSerializer(tag))['slug'], 'breakfast')
+
+    def test_snapshots_outside_shared_dir(self):
+        self.assertNotEqual(
+            Path(settings.METRICS_DIR),
+            Path(tempfile.gettempdir()) / 'foodgram_metrics')
+
+    @override_settings(SERVER_TIMING=False)
+    def test_header_disabled(self):
+        response = APIClient().get('/api/tags/')
+        self.assertNotIn('Server-Timing', response)
+
+
+class MetricsArchiveTests(SimpleTestCase):
+    """Снимки завершившихся процессов уходят в архив без потери счётчиков."""
+
+    def setUp(self):
+        directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings_override = override_settings(METRICS_DIR=directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+        self.snapshot = directory / f'{process.pid}-snapshot.json'
+        self.snapshot.write_text(json.dumps({
+            'routes': {'tags-list GET': {
+                'count': 2, 'sum': 0.5, 'queries': 4, 'buckets': [2],
+                'db': 0.1, 'view': 0.2, 'render': 0.1}},
+            'pools': {'default': {'size': 3, 'checkouts': 5}},
+        }))
+        self.archive = directory / ARCHIVE_NAME
+
+    def collect(self):
+        routes, pools = metrics_store.collect()
+        return routes['tags-list GET']['count'], pools['default']
+
+    def test_dead_snapshot_archived(self):
+        self.assertEqual(self.collect(), (2, {'checkouts': 5}))
+        self.assertFalse(self.snapshot.exists())
+        self.assertTrue(self.archive.exists())
+
+    def test_archive_counted_once(self):
+        self.collect()
+        self.assertEqual(self.collect(), (2, {'checkouts': 5}))
@@ -0,0 +1,73 @@
+from datetime import timedelta
+
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.pagination import RecipePagination
+from recipes.models import Recipe
+
+from .base import BaseTestCase
+
+RECIPES_URL = '/api/recipes/'
+
+
+class RecipeCursorPaginationTests(BaseTestCase):
+    """Курсорный режим выдачи рецептов по ключу (pub_date, id)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = cls.create_user('author')
+        cls.recipes = [
+            Recipe.objects.create(author=author, name=f'Рецепт {number}',
+                                  text='Описание.', cooking_time=10)
+            for number in range(5)
+        ]
+        # У трёх рецептов одна дата: порядок задаёт только id.
+        now = timezone.now()
+        Recipe.objects.filter(
+            pk__in=[recipe.pk for recipe in cls.recipes[:3]]
+        ).update(pub_date=now)
+        for offset, recipe in enumerate(cls.recipes[3:], 1):
+            Recipe.objects.filter(pk=recipe.pk).update(
+                pub_date=now - timedelta(days=offset))
+
+    def get(self, params):
+        response = APIClient().get(RECIPES_URL, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_pages_follow_cursor(self):
+        page = self.get({'cursor': '', 'limit': 2})
+        self.assertNotIn('count', page)
+        ids = []
+        while True:
+            ids.extend(recipe['id'] for recipe in page['results'])
+            if page['next'] is None:
+                break
+            page = APIClient().get(page['next']).json()
+        recipes = self.recipes
+        self.assertEqual(ids, [recipes[2].pk, recipes[1].pk, recipes[0].pk,
+                               recipes[3].pk, recipes[4].pk])
+
+    def test_cursor_round_trip(self):
+        pagination = RecipePagination()
+        recipe = Recipe.objects.get(pk=self.recipes[1].pk)
+        cursor = pagination.encode_cursor(recipe.pub_date, recipe.pk)
+        self.assertEqual(pagination.decode_cursor(cursor),
+                         (recipe.pub_date, recipe.pk))
+        page = self.get({'cursor': cursor, 'limit': 10})
+        self.assertEqual([recipe['id'] for recipe in page['results']],
+                         [self.recipes[0].pk, self.recipes[3].pk,
+                          self.recipes[4].pk])
+
+    def test_malformed_cursor(self):
+        for cursor in ('@@@', 'bm90LWEtY3Vyc29y', 'eHx5', 'eHwx'):
+            with self.subTest(cursor=cursor):
+                response = APIClient().get(RECIPES_URL, {'cursor': cursor})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('cursor', response.json())
+
+    def test_own_ordering_uses_pages(self):
+        page = self.get({'cursor': '', 'ordering': 'popular', 'limit': 2})
+        self.assertEqual(page['count'], len(self.recipes))
+        self.assertEqual(len(page['results']), 2)
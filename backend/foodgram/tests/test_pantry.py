@@ -0,0 +1,73 @@
+from rest_framework.test import APIClient
+
+from recipes.models import (Ingredient, IngredientRecipe, PantryIndexChange,
+                            Recipe)
+from recipes.pantry import PantryIndex, pantry_index
+
+from .base import BaseTestCase
+
+
+class PantryIndexTests(BaseTestCase):
+    """Индекс продуктов догоняет журнал изменений в базе."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = cls.create_user('author')
+        cls.egg, cls.milk, cls.flour = (
+            Ingredient.objects.create(name=name, measurement_unit=unit)
+            for name, unit in (('Яйцо', 'шт'), ('Молоко', 'мл'),
+                               ('Мука', 'г')))
+        cls.omelette = cls.create_recipe('Омлет', cls.egg, cls.milk)
+
+    @classmethod
+    def create_recipe(cls, name, *ingredients):
+        recipe = Recipe.objects.create(author=cls.author, name=name,
+                                       text=name, cooking_time=10)
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in ingredients)
+        return recipe
+
+    def setUp(self):
+        super().setUp()
+        self.index = PantryIndex()
+
+    def match(self, *ingredients, index=None):
+        matches = (index or self.index).match(
+            [ingredient.pk for ingredient in ingredients])
+        return [(match.recipe, match.coverage) for match in matches[:]]
+
+    def test_change_from_another_process_applied(self):
+        self.assertEqual(self.match(self.egg), [(self.omelette.pk, 0.5)])
+        pancakes = self.create_recipe('Блины', self.egg, self.flour)
+        # Другой процесс: изменение видно только через журнал в базе.
+        other = PantryIndex()
+        with self.captureOnCommitCallbacks(execute=True):
+            other.recipe_changed(pancakes.pk)
+        self.assertEqual(self.match(self.flour), [(pancakes.pk, 0.5)])
+
+    def test_late_commit_below_version_applied(self):
+        self.match(self.egg)
+        first = PantryIndexChange.objects.create(recipe_id=self.omelette.pk)
+        self.match(self.egg)
+        pancakes = self.create_recipe('Блины', self.egg, self.flour)
+        late = PantryIndexChange(id=first.pk - 1, recipe_id=pancakes.pk)
+        late.save(force_insert=True)
+        self.assertEqual(self.match(self.flour), [(pancakes.pk, 0.5)])
+
+    def test_invalidate_rebuilds(self):
+        self.match(self.egg)
+        IngredientRecipe.objects.filter(recipe=self.omelette).delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            pantry_index.invalidate()
+        self.assertEqual(self.match(self.egg), [])
+
+    def test_pantry_view(self):
+        pantry_index._index = None
+        response = APIClient().get(
+            '/api/recipes/pantry/',
+            {'ingredients': f'{self.egg.pk},{self.milk.pk}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.json()['results']],
+            [self.omelette.pk])
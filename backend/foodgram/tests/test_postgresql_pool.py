@@ -0,0 +1,208 @@
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock, skipIf
+
+import psycopg2
+from django.test import SimpleTestCase
+from psycopg2 import extensions
+
+try:
+    from foodgram.postgresql_pool import base, pool
+except ImportError:
+    # psycopg2-pool нужен только бэкенду с пулом.
+    base = pool = None
+
+
+class FakeCursor:
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, sql):
+        if self.conn.broken:
+            raise psycopg2.OperationalError('server closed the connection')
+
+
+class FakeConnection:
+    """Соединение psycopg2 без сервера."""
+
+    def __init__(self):
+        self.closed = 0
+        self.broken = False
+        self.autocommit = True
+        self.info = SimpleNamespace(
+            transaction_status=extensions.TRANSACTION_STATUS_IDLE)
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+class FakeConnectionPool:
+    """ThreadSafeConnectionPool, который открывает FakeConnection."""
+
+    def __init__(self, minconn, maxconn, idle_timeout, dsn):
+        self.lock = threading.Lock()
+        self.idle_connections = []
+
+    def getconn(self):
+        with self.lock:
+            if self.idle_connections:
+                return self.idle_connections.pop()
+        return FakeConnection()
+
+    def putconn(self, conn):
+        if not conn.closed:
+            with self.lock:
+                self.idle_connections.append(conn)
+
+    def clear(self):
+        with self.lock:
+            for conn in self.idle_connections:
+                conn.close()
+            self.idle_connections.clear()
+
+
+@skipIf(pool is None, 'psycopg2-pool не установлен.')
+class DatabasePoolTests(SimpleTestCase):
+    """Выдача, возврат и отбраковка соединений пула."""
+
+    def create_pool(self, **options):
+        with mock.patch.object(pool, 'ThreadSafeConnectionPool',
+                               FakeConnectionPool):
+            return pool.DatabasePool(
+                'default', 'dbname=test', {'TIMEOUT': 0.01, **options})
+
+    def test_connection_reused(self):
+        db_pool = self.create_pool()
+        conn = db_pool.getconn()
+        db_pool.putconn(conn)
+        self.assertIs(db_pool.getconn(), conn)
+        stats = db_pool.get_stats()
+        self.assertEqual((stats['checkouts'], stats['opened'],
+                          stats['in_use']), (2, 1, 1))
+
+    def test_checkout_waits_for_free_slot(self):
+        db_pool = self.create_pool(MAX_SIZE=1)
+        conn = db_pool.getconn()
+        with self.assertRaises(psycopg2.OperationalError):
+            db_pool.getconn()
+        self.assertEqual(db_pool.get_stats()['timeouts'], 1)
+        db_pool.putconn(conn)
+        self.assertIs(db_pool.getconn(), conn)
+
+    def test_slot_released_when_connect_fails(self):
+        db_pool = self.create_pool(MAX_SIZE=1)
+        with mock.patch.object(db_pool.pool, 'getconn',
+                               side_effect=psycopg2.OperationalError):
+            with self.assertRaises(psycopg2.OperationalError):
+                db_pool.getconn()
+        db_pool.getconn()
+        self.assertEqual(db_pool.get_stats()['timeouts'], 0)
+
+    def test_expired_connection_replaced(self):
+        db_pool = self.create_pool(MAX_LIFETIME=60)
+        old = db_pool.getconn()
+        db_pool.putconn(old)
+        db_pool.opened[old] = time.monotonic() - 61
+        conn = db_pool.getconn()
+        self.assertIsNot(conn, old)
+        self.assertTrue(old.closed)
+        self.assertEqual(db_pool.get_stats()['expired'], 1)
+
+    def test_expired_connection_closed_on_return(self):
+        db_pool = self.create_pool(MAX_LIFETIME=60)
+        conn = db_pool.getconn()
+        db_pool.opened[conn] = time.monotonic() - 61
+        db_pool.putconn(conn)
+        self.assertTrue(conn.closed)
+        self.assertEqual(db_pool.get_stats()['idle'], 0)
+
+    def test_broken_connection_replaced(self):
+        db_pool = self.create_pool()
+        old = db_pool.getconn()
+        db_pool.putconn(old)
+        old.broken = True
+        conn = db_pool.getconn()
+        self.assertIsNot(conn, old)
+        self.assertTrue(old.closed)
+        self.assertEqual(db_pool.get_stats()['unhealthy'], 1)
+
+    def test_closed_connection_replaced_without_health_check(self):
+        db_pool = self.create_pool(HEALTH_CHECK=False)
+        old = db_pool.getconn()
+        db_pool.putconn(old)
+        old.broken = True
+        self.assertIs(db_pool.getconn(), old)
+        db_pool.putconn(old)
+        old.closed = 2
+        self.assertIsNot(db_pool.getconn(), old)
+
+    def test_connection_in_transaction_closed_on_return(self):
+        db_pool = self.create_pool()
+        for status in (extensions.TRANSACTION_STATUS_INTRANS,
+                       extensions.TRANSACTION_STATUS_INERROR):
+            with self.subTest(status=status):
+                conn = db_pool.getconn()
+                conn.info.transaction_status = status
+                db_pool.putconn(conn)
+                self.assertTrue(conn.closed)
+                self.assertEqual(db_pool.get_stats()['idle'], 0)
+        self.assertEqual(db_pool.get_stats()['unhealthy'], 2)
+
+    def test_get_pool_per_process(self):
+        params = {'dbname': 'test', 'host': 'db'}
+        with mock.patch.object(pool, 'ThreadSafeConnectionPool',
+                               FakeConnectionPool):
+            with mock.patch.dict(pool.pools, clear=True):
+                first = pool.get_pool('default', params, {})
+                self.assertIs(pool.get_pool('default', params, {}), first)
+                with mock.patch.object(pool.os, 'getpid', return_value=0):
+                    child = pool.get_pool('default', params, {})
+                self.assertIsNot(child, first)
+                self.assertEqual([key[0] for key in pool.pools], [0])
+
+
+@skipIf(base is None, 'psycopg2-pool не установлен.')
+class DatabaseWrapperCloseTests(SimpleTestCase):
+    """Закрытие соединения Django возвращает его в пул."""
+
+    def setUp(self):
+        self.wrapper = base.DatabaseWrapper({
+            'ENGINE': 'foodgram.postgresql_pool', 'NAME': 'test',
+            'OPTIONS': {}, 'TIME_ZONE': None, 'CONN_MAX_AGE': 0,
+            'AUTOCOMMIT': True, 'ATOMIC_REQUESTS': False,
+        }, alias='pool_test')
+        self.conn = FakeConnection()
+        self.wrapper.connection = self.conn
+        self.wrapper.connection_pool = mock.Mock()
+
+    def test_returned_to_pool(self):
+        self.wrapper._close()
+        self.wrapper.connection_pool.putconn.assert_called_once_with(
+            self.conn)
+        self.assertFalse(self.conn.closed)
+
+    def test_closed_inside_atomic_block(self):
+        self.wrapper.in_atomic_block = True
+        self.wrapper._close()
+        self.assertTrue(self.conn.closed)
+        self.wrapper.connection_pool.putconn.assert_called_once_with(
+            self.conn)
+
+    def test_closed_without_pool(self):
+        self.wrapper.connection_pool = None
+        self.wrapper._close()
+        self.assertTrue(self.conn.closed)
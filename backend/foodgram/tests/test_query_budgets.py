@@ -0,0 +1,80 @@
+from unittest import mock
+
+from rest_framework.fields import Field
+
+from api.metrics import RequestTimings
+from api.queries import QueryBudgetExceeded, QueryInspector
+from api.views import RecipeViewSet
+from recipes.models import Recipe
+
+from .base import CatalogTestCase
+
+
+class CountRecipesField(Field):
+
+    def to_representation(self, value):
+        return Recipe.objects.filter(author=value).count()
+
+
+class QueryBudgetTests(CatalogTestCase):
+    """Бюджеты запросов с холодным кэшем в режиме raise."""
+
+    def get_urls(self):
+        recipe, author = self.recipes[0], self.authors[0]
+        return (
+            (f'/api/users/{author.pk}/', {}),
+            ('/api/recipes/', {'limit': 6}),
+            (f'/api/recipes/{recipe.pk}/', {}),
+            (f'/api/recipes/{recipe.pk}/similar/', {}),
+            ('/api/recipes/pantry/',
+             {'ingredients': [self.ingredients[0].pk]}),
+            ('/api/tags/', {}),
+            (f'/api/tags/{self.tags[0].pk}/', {}),
+            ('/api/ingredients/', {}),
+            ('/api/ingredients/', {'name': 'Са'}),
+            (f'/api/ingredients/{self.ingredients[0].pk}/', {}),
+        )
+
+    def assert_within_budget(self, client, url, params):
+        response = client.get(url, params)
+        self.assertEqual(response.status_code, 200, url)
+        if response.streaming:
+            b''.join(response.streaming_content)
+
+    def test_anonymous(self):
+        for url, params in self.get_urls():
+            with self.subTest(url=url, params=params):
+                self.setUp()
+                self.assert_within_budget(self.get_client(False), url, params)
+
+    def test_authenticated(self):
+        urls = self.get_urls() + (
+            ('/api/users/', {'limit': 6}),
+            ('/api/users/me/', {}),
+            ('/api/recipes/feed/', {'limit': 6}),
+            ('/api/users/subscriptions/', {'limit': 6}),
+            ('/api/recipes/download_shopping_cart/', {}),
+        )
+        for url, params in urls:
+            with self.subTest(url=url, params=params):
+                self.setUp()
+                self.assert_within_budget(self.get_client(True), url, params)
+
+    def test_exceeded_budget_raises(self):
+        budgets = {**RecipeViewSet.query_budgets, 'retrieve': 1}
+        with mock.patch.object(RecipeViewSet, 'query_budgets', budgets):
+            with self.assertRaisesMessage(QueryBudgetExceeded,
+                                          'при бюджете 1'):
+                self.get_client(True).get(
+                    f'/api/recipes/{self.recipes[0].pk}/')
+
+    def test_origin_names_field_method(self):
+        inspector = QueryInspector()
+        with RequestTimings().capture_queries(), inspector.capture():
+            for author in self.authors:
+                CountRecipesField().to_representation(author.pk)
+        (_, count, origin), = inspector.get_repeats()
+        self.assertEqual(count, len(self.authors))
+        self.assertTrue(origin.startswith(
+            'CountRecipesField.to_representation (tests/test_query_budgets'),
+            origin)
@@ -0,0 +1,47 @@
+import json
+
+from django.core.cache import cache
+
+from .base import CatalogTestCase
+
+
+class QueryCountTests(CatalogTestCase):
+    """Число запросов не зависит от размера страницы."""
+
+    def assert_queries(self, count, url, params=None, authenticated=True):
+        cache.clear()
+        client = self.get_client(authenticated)
+        with self.assertNumQueries(count):
+            response = client.get(url, params)
+            content = (b''.join(response.streaming_content)
+                       if response.streaming else response.content)
+        self.assertEqual(response.status_code, 200)
+        return content
+
+    def test_recipe_list(self):
+        for limit in (1, len(self.recipes)):
+            with self.subTest(limit=limit):
+                content = self.assert_queries(
+                    4, '/api/recipes/', {'limit': limit},
+                    authenticated=False)
+                self.assertEqual(len(json.loads(content)['results']), limit)
+                self.assert_queries(8, '/api/recipes/', {'limit': limit})
+
+    def test_recipe_retrieve(self):
+        url = f'/api/recipes/{self.recipes[0].pk}/'
+        self.assert_queries(5, url, authenticated=False)
+        recipe = json.loads(self.assert_queries(9, url))
+        self.assertTrue(recipe['is_favorited'])
+        self.assertTrue(recipe['author']['is_subscribed'])
+
+    def test_subscriptions(self):
+        for limit in (1, len(self.authors)):
+            with self.subTest(limit=limit):
+                content = self.assert_queries(
+                    4, '/api/users/subscriptions/', {'limit': limit})
+                self.assertEqual(len(json.loads(content)['results']), limit)
+
+    def test_download_shopping_cart(self):
+        content = self.assert_queries(
+            2, '/api/recipes/download_shopping_cart/')
+        self.assertIn('Мука', content.decode())
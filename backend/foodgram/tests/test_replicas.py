@@ -0,0 +1,115 @@
+import shutil
+import sqlite3
+import tempfile
+from pathlib import Path
+from unittest import skipUnless
+
+from django.core.cache import cache
+from django.db import connection, connections
+from django.test import TransactionTestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from foodgram.routers import read_alias, replica_monitor, use_primary
+from recipes.models import Recipe, Tag
+from users.models import User
+
+REPLICA = 'replica_test'
+
+
+@skipUnless(connection.vendor == 'sqlite',
+            'Реплика создаётся копированием базы SQLite.')
+@override_settings(DATABASE_REPLICAS=[REPLICA], QUERY_INSPECTION='warn')
+class ReplicaRoutingTests(TransactionTestCase):
+    """Чтение с реплики, запись и закрепление за основной базой.
+
+    Реплика - копия пустой тестовой базы в отдельном файле SQLite, поэтому
+    строки, созданные в одной базе, в другой не видны. TestCase не подходит:
+    внутри транзакции роутер читает из основной базы. Бюджеты запросов
+    не проверяются: проверка реплики добавляет запрос к первому запросу.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        directory = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = Path(directory) / 'replica.sqlite3'
+        connections['default'].ensure_connection()
+        with sqlite3.connect(path) as replica:
+            connections['default'].connection.backup(replica)
+        connections.settings[REPLICA] = {
+            **connections['default'].settings_dict, 'NAME': str(path)}
+        cls.addClassCleanup(connections.settings.pop, REPLICA)
+        cls.addClassCleanup(connections[REPLICA].close)
+        # Алиас появляется только здесь, поэтому раннер не создаёт для него
+        # тестовую базу и не проверяет его при старте.
+        cls.databases = {'default', REPLICA}
+        super().setUpClass()
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        replica_monitor.checked.clear()
+        self.addCleanup(replica_monitor.checked.clear)
+        Tag.objects.create(name='Основная', color='#E26C2D', slug='primary')
+        # flush не очищает реплику: роутер запрещает на ней миграции.
+        Tag.objects.using(REPLICA).all().delete()
+        Tag.objects.using(REPLICA).create(
+            name='Реплика', color='#49B64E', slug='replica')
+        self.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token {}'.format(
+            Token.objects.create(user=self.user).key))
+
+    def get_tag_names(self, client):
+        response = client.get('/api/tags/')
+        self.assertEqual(response.status_code, 200)
+        return [tag['name'] for tag in response.json()]
+
+    def test_reads_from_replica(self):
+        self.assertEqual(self.get_tag_names(APIClient()), ['Реплика'])
+        # Токен читается из основной базы: на реплике его нет.
+        self.assertEqual(self.get_tag_names(self.client), ['Реплика'])
+
+    def test_writes_and_use_primary(self):
+        token = read_alias.set(REPLICA)
+        self.addCleanup(read_alias.reset, token)
+        self.assertEqual(
+            list(Tag.objects.values_list('name', flat=True)), ['Реплика'])
+        Tag.objects.create(name='Ужин', color='#8775D2', slug='dinner')
+        self.assertFalse(
+            Tag.objects.using(REPLICA).filter(slug='dinner').exists())
+        with use_primary():
+            self.assertEqual(
+                set(Tag.objects.values_list('name', flat=True)),
+                {'Основная', 'Ужин'})
+        self.assertEqual(
+            list(Tag.objects.values_list('name', flat=True)), ['Реплика'])
+
+    def test_primary_after_write(self):
+        recipe = Recipe.objects.create(
+            author=self.user, name='Суп', text='Суп.', cooking_time=30)
+        self.assertEqual(self.get_tag_names(self.client), ['Реплика'])
+        response = self.client.post(f'/api/recipes/{recipe.pk}/favorite/')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.get_tag_names(self.client), ['Основная'])
+        self.assertEqual(self.get_tag_names(APIClient()), ['Реплика'])
+        # Закрепление живёт в кэше REPLICA_STICKY_SECONDS секунд.
+        cache.clear()
+        self.assertEqual(self.get_tag_names(self.client), ['Реплика'])
+
+    def test_failed_read_retried_on_primary(self):
+        self.assertEqual(self.get_tag_names(APIClient()), ['Реплика'])
+        with connections[REPLICA].cursor() as cursor:
+            cursor.execute('ALTER TABLE recipes_tag RENAME TO hidden_tag')
+        self.addCleanup(self.restore_replica_table)
+        with self.assertLogs('foodgram.routers', 'WARNING'):
+            self.assertEqual(self.get_tag_names(APIClient()), ['Основная'])
+        self.assertFalse(replica_monitor.is_healthy(REPLICA))
+        with self.assertNumQueries(0, using=REPLICA):
+            self.assertEqual(self.get_tag_names(APIClient()), ['Основная'])
+
+    def restore_replica_table(self):
+        with connections[REPLICA].cursor() as cursor:
+            cursor.execute('ALTER TABLE hidden_tag RENAME TO recipes_tag')
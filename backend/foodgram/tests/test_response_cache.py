@@ -0,0 +1,58 @@
+from django.contrib.auth.models import update_last_login
+from django.core.cache import cache
+from rest_framework.test import APIClient
+
+from api.response_cache import GENERATION_KEY
+from recipes.models import Recipe
+
+from .base import BaseTestCase
+
+
+class AnonymousResponseCacheTests(BaseTestCase):
+    """Кэш ответов анонимным сбрасывается при изменении автора."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = cls.create_user('author')
+        cls.recipe = Recipe.objects.create(author=cls.author, name='Борщ',
+                                           text='Свекла.', cooking_time=90)
+
+    def get(self):
+        response = APIClient().get(f'/api/recipes/{self.recipe.pk}/')
+        self.assertEqual(response.status_code, 200)
+        return response['X-Cache'], response.json()['author']['first_name']
+
+    def test_second_request_hits(self):
+        self.assertEqual(self.get(), ('MISS', 'Author'))
+        self.assertEqual(self.get(), ('HIT', 'Author'))
+
+    def test_author_rename_invalidates(self):
+        self.get()
+        self.author.first_name = 'Автор'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.save(update_fields=('first_name',))
+        self.assertEqual(self.get(), ('MISS', 'Автор'))
+
+    def test_login_keeps_cache(self):
+        self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            update_last_login(None, self.author)
+        self.assertEqual(self.get(), ('HIT', 'Author'))
+
+    def test_evicted_generation_not_reused(self):
+        self.get()
+        self.author.first_name = 'Автор'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.save(update_fields=('first_name',))
+        cache.delete(GENERATION_KEY)
+        # Ответ первого поколения ещё в кэше и не должен снова читаться.
+        self.assertEqual(self.get(), ('MISS', 'Автор'))
+        self.assertEqual(self.get(), ('HIT', 'Автор'))
+
+    def test_bump_after_eviction_invalidates(self):
+        self.get()
+        cache.delete(GENERATION_KEY)
+        self.author.first_name = 'Автор'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.save(update_fields=('first_name',))
+        self.assertEqual(self.get(), ('MISS', 'Автор'))
@@ -0,0 +1,63 @@
+from django.db import connection
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe
+from recipes.search import SQLITE_FTS_TRIGGERS, ensure_search_triggers
+
+from .base import BaseTestCase
+
+
+class RecipeSearchTests(BaseTestCase):
+    """Поиск по базе, созданной миграциями с нуля.
+
+    В SQLite ловит триггеры FTS5, потерянные при пересоздании таблицы
+    рецептов в поздних миграциях.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = cls.create_user('author')
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Борщ украинский',
+            text='Свекла, капуста и говядина.', cooking_time=90)
+        Recipe.objects.create(author=cls.author, name='Сырники',
+                              text='Творог и мука.', cooking_time=20)
+
+    def search(self, value):
+        response = APIClient().get('/api/recipes/',
+                                   {'search': value, 'limit': 10})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def test_search_finds_new_recipe(self):
+        self.assertEqual(self.search('борщ'), [self.recipe.pk])
+
+    def test_search_by_text_and_prefix(self):
+        self.assertEqual(self.search('капус'), [self.recipe.pk])
+
+    def test_search_follows_rename(self):
+        Recipe.objects.filter(pk=self.recipe.pk).update(name='Щи')
+        self.assertEqual(self.search('борщ'), [])
+        self.assertEqual(self.search('щи'), [self.recipe.pk])
+
+    def get_triggers(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Триггеры FTS5 есть только в SQLite.')
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master "
+                           "WHERE type = 'trigger' AND name LIKE %s",
+                           ['recipes_recipe_fts_%'])
+            return {name for name, in cursor.fetchall()}
+
+    def test_sqlite_triggers_exist(self):
+        self.assertEqual(self.get_triggers(), set(SQLITE_FTS_TRIGGERS))
+
+    def test_missing_trigger_restored(self):
+        self.get_triggers()
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER recipes_recipe_fts_update')
+        Recipe.objects.filter(pk=self.recipe.pk).update(name='Щи')
+        with self.assertLogs('recipes.search', 'INFO'):
+            ensure_search_triggers()
+        self.assertEqual(self.get_triggers(), set(SQLITE_FTS_TRIGGERS))
+        self.assertEqual(self.search('щи'), [self.recipe.pk])
@@ -0,0 +1,117 @@
+import csv
+from unittest import mock
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import override_settings
+from reportlab.pdfgen import canvas
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api import shopping_list, views
+from api.queries import QueryBudgetExceeded
+from recipes.models import (Ingredient, IngredientRecipe, Recipe, ShoppingCart,
+                            ShoppingListItem)
+
+from .base import BaseTestCase
+
+URL = '/api/recipes/download_shopping_cart/'
+
+
+class ShoppingListDownloadTests(BaseTestCase):
+    """Список покупок отдаётся потоком в пределах бюджета запросов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = cls.create_user('buyer')
+        salt = Ingredient.objects.create(name='Соль', measurement_unit='г')
+        pepper = Ingredient.objects.create(name='Перец', measurement_unit='г')
+        for name, amounts in (('Суп', {salt: 5}),
+                              ('Рагу', {salt: 7, pepper: 2})):
+            recipe = Recipe.objects.create(author=cls.user, name=name,
+                                           text='Готовить.', cooking_time=30)
+            for ingredient, amount in amounts.items():
+                IngredientRecipe.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=amount)
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+            ShoppingListItem.objects.add_recipe(cls.user, recipe)
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def download(self, **kwargs):
+        response = self.client.get(URL, **kwargs)
+        content = b''.join(response.streaming_content)
+        return response, content
+
+    def test_download_txt(self):
+        response, content = self.download()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; charset=utf-8')
+        self.assertEqual(content.decode(),
+                         'Список покупок: \nПерец г - 2\nСоль г - 12')
+
+    def test_download_csv(self):
+        response, content = self.download(data={'format': 'csv'})
+        self.assertEqual(response['Content-Disposition'],
+                         'attachment;filename="ingredients.csv"')
+        self.assertEqual(
+            list(csv.reader(content.decode().splitlines())),
+            [['Ингредиент', 'Единица измерения', 'Количество'],
+             ['Перец', 'г', '2'], ['Соль', 'г', '12']])
+
+    def test_download_pdf(self):
+        lines = []
+        draw_string = canvas.Canvas.drawString
+
+        def record(pdf, x, y, text, *args, **kwargs):
+            lines.append((pdf._fontname, text))
+            return draw_string(pdf, x, y, text, *args, **kwargs)
+
+        with mock.patch.object(canvas.Canvas, 'drawString', record):
+            response, content = self.download(data={'format': 'pdf'})
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(content.startswith(b'%PDF-'))
+        self.assertTrue(content.rstrip().endswith(b'%%EOF'))
+        self.assertEqual(lines, [
+            (shopping_list.PDF_FONT, 'Список покупок: '),
+            (shopping_list.PDF_FONT, 'Перец г - 2'),
+            (shopping_list.PDF_FONT, 'Соль г - 12'),
+        ])
+
+    def test_pdf_pages(self):
+        rows = [(f'Ингредиент {number}', 'г', number)
+                for number in range(100)]
+        content = b''.join(shopping_list.stream_pdf(iter(rows)))
+        self.assertEqual(content.count(b'/Type /Page\n'), 3)
+
+    @override_settings(SHOPPING_LIST_PDF_FONT='/nonexistent/font.ttf')
+    def test_missing_pdf_font_fails_loudly(self):
+        with mock.patch.object(shopping_list.pdfmetrics,
+                               'getRegisteredFontNames', return_value=[]):
+            with self.assertRaises(ImproperlyConfigured):
+                shopping_list.stream_pdf(iter([]))
+
+    def test_stream_queries_counted(self):
+        with mock.patch.object(views.DownloadShoppingCart, 'query_budgets',
+                               {'get': 1}):
+            response = self.client.get(URL)
+            with self.assertRaises(QueryBudgetExceeded):
+                b''.join(response.streaming_content)
+
+    def test_unknown_accept_falls_back_to_txt(self):
+        response, content = self.download(HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; charset=utf-8')
+
+    def test_format_param(self):
+        response, content = self.download(data={'format': 'csv'},
+                                          HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+
+    def test_unknown_format_rejected(self):
+        response = self.client.get(URL, {'format': 'xml'})
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,132 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, ShoppingListItem, Tag
+
+from .base import BaseTestCase, make_image_data
+
+
+class ShoppingListItemTests(BaseTestCase):
+    """Позиции списка покупок совпадают с суммой по корзине."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = cls.create_user('author')
+        cls.buyers = [cls.create_user('first'), cls.create_user('second')]
+        cls.tag = Tag.objects.create(name='Обед', color='#49B64E',
+                                     slug='lunch')
+        cls.salt, cls.pepper, cls.flour = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Соль', 'Перец', 'Мука'))
+
+    def get_client(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token {}'.format(
+            Token.objects.get_or_create(user=user)[0].key))
+        return client
+
+    def get_ingredients(self, amounts):
+        return [{'id': ingredient.pk, 'amount': amount}
+                for ingredient, amount in amounts.items()]
+
+    def create_recipe(self, amounts):
+        response = self.get_client(self.author).post('/api/recipes/', {
+            'tags': [self.tag.pk],
+            'ingredients': self.get_ingredients(amounts),
+            'image': make_image_data(),
+            'name': 'Суп', 'text': 'Суп.', 'cooking_time': 30,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()['id']
+
+    def cart(self, method, user, recipe):
+        response = getattr(self.get_client(user), method)(
+            f'/api/recipes/{recipe}/shopping_cart/')
+        self.assertIn(response.status_code, (201, 204), response.content)
+
+    def get_stored(self):
+        return {
+            (user, ingredient): amount
+            for user, ingredient, amount in ShoppingListItem.objects
+            .values_list('user', 'ingredient', 'amount')}
+
+    def assert_matches_carts(self, expected=None):
+        live = {(user, ingredient): total
+                for user, ingredient, total
+                in ShoppingListItem.objects.live()}
+        self.assertEqual(self.get_stored(), live)
+        if expected is not None:
+            self.assertEqual(live, {
+                (user.pk, ingredient.pk): amount
+                for (user, ingredient), amount in expected.items()})
+
+    def test_cart_add_and_remove(self):
+        first, second = self.buyers
+        soup = self.create_recipe({self.salt: 5})
+        stew = self.create_recipe({self.salt: 7, self.pepper: 2})
+        for user, recipe in ((first, soup), (first, stew), (second, stew)):
+            self.cart('post', user, recipe)
+        self.assert_matches_carts({
+            (first, self.salt): 12, (first, self.pepper): 2,
+            (second, self.salt): 7, (second, self.pepper): 2})
+        self.cart('delete', first, stew)
+        self.assert_matches_carts({
+            (first, self.salt): 5,
+            (second, self.salt): 7, (second, self.pepper): 2})
+        self.cart('delete', first, soup)
+        self.assert_matches_carts({
+            (second, self.salt): 7, (second, self.pepper): 2})
+
+    def test_carted_recipe_ingredients_changed(self):
+        first, second = self.buyers
+        soup = self.create_recipe({self.salt: 5})
+        stew = self.create_recipe({self.salt: 7, self.pepper: 2})
+        self.cart('post', first, soup)
+        self.cart('post', first, stew)
+        self.cart('post', second, stew)
+        response = self.get_client(self.author).patch(
+            f'/api/recipes/{stew}/', {
+                'ingredients': self.get_ingredients(
+                    {self.salt: 3, self.flour: 100}),
+            }, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assert_matches_carts({
+            (first, self.salt): 8, (first, self.flour): 100,
+            (second, self.salt): 3, (second, self.flour): 100})
+
+    def test_recipe_deleted(self):
+        first, second = self.buyers
+        soup = self.create_recipe({self.salt: 5})
+        stew = self.create_recipe({self.salt: 7, self.pepper: 2})
+        self.cart('post', first, soup)
+        self.cart('post', first, stew)
+        self.cart('post', second, stew)
+        response = self.get_client(self.author).delete(
+            f'/api/recipes/{stew}/')
+        self.assertEqual(response.status_code, 204)
+        self.assert_matches_carts({(first, self.salt): 5})
+
+    def test_rebuild_idempotent(self):
+        first, second = self.buyers
+        soup = self.create_recipe({self.salt: 5})
+        stew = self.create_recipe({self.salt: 7, self.pepper: 2})
+        self.cart('post', first, soup)
+        self.cart('post', second, stew)
+        expected = self.get_stored()
+        ShoppingListItem.objects.filter(user=first).update(amount=1)
+        ShoppingListItem.objects.create(user=first, ingredient=self.flour,
+                                        amount=10)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_shopping_lists', '--check',
+                         stdout=StringIO())
+        for _ in range(2):
+            call_command('rebuild_shopping_lists', stdout=StringIO())
+            self.assertEqual(self.get_stored(), expected)
+        stdout = StringIO()
+        call_command('rebuild_shopping_lists', '--check', stdout=stdout)
+        self.assertEqual(stdout.getvalue(),
+                         'Позиций: 3, расхождений: 0\n')
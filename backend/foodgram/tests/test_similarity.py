@@ -0,0 +1,110 @@
+from io import StringIO
+
+import numpy as np
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+
+from recipes.models import Ingredient, IngredientRecipe, Recipe, RecipeNeighbor
+from recipes.similarity import RecipeMatrix
+
+from .base import BaseTestCase
+
+# Рецепт, признак, вес: теги весят меньше ингредиентов.
+PAIRS = (
+    (10, 1, 1.0), (10, 2, 1.0), (10, 7, 0.5),
+    (20, 1, 1.0), (20, 3, 1.0),
+    (30, 2, 1.0), (30, 3, 1.0), (30, 7, 0.5),
+    (40, 4, 1.0), (40, 8, 0.5),
+    (50, 1, 1.0), (50, 4, 1.0), (50, 8, 0.5),
+    (60, 5, 1.0),
+)
+
+
+def dense_cosine(pairs):
+    """Косинусная мера по плотной матрице TF-IDF, без CSR."""
+    recipes = sorted({recipe for recipe, _, _ in pairs})
+    features = sorted({feature for _, feature, _ in pairs})
+    frequency = {feature: sum(1 for _, other, _ in pairs if other == feature)
+                 for feature in features}
+    dense = np.zeros((len(recipes), len(features)))
+    for recipe, feature, weight in pairs:
+        dense[recipes.index(recipe), features.index(feature)] = weight * (
+            np.log(len(recipes) / frequency[feature]) + 1)
+    dense /= np.linalg.norm(dense, axis=1, keepdims=True)
+    scores = dense @ dense.T
+    np.fill_diagonal(scores, 0)
+    return scores
+
+
+class RecipeMatrixTests(SimpleTestCase):
+    """Пакеты CSR совпадают с плотным перебором."""
+
+    def test_batches_match_dense_cosine(self):
+        matrix = RecipeMatrix(tuple(map(np.array, zip(*PAIRS))))
+        expected = dense_cosine(PAIRS)
+        rows = np.array([5, 0, 3, 1, 4, 2])
+        seen = []
+        for chunk, scores in matrix.batches(rows, batch_size=4):
+            self.assertLessEqual(len(chunk), 4)
+            np.testing.assert_allclose(scores, expected[chunk], atol=1e-6)
+            seen.extend(chunk.tolist())
+        self.assertEqual(seen, rows.tolist())
+
+
+@override_settings(RECIPE_SIMILAR_COUNT=2)
+class IncrementalNeighborsTests(BaseTestCase):
+    """build_similar_recipes без --full пересчитывает только устаревшее."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = cls.create_user('author')
+        cls.ingredients = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Мука', 'Сахар', 'Соль', 'Перец')]
+        flour, sugar, salt, pepper = cls.ingredients
+        # Две группы без общих ингредиентов: сладкая и солёная.
+        cls.recipes = []
+        for number, ingredients in enumerate((
+                (flour, sugar), (flour, sugar), (flour,),
+                (salt, pepper), (salt, pepper), (salt,))):
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='Описание.',
+                cooking_time=10)
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(recipe=recipe, ingredient=ingredient,
+                                 amount=1)
+                for ingredient in ingredients)
+            cls.recipes.append(recipe)
+
+    def build(self, *args):
+        stdout = StringIO()
+        call_command('build_similar_recipes', *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def get_neighbors(self):
+        return {
+            (recipe, neighbor): round(score, 5)
+            for recipe, neighbor, score in RecipeNeighbor.objects.values_list(
+                'recipe', 'neighbor', 'score')}
+
+    def test_only_stale_rows_recomputed(self):
+        self.build('--full')
+        salty = [recipe.pk for recipe in self.recipes[3:]]
+        untouched = set(RecipeNeighbor.objects.filter(
+            recipe__in=salty).values_list('pk', flat=True))
+        changed = self.recipes[2]
+        IngredientRecipe.objects.create(recipe=changed,
+                                        ingredient=self.ingredients[1],
+                                        amount=1)
+        Recipe.objects.filter(pk=changed.pk).update(neighbors_stale=True)
+        self.assertEqual(self.build(), 'Пересчитано рецептов: 3\n')
+        self.assertFalse(Recipe.objects.filter(neighbors_stale=True).exists())
+        self.assertEqual(set(RecipeNeighbor.objects.filter(
+            recipe__in=salty).values_list('pk', flat=True)), untouched)
+        incremental = self.get_neighbors()
+        self.build('--full')
+        self.assertEqual(incremental, self.get_neighbors())
+
+    def test_nothing_stale(self):
+        self.build('--full')
+        self.assertEqual(self.build(), 'Пересчитано рецептов: 0\n')
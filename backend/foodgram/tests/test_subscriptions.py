@@ -0,0 +1,52 @@
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe
+from users.models import Follow
+
+from .base import BaseTestCase
+
+URL = '/api/users/subscriptions/'
+
+
+class SubscriptionListTests(BaseTestCase):
+    """Подписки с превью рецептов авторов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = cls.create_user('reader')
+        cls.token = Token.objects.create(user=cls.user)
+        for name in ('first', 'second'):
+            author = cls.create_user(name)
+            Follow.objects.create(user=cls.user, author=author)
+            for number in range(3):
+                Recipe.objects.create(author=author, name=f'{name} {number}',
+                                      text='Текст.', cooking_time=10)
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def get(self, recipes_limit):
+        return self.client.get(URL, {'recipes_limit': recipes_limit,
+                                     'limit': 10})
+
+    def test_recipes_limit(self):
+        response = self.get(2)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [len(author['recipes']) for author in response.json()['results']],
+            [2, 2])
+
+    def test_zero_recipes_limit(self):
+        response = self.get(0)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [len(author['recipes']) for author in response.json()['results']],
+            [0, 0])
+
+    def test_invalid_recipes_limit(self):
+        for value in (-1, 'many'):
+            with self.subTest(value=value):
+                self.assertEqual(self.get(value).status_code, 400)
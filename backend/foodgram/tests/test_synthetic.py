@@ -0,0 +1,45 @@
+import csv
+import random
+from unittest import mock
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import SimpleTestCase
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from recipes.models import Recipe
+from recipes.synthetic import RECIPE_FIELDS, TIMESTAMP_WINDOW, copy_rows
+
+
+class CopyRowsTests(SimpleTestCase):
+    """Строки COPY получают собственные даты создания и изменения."""
+
+    def copy(self, rows):
+        with mock.patch.object(connections[DEFAULT_DB_ALIAS],
+                               'cursor') as cursor:
+            copy_rows(Recipe, RECIPE_FIELDS, rows, random.Random(0))
+        sql, buffer = (cursor.return_value.__enter__.return_value
+                       .copy_expert.call_args.args)
+        columns = sql[sql.index('(') + 1:sql.index(')')].split(', ')
+        return [dict(zip((column.strip('"') for column in columns), row))
+                for row in csv.reader(buffer)]
+
+    def parse(self, value):
+        # SQLite хранит даты без часового пояса, в UTC.
+        date = parse_datetime(value)
+        if timezone.is_naive(date):
+            date = timezone.make_aware(date, timezone.utc)
+        return date
+
+    def test_timestamps_spread_per_row(self):
+        start = timezone.now()
+        written = self.copy([
+            (pk, 1, f'Рецепт {pk}', 'Описание.', 10) for pk in range(20)])
+        dates = [self.parse(row['pub_date']) for row in written]
+        self.assertEqual(len(set(dates)), len(written))
+        for row, date in zip(written, dates):
+            self.assertEqual(self.parse(row['updated_at']), date)
+            self.assertLessEqual(date, timezone.now())
+            self.assertGreater(date, start - TIMESTAMP_WINDOW)
+        self.assertEqual({row['image_status'] for row in written},
+                         {Recipe.IMAGE_READY})
@@ -4,6 +4,10 @@ from django.db import models
 
 
 class User(AbstractUser):
+    # Поля, которые показываются в рецептах автора.
+    PUBLIC_FIELDS = frozenset(('email', 'username', 'first_name',
+                               'last_name'))
+
     username_validator = UnicodeUsernameValidator()
 
     username = models.CharField(
@@ -22,10 +26,21 @@ class User(AbstractUser):
                                  max_length=150, blank=False, null=False)
     email = models.EmailField('Почта', max_length=254, blank=False, null=False,
                               unique=True)
+    recipes_count = models.PositiveIntegerField('Рецептов', default=0,
+                                                editable=False)
+    followers_count = models.PositiveIntegerField('Подписчиков', default=0,
+                                                  editable=False)
+    updated_at = models.DateTimeField('Дата изменения', auto_now=True)
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('username',)
 
+    def save(self, *args, update_fields=None, **kwargs):
+        if update_fields is not None and self.PUBLIC_FIELDS.intersection(
+                update_fields):
+            update_fields = {*update_fields, 'updated_at'}
+        super().save(*args, update_fields=update_fields, **kwargs)
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -42,5 +57,9 @@ class Follow(models.Model):
     )
 
     class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'author'],
+                                    name='unique_follow'),
+        ]
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'